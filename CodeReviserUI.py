@@ -1,5 +1,4 @@
-from flask import Flask, render_template, request, send_file, abort, jsonify, redirect, url_for
-import gc
+from flask import Flask, render_template, request, send_file, abort, jsonify, redirect, url_for, make_response, Response, stream_with_context, stream_template
 from flask_login import UserMixin, current_user
 from multiprocessing import Array
 from urllib.error import HTTPError
@@ -10,6 +9,13 @@ from lib.config_manager import *
 from lib.job_manager import *
 from lib.app_utils import *
 from lib.custom_logger import *
+from lib.model_registry import model_registry
+from lib.model_downloader import model_downloader
+from lib.local_executor import health_status
+from lib.host_registry import host_registry
+from lib.log_tail import read_log_tail, wait_for_log_growth
+from lib.telemetry import STAGES, job_telemetry
+from lib.host_client import decode_request_payload, compress_response, format_sse_event
 from lib import revise_code
 
 app = Flask(__name__)
@@ -21,16 +27,20 @@ current_result = Array('c', b'\0' * 32768)
 # Load existing config or set defaults
 config = load_config()
 
-# Set defaults if not present in the config
-app.secret_key = get_config('secret_key', '')
-app.config['MODEL_FOLDER'] = get_config('model_folder', '')
-app.config['REVISIONS_DB'] = get_config('revisions_db', '')
-app.config['MODEL_URL'] = get_config('model_url', "")
-app.config['MODEL_FILENAME'] = get_config('model', "")
-app.config['MAX_CONTEXT'] = get_config('n_ctx', "")
-app.config['REVISIONS_PER_PAGE'] = get_config('revisions_per_page', "")
-app.config['SESSION_TYPE'] = get_config('session_type', '')
-app.config['MAX_FILE_SIZE'] = get_config('max_file_size', "")
+def apply_config():
+    # Set defaults if not present in the config
+    app.secret_key = get_config('secret_key', '')
+    app.config['MODEL_FOLDER'] = get_config('model_folder', '')
+    app.config['REVISIONS_DB'] = get_config('revisions_db', '')
+    app.config['MODEL_URL'] = get_config('model_url', "")
+    app.config['MODEL_FILENAME'] = get_config('model', "")
+    app.config['MAX_CONTEXT'] = get_config('n_ctx', "")
+    app.config['REVISIONS_PER_PAGE'] = get_config_int('revisions_per_page', 10)
+    app.config['FILES_PER_PAGE'] = get_config_int('files_per_page', 20)
+    app.config['SESSION_TYPE'] = get_config('session_type', '')
+    app.config['MAX_FILE_SIZE'] = get_config('max_file_size', "")
+
+apply_config()
 
 class User(UserMixin):
     def __init__(self, id, username):
@@ -40,13 +50,41 @@ class User(UserMixin):
 current_user = User(1, "developer")
 
 init_db(app.config['REVISIONS_DB'])  # Pass the database path
+init_job_db(get_config("job_db", "jobs.db"), get_config("job_file", ""))
 
 @app.route('/')
 def index():
     jobs = load_jobs()
-    all_revisions = get_revisions_with_max_rows(current_user.id, app.config['REVISIONS_DB'], max_rows=5)
-    all_revisions = tuple((revision[0], revision[1], quote_plus(revision[2]),revision[3]) for revision in all_revisions)
-    return render_template('index.html', jobs=jobs, revisions=all_revisions)
+    after_file = request.args.get('after_file')
+    all_revisions, next_file = get_revision_summaries(current_user.id, app.config['REVISIONS_DB'], 5, app.config['FILES_PER_PAGE'], after_file)
+    # The continue-revising form prefills the latest revision's instruction, so it needs it in full
+    latest_ids = {}
+    for revision in all_revisions:
+        latest_ids.setdefault(revision['filename'], revision['id'])
+    instructions = get_revision_instructions(current_user.id, app.config['REVISIONS_DB'], latest_ids.values())
+    all_revisions = tuple((revision['id'], revision, quote_plus(revision['filename'])) for revision in all_revisions)
+    model_missing = not os.path.isfile(app.config['MODEL_FOLDER'] + app.config['MODEL_FILENAME'])
+    return render_template('index.html', jobs=jobs, revisions=all_revisions, instructions=instructions, model_missing=model_missing,
+                           after_file=after_file, next_file=next_file)
+
+@app.template_filter('timestamp')
+def format_timestamp(value):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(value)) if value else ''
+
+@app.route('/api/revisions')
+def api_revisions():
+    per_page = max(app.config['REVISIONS_PER_PAGE'], 1)
+    limit = min(max(request.args.get('limit', per_page, type=int), 1), per_page * 10)
+    cursor = request.args.get('cursor', None, type=int)
+    revisions, next_cursor = get_revision_page(current_user.id, app.config['REVISIONS_DB'], limit, cursor, request.args.get('filename'))
+    for revision in revisions:
+        revision['save_url'] = url_for('save_latest_revision', filename=quote_plus(revision['filename']), revision_id=revision['id'])
+    return jsonify({'revisions': revisions, 'next_cursor': next_cursor})
+
+@app.route('/api/revisions/<int:revision_id>')
+def api_revision(revision_id):
+    filename, content, initial_instruction = get_revision_by_id(app.config['REVISIONS_DB'], revision_id, current_user.id)
+    return compress_response(request, jsonify({'id': revision_id, 'filename': filename, 'content': content, 'initial_instruction': initial_instruction}))
 
 @app.route('/edit_config')
 def edit_config():
@@ -57,6 +95,9 @@ def edit_config():
 def save_config():
   config = request.get_json()
   open('user_config.json', 'w').write(json.dumps(config['config'], indent=4))
+  invalidate_config()
+  apply_config()
+  model_registry.retain(app.config['MODEL_FILENAME'])
   return jsonify({'message': 'Config saved successfully.'})
 
 @app.route('/queue', methods=['POST'])
@@ -79,22 +120,166 @@ def queue():
 @app.route('/process_request', methods=['POST'])
 def process_request():
 
-    data = request.get_json() if request.is_json else request.form
+    data = decode_request_payload(request)
 
     prompt = data.get('prompt', '')
     file_contents = data.get('fileContents', '')
-
-    llm = load_model(app.config['MODEL_URL'], app.config['MODEL_FOLDER'], app.config['MODEL_FILENAME'], app.config['MAX_CONTEXT'], logger)
-    revision = revise_code.run(file_contents, llm, prompt, logger)
-
-    del llm
-    gc.collect()
-    time.sleep(10)
-    return revision
+    seed = data.get('seed')
+
+    if data.get('stream'):
+        return Response(stream_with_context(stream_revision(file_contents, prompt, seed)), mimetype='text/event-stream')
+
+    with model_registry.use(app.config['MODEL_URL'], app.config['MODEL_FOLDER'], app.config['MODEL_FILENAME'], app.config['MAX_CONTEXT']) as (llm, load_time):
+        start_time = time.time()
+        stream = revise_code.RevisionStream(file_contents, llm, prompt, logger, seed)
+        for _ in stream:
+            pass
+        inference_time = time.time() - start_time
+
+    logger.log(f"Model load time: {load_time:.2f}s, inference time: {inference_time:.2f}s")
+
+    response = make_response(stream.revision)
+    response.headers['X-Model-Load-Time'] = f"{load_time:.3f}"
+    response.headers['X-Inference-Time'] = f"{inference_time:.3f}"
+    response.headers['X-Revision-Stats'] = json.dumps(stream.stats)
+    return compress_response(request, response)
+
+@app.route('/tokenize', methods=['POST'])
+def tokenize():
+    # Only answers while the model is loaded; callers fall back to an estimate.
+    # Not 503, which the host client would retry with backoff.
+    llm = model_registry.loaded(app.config['MODEL_FILENAME'])
+    if llm is None:
+        return jsonify({'error': 'Model not loaded'}), 409
+
+    texts = decode_request_payload(request).get('texts', [])
+    counts = [len(llm.tokenize(text.encode('utf-8'), add_bos=False, special=True)) for text in texts]
+    return jsonify({'counts': counts, 'n_ctx': llm.n_ctx()})
+
+def stream_revision(file_contents, prompt, seed=None):
+    try:
+        with model_registry.use(app.config['MODEL_URL'], app.config['MODEL_FOLDER'], app.config['MODEL_FILENAME'], app.config['MAX_CONTEXT']) as (llm, load_time):
+            stream = revise_code.RevisionStream(file_contents, llm, prompt, logger, seed)
+            for text in stream:
+                yield format_sse_event('token', text)
+
+        stats = dict(stream.stats, model_load_time=load_time)
+        logger.log(f"Model load time: {load_time:.2f}s, inference time: {stats['duration']:.2f}s")
+        yield format_sse_event('done', {'revision': stream.revision, 'stats': stats})
+    except Exception as e:
+        logger.log(f"Streaming revision failed: {str(e)}", level=logging.ERROR)
+        yield format_sse_event('error', str(e))
+
+@app.route('/job/<int:job_id>/live', methods=['GET'])
+def job_live(job_id):
+    return render_template('job_live.html', job_id=job_id, progress=job_progress.get(job_id))
+
+@app.route('/job/<int:job_id>', methods=['GET'])
+def job_detail(job_id):
+    job_db = get_config("job_db", "jobs.db")
+    job = get_job(job_db, job_id)
+    if job is None:
+        abort(404, description="Job not found")
+    rounds = list_job_metrics(job_db, job_id)
+
+    # Mean time per stage across the recorded rounds, to show where the time goes
+    stage_means = {}
+    for stage in STAGES:
+        values = [metrics[stage] for metrics in rounds if metrics.get(stage) is not None]
+        if values:
+            stage_means[stage] = sum(values) / len(values)
+    return render_template('job_detail.html', job=job, rounds=rounds, stage_means=stage_means)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    job_counts = count_jobs_by_status(get_config("job_db", "jobs.db"))
+    return Response(job_telemetry.render(job_counts), mimetype='text/plain; version=0.0.4')
+
+@app.route('/job/<int:job_id>/stream', methods=['GET'])
+def job_stream(job_id):
+    job_db = get_config("job_db", "jobs.db")
+    if get_job(job_db, job_id) is None:
+        abort(404, description="Job not found")
+
+    def generate():
+        version = None
+        started_at = None
+        sent = 0
+        timeout = 0
+        while True:
+            progress = job_progress.wait(job_id, version, timeout=timeout)
+            timeout = 15
+            if progress is None or progress['version'] == version:
+                # Nothing new: stop once the job is over (its progress may have been pruned), else keep the connection open
+                job = get_job(job_db, job_id)
+                if job is None or job['status'] in ('FINISHED', 'ERROR'):
+                    yield format_sse_event('end', {'status': job['status'] if job else 'DELETED'})
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            version = progress['version']
+            # A new round, or a failover to another host, starts the text over
+            reset = progress['started_at'] != started_at and started_at is not None
+            if progress['started_at'] != started_at:
+                started_at = progress['started_at']
+                sent = 0
+            text = progress['text'][sent:]
+            sent = len(progress['text'])
+            elapsed = time.time() - progress['started_at']
+            yield format_sse_event('progress', {
+                'text': text,
+                'reset': reset,
+                'tokens': progress['tokens'],
+                'host': progress['host'],
+                'time_to_first_token': (progress['first_token_at'] - progress['started_at']) if progress['first_token_at'] else None,
+                'elapsed': elapsed
+            })
+            if progress['finished']:
+                yield format_sse_event('done', progress['stats'])
+                return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify(health_status())
+
+@app.route('/hosts', methods=['GET'])
+def hosts():
+    return jsonify(host_registry.status())
+
+@app.route('/models', methods=['GET'])
+def models():
+    return jsonify(model_registry.status())
+
+@app.route('/models/unload', methods=['POST'])
+def unload_models():
+    model_registry.unload(request.form.get('model') or None)
+    return jsonify({'message': 'Models unloaded.'})
+
+@app.route('/models/downloads', methods=['GET'])
+def model_downloads():
+    return jsonify(model_downloader.status())
+
+@app.route('/models/download', methods=['POST'])
+def download_model():
+    """Fetch the configured model in the background, so the first job does not wait for it."""
+    model_path = app.config['MODEL_FOLDER'] + app.config['MODEL_FILENAME']
+    if os.path.isfile(model_path):
+        return jsonify({'message': 'Model already downloaded.'})
+
+    def run():
+        try:
+            model_downloader.download(app.config['MODEL_URL'], model_path, get_config('model_sha256', ""), logger)
+        except Exception as e:
+            logger.log(f"Model download failed: {str(e)}", level=logging.ERROR)
+
+    Thread(target=run, name="model-download", daemon=True).start()
+    return jsonify({'message': 'Model download started.'}), 202
 
 @app.route('/start-batch', methods=['GET'])
 def start_batch():
-    start_batch_job(app.config['REVISIONS_DB'], app.config['MODEL_FOLDER'], app.config['MODEL_URL'], app.config['MODEL_FILENAME'], app.config['MAX_CONTEXT'], logger)
+    start_batch_job(app.config['REVISIONS_DB'], logger)
     return redirect(url_for('index'))
 
 @app.route('/clear_batch_job/<int:job_id>', methods=['POST'])
@@ -104,8 +289,8 @@ def clear_batch_job(job_id):
 
 @app.route('/reset_batch_job_status/<int:job_id>', methods=['POST'])
 def reset_batch_job_status(job_id):
-    batch_requests_file = get_config("job_file", "")
-    update_job_status(batch_requests_file, job_id, "NEW", clear_file_contents=False)
+    update_job_status(get_config("job_db", "jobs.db"), job_id, "NEW", clear_file_contents=False)
+    batch_dispatcher.notify()
     return redirect(url_for('index'))
 
 @app.route('/edit-revision/<string:filename>/<int:revision_id>', methods=['GET', 'POST'])
@@ -128,10 +313,10 @@ def edit_revision(filename, revision_id):
 def compare_revisions(filename, revision_id1):
     try:
         revision_id2 = get_prior_revision(current_user.id, app.config['REVISIONS_DB'], filename, revision_id1)
-        comparison_result = compare_two_revisions(app.config['REVISIONS_DB'], unquote_plus(filename), revision_id1, revision_id2, current_user.id, 10000)
-        return render_template('compare_revisions.html', filename=filename, revision_id1=revision_id1, revision_id2=revision_id2, comparison_result=comparison_result)
+        comparison_result = compare_two_revisions(app.config['REVISIONS_DB'], unquote_plus(filename), revision_id1, revision_id2, current_user.id, get_config_int('diff_context', 3))
+        return Response(stream_template('compare_revisions.html', filename=filename, revision_id1=revision_id1, revision_id2=revision_id2, comparison_result=comparison_result))
     except Exception as e:
-        logger.log(f"Error comparing revisions: {str(e)}")
+        logger.log(f"Error comparing revisions: {str(e)}", level=logging.ERROR)
         return redirect(url_for('index'))
 
 @app.route('/download/<string:filename>/<int:revision_id>', methods=['GET'])
@@ -156,9 +341,7 @@ def delete_revision(filename, revision_id):
 
 @app.route('/latest_revisions')
 def latest_revisions():
-    revisions = get_all_revisions(current_user.id, app.config['REVISIONS_DB'])
-    latest_revisions = [{'filename': revision[2], 'revision_id': revision[0], 'content': revision[1], 'initial_instruction': revision[3]} for revision in revisions]
-    return render_template('latest_revisions.html', revisions=latest_revisions)
+    return render_template('latest_revisions.html', per_page=app.config['REVISIONS_PER_PAGE'])
 
 @app.route('/save_latest_revision/<string:filename>/<int:revision_id>', methods=['POST'])
 def save_latest_revision(filename, revision_id):
@@ -175,6 +358,27 @@ def handle_model_not_found(e):
 def logfile():
     return send_file(logger.get_file_path(), as_attachment=True)
 
+@app.route('/logfile/tail')
+def logfile_tail():
+    file_path = logger.get_file_path()
+    file_name = os.path.basename(file_path)
+    offset = request.args.get('offset', None, type=int)
+    new_file = request.args.get('file', file_name) != file_name
+    if new_file:
+        # The day rolled over since the client's last read
+        offset = 0
+
+    max_bytes_cap = get_config_int('log_tail_max_bytes', 65536)
+    max_bytes = min(max(request.args.get('max_bytes', max_bytes_cap, type=int), 1), max_bytes_cap)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 25)
+    if offset is not None and wait and not new_file:
+        wait_for_log_growth(file_path, offset, wait)
+
+    result = read_log_tail(file_path, offset, max_bytes, request.args.get('level') or None, request.args.get('job_id', None, type=int))
+    result['file'] = file_name
+    result['reset'] = result['reset'] or new_file
+    return jsonify(result)
+
 @app.route('/logs')
 def logs():
     return render_template('logs.html')
@@ -193,7 +397,7 @@ if __name__ == '__main__':
     process_name, process_pid = find_process_by_port(port_number)
 
     if process_name and process_pid:
-        logger.log(f"App cannot start: Port {port_number} is being used by process '{process_name}' (PID: {process_pid})")
+        logger.log(f"App cannot start: Port {port_number} is being used by process '{process_name}' (PID: {process_pid})", level=logging.ERROR)
     else:
         app.run(host=get_config("host",""),port=get_config("port",""))
 
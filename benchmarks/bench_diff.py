@@ -0,0 +1,80 @@
+"""Revision comparison time, old unified_diff HTML builder vs the diff service.
+
+Generates a --file-bytes source file and a revision of it with --edits
+scattered line edits, then times building the full comparison page both
+ways, and a repeat comparison served from the diff cache.
+
+    python benchmarks/bench_diff.py --file-bytes 35000 --edits 40
+"""
+import argparse
+import difflib
+import os
+import random
+import statistics
+import sys
+import time
+
+from markupsafe import escape
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.diff_service import DiffService, iter_diff_html
+
+def make_revisions(file_bytes, edits):
+    random.seed(1)
+    lines = [f"    value_{i} = compute_{i % 17}(value_{i - 1}, {random.randrange(1000)})" for i in range(file_bytes // 48)]
+    lines += ["", "    return value", ""] * 20
+    revised = list(lines)
+    for number in range(edits):
+        index = random.randrange(len(revised))
+        if number % 3 == 0:
+            revised.insert(index, f"    # revised step {number}")
+        else:
+            revised[index] = f"    value_{index} = revised_{number}(value_{index - 1})"
+    return "\n".join(lines), "\n".join(revised)
+
+def legacy_diff_html(old_text, new_text):
+    diff = difflib.unified_diff(old_text.splitlines(), new_text.splitlines(), n=10000)
+    html_diff = '<html><head><style>pre { white-space: pre-wrap; }</style></head><body>'
+    html_diff += '<h2>Unified Diff</h2><pre>'
+    for line in diff:
+        if line.startswith('+'):
+            html_diff += '<span style="color: green;">{}</span><br>'.format(escape(line))
+        elif line.startswith('-'):
+            html_diff += '<span style="color: red;">{}</span><br>'.format(escape(line))
+        else:
+            html_diff += '{}<br>'.format(escape(line))
+    html_diff += '</pre></body></html>'
+    return html_diff
+
+def time_calls(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file-bytes", type=int, default=35000)
+    parser.add_argument("--edits", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    old_text, new_text = make_revisions(args.file_bytes, args.edits)
+
+    legacy = time_calls(lambda: legacy_diff_html(old_text, new_text), args.repeat)
+    print(f"unified_diff page:   {legacy * 1000:8.1f} ms, {len(legacy_diff_html(old_text, new_text)) / 1024:7.1f} KiB")
+
+    first_chunk = time_calls(lambda: next(iter_diff_html(old_text, new_text)), args.repeat)
+    service = time_calls(lambda: ''.join(iter_diff_html(old_text, new_text)), args.repeat)
+    print(f"diff service page:   {service * 1000:8.1f} ms, {len(''.join(iter_diff_html(old_text, new_text))) / 1024:7.1f} KiB, first chunk {first_chunk * 1000:.1f} ms")
+
+    diff_service = DiffService()
+    ''.join(diff_service.stream("key", lambda: (old_text, new_text)))
+    cached = time_calls(lambda: ''.join(diff_service.stream("key", lambda: (old_text, new_text))), args.repeat)
+    print(f"diff service cached: {cached * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
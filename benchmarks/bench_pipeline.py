@@ -0,0 +1,166 @@
+"""End-to-end throughput of the batch pipeline with a fake model.
+
+Queues --scales jobs through add_job, runs process_batch, and lets the
+dispatcher send every round over HTTP to /process_request on a local
+server, which generates with benchmarks/fake_llama.py and stores the
+result with save_revision. Each scale runs in a fresh process and scratch
+directory, so databases, caches and the dispatcher start cold.
+
+Reports jobs per minute, p50/p99 job latency (queued to finished), the
+time add_job takes per job, and how much of each round went to database
+reads and writes. With --local the dispatcher runs every round in-process
+through the "local" host instead, to compare against the HTTP hop.
+
+    python benchmarks/bench_pipeline.py --scales 10,100,1000
+    python benchmarks/bench_pipeline.py --scales 100 --local
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+def make_code(file_bytes):
+    lines = []
+    index = 0
+    while sum(len(line) for line in lines) < file_bytes:
+        lines.append(f"def step_{index}(value):\n    return value * {index % 7 + 1} + {index}\n\n")
+        index += 1
+    return ''.join(lines)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def database_kib(path):
+    # Recent writes may still sit in the write-ahead log
+    return sum(os.path.getsize(name) for name in (path, path + '-wal') if os.path.exists(name)) / 1024
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def write_config(args, port):
+    with open(os.path.join(REPO_DIR, 'config.json')) as config_file:
+        config = json.load(config_file)
+    config.update({
+        'port': str(port),
+        'host_instances': str(["local" if args.local else f"127.0.0.1:{port}"]),
+        'host_concurrency': args.concurrency,
+        'stream_revisions': args.stream,
+        'prompt_cache_bytes': (2 << 30) if args.prompt_cache else 0,
+        'model_folder': 'models/',
+        'log_folder': 'logs/',
+        'revisions_db': 'revisions.db',
+        'job_db': 'jobs.db',
+        'job_file': ''
+    })
+    with open('config.json', 'w') as config_file:
+        json.dump(config, config_file, indent=2)
+    os.makedirs('models', exist_ok=True)
+    open(os.path.join('models', config['model']), 'wb').close()
+
+def run_scale(args):
+    """Run one scale inside the current (scratch) directory and print a JSON result."""
+    port = free_port()
+    write_config(args, port)
+
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCHMARK_DIR)
+    import fake_llama
+    fake_llama.install(args.prompt_rate, args.token_rate)
+
+    import CodeReviserUI as ui
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', port, ui.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    code = make_code(args.file_bytes).encode('utf-8')
+    revisions_db = ui.app.config['REVISIONS_DB']
+
+    start = time.perf_counter()
+    for index in range(args.jobs):
+        ui.add_job(ui.app.config['MAX_FILE_SIZE'], f"file_{index}.py", code, ui.app.config['MODEL_FOLDER'],
+                   revisions_db, ui.current_user, args.rounds, "Revise this python code.")
+    enqueue_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ui.process_batch(revisions_db, ui.logger)
+    batch_time = time.perf_counter() - start
+    server.shutdown()
+
+    conn = sqlite3.connect('jobs.db')
+    jobs = conn.execute("SELECT status, updated_at - created_at FROM jobs").fetchall()
+    rounds = conn.execute("SELECT prompt_build_time, db_write_time, total_time FROM job_metrics WHERE outcome = 'completed'").fetchall()
+    conn.close()
+
+    latencies = [latency for status, latency in jobs if status == 'FINISHED']
+    round_total = sum(row[2] for row in rounds) or 1.0
+    db_time = sum((row[0] or 0) + (row[1] or 0) for row in rounds)
+    print(json.dumps({
+        'jobs': args.jobs,
+        'finished': len(latencies),
+        'errors': sum(1 for status, _ in jobs if status == 'ERROR'),
+        'batch_seconds': batch_time,
+        'jobs_per_minute': len(latencies) / batch_time * 60 if batch_time else 0.0,
+        'p50_latency': percentile(latencies, 0.50),
+        'p99_latency': percentile(latencies, 0.99),
+        'enqueue_ms_per_job': enqueue_time / args.jobs * 1000,
+        'db_ms_per_round': db_time / max(len(rounds), 1) * 1000,
+        'db_share': db_time / round_total,
+        'revisions_db_kib': database_kib('revisions.db'),
+        'jobs_db_kib': database_kib('jobs.db')
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10,100,1000", help="comma separated numbers of queued jobs")
+    parser.add_argument("--rounds", type=int, default=1, help="revision rounds per job")
+    parser.add_argument("--file-bytes", type=int, default=800)
+    parser.add_argument("--prompt-rate", type=float, default=20000, help="fake prompt evaluation tokens/sec")
+    parser.add_argument("--token-rate", type=float, default=5000, help="fake generation tokens/sec")
+    parser.add_argument("--concurrency", type=int, default=1, help="host_concurrency for the dispatcher")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True, help="stream revisions from the host")
+    parser.add_argument("--prompt-cache", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--local", action="store_true", help="run rounds in-process instead of over HTTP")
+    parser.add_argument("--verbose", action="store_true", help="show the application log")
+    parser.add_argument("--jobs", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.jobs is not None:
+        run_scale(args)
+        return
+
+    print(f"{'jobs':>6} {'done':>6} {'err':>4} {'jobs/min':>9} {'p50 s':>8} {'p99 s':>8} {'enqueue ms':>11} {'db ms/round':>12} {'db share':>9} {'revisions KiB':>14}")
+    for scale in [int(value) for value in args.scales.split(',')]:
+        command = [sys.executable, os.path.abspath(__file__), "--jobs", str(scale),
+                   "--rounds", str(args.rounds), "--file-bytes", str(args.file_bytes),
+                   "--prompt-rate", str(args.prompt_rate), "--token-rate", str(args.token_rate),
+                   "--concurrency", str(args.concurrency),
+                   "--stream" if args.stream else "--no-stream",
+                   "--prompt-cache" if args.prompt_cache else "--no-prompt-cache"] + (["--local"] if args.local else [])
+        with tempfile.TemporaryDirectory() as work_dir:
+            completed = subprocess.run(command, cwd=work_dir, stdout=subprocess.PIPE, text=True,
+                                       stderr=None if args.verbose else subprocess.DEVNULL)
+        if completed.returncode != 0 or not completed.stdout.strip():
+            print(f"{scale:>6} failed (exit code {completed.returncode}); rerun with --verbose")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{result['jobs']:>6} {result['finished']:>6} {result['errors']:>4} {result['jobs_per_minute']:>9.1f} "
+              f"{result['p50_latency']:>8.2f} {result['p99_latency']:>8.2f} {result['enqueue_ms_per_job']:>11.2f} "
+              f"{result['db_ms_per_round']:>12.2f} {result['db_share']:>9.1%} {result['revisions_db_kib']:>14.1f}")
+
+if __name__ == "__main__":
+    main()
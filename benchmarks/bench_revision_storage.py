@@ -0,0 +1,85 @@
+"""On-disk size of revision history, inline text vs compressed blobs.
+
+Simulates --rounds revisions of one --file-bytes source file where each
+round edits a few lines, the way a multi-round job rewrites a file. The
+same history is written to a database with the old inline layout and
+through RevisionRepository, then both are vacuumed and compared.
+
+    python benchmarks/bench_revision_storage.py --rounds 200
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.revision_store import RevisionRepository
+
+def make_history(rounds, file_bytes, edits_per_round):
+    random.seed(1)
+    lines = [f"    value_{i} = compute_{i % 17}(value_{i - 1}, {random.randrange(1000)})\n" for i in range(file_bytes // 48)]
+    history = []
+    for round_number in range(rounds):
+        for _ in range(edits_per_round):
+            index = random.randrange(len(lines))
+            lines[index] = f"    value_{index} = revised_{round_number}(value_{index - 1})\n"
+        history.append("".join(lines))
+    return history
+
+def vacuumed_size(database):
+    conn = sqlite3.connect(database)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(database)
+
+def write_legacy(database, history):
+    conn = sqlite3.connect(database)
+    conn.execute('''CREATE TABLE IF NOT EXISTS revisions (id INTEGER PRIMARY KEY AUTOINCREMENT, file_name TEXT, revision TEXT, user_id INT, initial_instruction TEXT)''')
+    with conn:
+        for text in history:
+            conn.execute("INSERT INTO revisions (file_name, revision, user_id, initial_instruction) VALUES (?, ?, ?, ?)", ("main.py", text, 1, "Revise this file"))
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--file-bytes", type=int, default=35000)
+    parser.add_argument("--edits-per-round", type=int, default=3)
+    parser.add_argument("--snapshot-interval", type=int, default=10)
+    args = parser.parse_args()
+
+    history = make_history(args.rounds, args.file_bytes, args.edits_per_round)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        legacy_db = os.path.join(temp_dir, "legacy.db")
+        write_legacy(legacy_db, history)
+        legacy_size = vacuumed_size(legacy_db)
+        print(f"inline text:       {legacy_size / 1024:10.1f} KiB")
+
+        for label, delta_enabled in (("zlib snapshots:", False), ("zlib + deltas:", True)):
+            blob_db = os.path.join(temp_dir, f"blobs_{delta_enabled}.db")
+            repository = RevisionRepository(blob_db, delta_enabled=delta_enabled, snapshot_interval=args.snapshot_interval)
+            start = time.perf_counter()
+            ids = [repository.save("main.py", 1, text, "Revise this file") for text in history]
+            write_time = time.perf_counter() - start
+
+            # Fresh repository so reads rebuild from disk instead of the write cache
+            repository.close()
+            repository = RevisionRepository(blob_db, delta_enabled=delta_enabled, snapshot_interval=args.snapshot_interval)
+            start = time.perf_counter()
+            for revision_id, text in zip(ids, history):
+                assert repository.get("main.py", revision_id, 1)[0] == text
+            read_time = time.perf_counter() - start
+            repository.close()
+
+            size = vacuumed_size(blob_db)
+            print(f"{label:18} {size / 1024:10.1f} KiB ({legacy_size / size:5.1f}x smaller), "
+                  f"save {write_time / len(history) * 1000:.2f} ms, get {read_time / len(history) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Index page query latency on a large revisions table.
+
+Fills a scratch database with --revisions rows spread over --files files,
+then times the dashboard query the way the old helpers ran it (new
+connection per call, no indexes) and through RevisionRepository (pooled
+connection, indexes, WAL).
+
+    python benchmarks/bench_revision_store.py --revisions 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.revision_store import RevisionRepository
+
+LEGACY_QUERY = """
+    SELECT id, revision, file_name, initial_instruction
+    FROM (
+        SELECT id, revision, file_name, initial_instruction,
+               ROW_NUMBER() OVER (PARTITION BY file_name ORDER BY id DESC) AS row_num
+        FROM revisions
+        WHERE user_id=?
+    ) ranked_revisions
+    WHERE row_num <= ?
+    ORDER BY file_name, id DESC
+    """
+
+def populate(revisions_db, revisions, files, body_bytes):
+    conn = sqlite3.connect(revisions_db)
+    conn.execute('''CREATE TABLE IF NOT EXISTS revisions (id INTEGER PRIMARY KEY AUTOINCREMENT, file_name TEXT, revision TEXT, user_id INT, initial_instruction TEXT)''')
+    random.seed(1)
+    body = "x" * body_bytes
+    rows = ((f"file_{random.randrange(files)}.py", body, 1, "Revise this file") for _ in range(revisions))
+    with conn:
+        conn.executemany("INSERT INTO revisions (file_name, revision, user_id, initial_instruction) VALUES (?, ?, ?, ?)", rows)
+    conn.close()
+
+def time_calls(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), max(timings)
+
+def legacy_index_query(revisions_db, max_rows):
+    conn = sqlite3.connect(revisions_db)
+    rows = conn.execute(LEGACY_QUERY, ('1', max_rows)).fetchall()
+    conn.close()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--revisions", type=int, default=100000)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--body-bytes", type=int, default=512)
+    parser.add_argument("--max-rows", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        revisions_db = os.path.join(temp_dir, "revisions.db")
+
+        start = time.perf_counter()
+        populate(revisions_db, args.revisions, args.files, args.body_bytes)
+        print(f"Populated {args.revisions} revisions over {args.files} files in {time.perf_counter() - start:.1f}s")
+
+        median, worst = time_calls(lambda: legacy_index_query(revisions_db, args.max_rows), args.repeat)
+        print(f"legacy     index query: median {median * 1000:8.1f} ms, max {worst * 1000:8.1f} ms")
+
+        start = time.perf_counter()
+        repository = RevisionRepository(revisions_db)
+        print(f"Migration took {time.perf_counter() - start:.1f}s")
+
+        median, worst = time_calls(lambda: repository.latest_per_file(1, args.max_rows), args.repeat)
+        print(f"repository index query: median {median * 1000:8.1f} ms, max {worst * 1000:8.1f} ms")
+
+        median, worst = time_calls(lambda: repository.latest("file_1.py", 1), args.repeat)
+        print(f"repository latest():    median {median * 1000:8.1f} ms, max {worst * 1000:8.1f} ms")
+
+        repository.close()
+
+if __name__ == "__main__":
+    main()
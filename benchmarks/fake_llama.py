@@ -0,0 +1,152 @@
+"""Deterministic stand-in for llama_cpp used by the benchmarks.
+
+FakeLlama "evaluates" the prompt at --prompt-rate tokens per second and
+"generates" at --token-rate tokens per second. Its answer is the code
+block from the prompt with one line appended, wrapped in a markdown fence,
+so revisions pass the length checks and grow a little every round.
+Tokens are 4-byte chunks of the UTF-8 text.
+
+install(prompt_rate, token_rate) registers it as the llama_cpp module; call
+it before importing anything from lib.
+"""
+import sys
+import time
+import types
+from collections import OrderedDict
+
+TOKEN_BYTES = 4
+
+class _TokenList(list):
+    def tolist(self):
+        return list(self)
+
+class FakeLlamaState:
+    def __init__(self, input_ids):
+        self.input_ids = _TokenList(input_ids)
+        self.llama_state_size = len(input_ids) * 64
+
+class FakeLlamaRAMCache:
+    """Same lookup semantics as LlamaRAMCache: longest cached token prefix wins."""
+
+    def __init__(self, capacity_bytes=(2 << 30)):
+        self.capacity_bytes = capacity_bytes
+        self.cache_state = OrderedDict()
+
+    @property
+    def cache_size(self):
+        return sum(state.llama_state_size for state in self.cache_state.values())
+
+    def _find_longest_prefix_key(self, key):
+        best_length, best_key = 0, None
+        for cached_key in self.cache_state:
+            length = FakeLlama.longest_token_prefix(cached_key, key)
+            if length > best_length:
+                best_length, best_key = length, cached_key
+        return best_key
+
+    def __getitem__(self, key):
+        cached_key = self._find_longest_prefix_key(tuple(key))
+        if cached_key is None:
+            raise KeyError("Key not found")
+        self.cache_state.move_to_end(cached_key)
+        return self.cache_state[cached_key]
+
+    def __contains__(self, key):
+        return self._find_longest_prefix_key(tuple(key)) is not None
+
+    def __setitem__(self, key, value):
+        key = tuple(key)
+        self.cache_state.pop(key, None)
+        self.cache_state[key] = value
+        while self.cache_size > self.capacity_bytes and len(self.cache_state) > 0:
+            self.cache_state.popitem(last=False)
+
+class FakeLlama:
+    prompt_rate = 20000.0
+    token_rate = 2000.0
+
+    def __init__(self, model_path=None, n_ctx=32768, **kwargs):
+        self.model_path = model_path
+        self._n_ctx = n_ctx
+        self.cache = None
+        self._ids = []
+
+    @property
+    def _input_ids(self):
+        return _TokenList(self._ids)
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def set_cache(self, cache):
+        self.cache = cache
+
+    def save_state(self):
+        return FakeLlamaState(self._ids)
+
+    def load_state(self, state):
+        self._ids = list(state.input_ids)
+
+    @staticmethod
+    def longest_token_prefix(a, b):
+        length = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            length += 1
+        return length
+
+    def tokenize(self, text, add_bos=True, special=False):
+        tokens = [int.from_bytes(text[i:i + TOKEN_BYTES], 'little') for i in range(0, len(text), TOKEN_BYTES)]
+        return ([1] if add_bos else []) + tokens
+
+    def _evaluate_prompt(self, prompt):
+        tokens = self.tokenize(prompt.encode('utf-8'), special=True)
+        if self.cache is not None:
+            try:
+                state = self.cache[tokens]
+                if self.longest_token_prefix(state.input_ids, tokens) > self.longest_token_prefix(self._ids, tokens):
+                    self.load_state(state)
+            except KeyError:
+                pass
+        reused = self.longest_token_prefix(self._ids, tokens)
+        time.sleep((len(tokens) - reused) / self.prompt_rate)
+        self._ids = list(tokens)
+
+    def _answer(self, prompt):
+        code = prompt.split('```\n', 1)[1].split('\n```', 1)[0] if '```\n' in prompt else ''
+        text = f"Here is the revision:\n```python\n{code}\n# revised\n```\nThis revision adds a comment.\n"
+        return [text[i:i + TOKEN_BYTES] for i in range(0, len(text), TOKEN_BYTES)]
+
+    def create_completion(self, prompt, max_tokens=16, stream=False, **kwargs):
+        self._evaluate_prompt(prompt)
+        pieces = self._answer(prompt)[:max_tokens]
+
+        def generate():
+            next_token_at = time.perf_counter()
+            for piece in pieces:
+                next_token_at += 1 / self.token_rate
+                delay = next_token_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self._ids.append(0)
+                yield {'choices': [{'text': piece, 'finish_reason': None}]}
+            if self.cache is not None:
+                self.cache[self._ids] = self.save_state()
+
+        if stream:
+            return generate()
+        return {'choices': [{'text': ''.join(generate()), 'finish_reason': 'stop'}]}
+
+def install(prompt_rate=None, token_rate=None):
+    """Register this module as llama_cpp so lib imports the fake model."""
+    if prompt_rate:
+        FakeLlama.prompt_rate = float(prompt_rate)
+    if token_rate:
+        FakeLlama.token_rate = float(token_rate)
+    module = types.ModuleType('llama_cpp')
+    module.Llama = FakeLlama
+    module.LlamaRAMCache = FakeLlamaRAMCache
+    module.LlamaState = FakeLlamaState
+    sys.modules['llama_cpp'] = module
+    return module
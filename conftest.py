@@ -0,0 +1,23 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
+
+from lib import config_manager
+
+# Tests read the shipped config.json, but the user config that load_config
+# writes and the log files go to a scratch directory instead of the checkout.
+# This runs before the test modules are imported, and some of them create
+# their logger at import time.
+_scratch = tempfile.mkdtemp(prefix="codereviser-tests-")
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+
+with open(config_manager.config_file, 'r') as default_file:
+    _user_config = json.load(default_file)
+_user_config['log_folder'] = os.path.join(_scratch, "logs", "")
+
+config_manager.user_config_file = os.path.join(_scratch, "user_config.json")
+with open(config_manager.user_config_file, 'w') as user_file:
+    json.dump(_user_config, user_file, indent=2)
+config_manager.invalidate_config()
@@ -1,17 +1,16 @@
 import os
-import sqlite3
-import requests
 import tempfile
 from flask import abort
 import psutil
-import difflib
-from markupsafe import escape
 
 from llama_cpp import Llama
 
 from lib.config_manager import *
 from lib.job_manager import *
 from lib.custom_logger import *
+from lib.revision_store import get_revision_repository
+from lib.diff_service import diff_service
+from lib.model_downloader import model_downloader
 
 import sys, os
 
@@ -28,50 +27,17 @@ def find_process_by_port(port):
     return None, None
 
 def init_db(revisions_db):
-    conn = sqlite3.connect(revisions_db)
-    c = conn.cursor()
-    # Create table for revisions if it doesn't exist, with columns: id, file_name, revision, user_id
-    c.execute('''CREATE TABLE IF NOT EXISTS revisions (id INTEGER PRIMARY KEY AUTOINCREMENT, file_name TEXT, revision TEXT, user_id INT, initial_instruction TEXT)''')  # Add user_id column for authentication
-    conn.commit()
-    conn.close()
+    get_revision_repository(revisions_db)
     
 def get_latest_revision(filename, user_id, revisions_db, count=2):
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("SELECT revision, initial_instruction FROM revisions WHERE file_name=? AND user_id=? ORDER BY id DESC LIMIT ?", (filename, user_id, count))
-    revision = c.fetchone()
-    conn.close()
-
-    if revision:
-        return revision
-    else:
-        return None
+    return get_revision_repository(revisions_db).latest(filename, user_id)
     
 def save_revision(revisions_db, filename, user_id, revision, initial_instruction):
     """Save a new revision of the given file in the SQLite database."""
-    conn = sqlite3.connect(revisions_db)
-    c = conn.cursor()
-
-    # Insert a new revision into the revisions table
-    c.execute("INSERT INTO revisions (file_name, revision, user_id, initial_instruction) VALUES (?, ?, ?, ?)", (filename, revision, user_id, initial_instruction))
-    conn.commit()
-
-    # Close the connection to the database
-    conn.close()
-
-def load_model(model_url, model_folder, model_filename, max_context, logger):
-
-    model_path = model_folder + model_filename
-
-    if not os.path.isfile(model_path):
-        try:
-            response = requests.get(model_url)
-            with open(model_path, 'wb') as model_file:
-                model_file.write(response.content)
-        except Exception as e:
-            logger.log("Failed to download or save the model:", str(e))
-            return None
+    return get_revision_repository(revisions_db).save(filename, user_id, revision, initial_instruction)
 
+def get_llama_params(max_context):
+    """Return the llama.cpp parameters for the current configuration."""
     # Define default llama.cpp parameters
     default_llama_params = {
         "n_threads": 0,
@@ -90,126 +56,103 @@ def load_model(model_url, model_folder, model_filename, max_context, logger):
     }
 
     # Update llama_params with values from config or use defaults
-    llama_params = {key: get_config(key, default_value) for key, default_value in default_llama_params.items()}
+    return {key: get_config(key, default_value) for key, default_value in default_llama_params.items()}
+
+def load_model(model_url, model_folder, model_filename, max_context, logger):
+
+    model_path = model_folder + model_filename
+
+    if not os.path.isfile(model_path):
+        try:
+            model_downloader.download(model_url, model_path, get_config('model_sha256', ""), logger)
+        except Exception as e:
+            logger.log("Failed to download or save the model:", str(e), level=logging.ERROR)
+            return None
+
+    llama_params = get_llama_params(max_context)
 
     try:
         return Llama(model_path, **llama_params)
     except Exception as e:
-        logger.log("Failed to create Llama object:", str(e))
+        logger.log("Failed to create Llama object:", str(e), level=logging.ERROR)
         return None
 
-# Helper function to connect to the revisions database
-def connect_db(revisions_db):
-    return sqlite3.connect(revisions_db)
-
-def get_revisions_with_max_rows(user_id, revisions_db, max_rows):
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, revision, file_name, initial_instruction
-        FROM (
-            SELECT id, revision, file_name, initial_instruction,
-                   ROW_NUMBER() OVER (PARTITION BY file_name ORDER BY id DESC) AS row_num
-            FROM revisions
-            WHERE user_id=?
-        ) ranked_revisions
-        WHERE row_num <= ?
-        ORDER BY file_name, id DESC
-        """, (str(user_id), max_rows))
-    revisions = c.fetchall()
-    conn.close()
-    return revisions
-
-def get_all_revisions(user_id, revisions_db):
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("SELECT id, revision, file_name, initial_instruction FROM revisions WHERE user_id=? ORDER BY id desc", (str(user_id)))
-    revisions = c.fetchall()
-    conn.close()
-    return revisions
+def get_revision_summaries(user_id, revisions_db, max_rows, files_per_page, after_file=None):
+    """Newest revisions of one page of files as metadata only (no revision bodies).
+
+    Returns (summaries, next_file): files come in name order, and next_file
+    is the after_file for the following page, or None on the last one.
+    """
+    summaries = get_revision_repository(revisions_db).latest_summaries_per_file(
+        user_id, max_rows, file_limit=files_per_page + 1, after_file=after_file)
+    filenames = list(dict.fromkeys(summary['filename'] for summary in summaries))
+    if len(filenames) <= files_per_page:
+        return summaries, None
+    return [summary for summary in summaries if summary['filename'] != filenames[-1]], filenames[-2]
+
+def get_revision_instructions(user_id, revisions_db, revision_ids):
+    """Full initial instructions for the given revision ids."""
+    return get_revision_repository(revisions_db).instructions(revision_ids, user_id)
+
+def get_revision_page(user_id, revisions_db, limit, cursor=None, filename=None):
+    """One page of revision metadata, newest first, and the cursor for the next page."""
+    return get_revision_repository(revisions_db).page(user_id, limit, before_id=cursor, filename=filename)
+
+def get_revision_by_id(revisions_db, revision_id, user_id):
+    """Retrieve (filename, content, initial_instruction) for a revision id."""
+    revision = get_revision_repository(revisions_db).get_by_id(revision_id, user_id)
+    if not revision:
+        abort(404, description="Revision not found")
+    return revision
 
 # Helper function to get revisions for a given user
 def get_prior_revision(user_id, revisions_db, filename, revision_id1):
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("SELECT id, revision, file_name, initial_instruction FROM revisions WHERE user_id=? AND file_name=? AND id < ? ORDER BY id desc", (str(user_id), filename, revision_id1))
-    revision = c.fetchone()[0]
-    conn.close()
-    return revision
+    return get_revision_repository(revisions_db).prior_id(user_id, filename, revision_id1)
 
 # Helper function to download a specific revision
 def download_revision_file(revisions_db, filename, revision_id, user_id):
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("SELECT revision FROM revisions WHERE id=? AND file_name=? AND user_id=?", (revision_id, filename, user_id))
-    revision = c.fetchone()[0]
-    conn.close()
+    revision = get_revision_repository(revisions_db).get(filename, revision_id, user_id)
 
     if not revision:
         abort(404, description="Revision not found")
 
     temp_file = tempfile.TemporaryFile()
-    temp_file.write(revision.encode())
+    temp_file.write(revision[0].encode())
     temp_file.seek(0)
     return temp_file
 
 # Helper function to delete a specific revision
 def delete_revision_file(revisions_db, filename, revision_id, user_id):
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("DELETE FROM revisions WHERE id=? AND file_name=? AND user_id=?", (revision_id, filename, user_id))
-    conn.commit()
-    conn.close()
+    get_revision_repository(revisions_db).delete(filename, revision_id, user_id)
     return {'status': 'success', 'message': 'Revision deleted.'}
 
 def update_revision_content(revisions_db, filename, revision_id, user_id, new_content, new_instruction):
     """Update the content of a specific revision in the SQLite database."""
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("UPDATE revisions SET revision=?, initial_instruction=? WHERE id=? AND file_name=? AND user_id=?", (new_content, new_instruction, revision_id, filename, user_id))
-    conn.commit()
-    conn.close()
+    get_revision_repository(revisions_db).update(filename, revision_id, user_id, new_content, new_instruction)
 
 def get_revision_content(revisions_db, filename, revision_id, user_id):
     """Retrieve the content of a specific revision from the SQLite database."""
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("SELECT revision, initial_instruction FROM revisions WHERE id=? AND file_name=? AND user_id=?", (revision_id, filename, user_id))
-    revision_content, initial_instruction = c.fetchone()
-    conn.close()
+    revision = get_revision_repository(revisions_db).get(filename, revision_id, user_id)
+    if not revision:
+        abort(404, description="Revision not found")
+    revision_content, initial_instruction = revision
     return revision_content, initial_instruction if revision_content else None
 
 def get_revision_content_bytes(revisions_db, filename, revision_id, user_id):
     """Retrieve the content of a specific revision from the SQLite database as bytes."""
-    conn = connect_db(revisions_db)
-    c = conn.cursor()
-    c.execute("SELECT revision FROM revisions WHERE id=? AND file_name=? AND user_id=?", (revision_id, filename, user_id))
-    revision_content = c.fetchone()
-    conn.close()
-    return revision_content[0].encode() if revision_content else None
+    revision = get_revision_repository(revisions_db).get(filename, revision_id, user_id)
+    return revision[0].encode() if revision else None
 
 def compare_two_revisions(revisions_db, filename, revision_id1, revision_id2, user_id, context):
-    """Compare two revisions using the unified_diff and generate basic HTML representation."""
-    content1 = get_revision_content(revisions_db, filename, revision_id1, user_id)
-    content2 = get_revision_content(revisions_db, filename, revision_id2, user_id)
-
-    # Check if there are no differences between the two revisions
-    if content1[0] == content2[0]:
-        return "No differences found between the two revisions."
-
-    # Generate the unified diff with a larger context to show the whole file
-    diff = difflib.unified_diff(content2[0].splitlines(), content1[0].splitlines(), n=context)
-
-    # Create a basic HTML representation of the unified diff
-    html_diff = '<html><head><style>pre { white-space: pre-wrap; }</style></head><body>'
-    html_diff += '<h2>Unified Diff</h2><pre>'
-    for line in diff:
-        if line.startswith('+'):
-            html_diff += '<span style="color: green;">{}</span><br>'.format(escape(line))
-        elif line.startswith('-'):
-            html_diff += '<span style="color: red;">{}</span><br>'.format(escape(line))
-        else:
-            html_diff += '{}<br>'.format(escape(line))
-    html_diff += '</pre></body></html>'
-
-    return html_diff
+    """Stream an HTML diff from revision_id2 to revision_id1, reusing cached diffs."""
+    repository = get_revision_repository(revisions_db)
+    new_hash = repository.get_content_hash(filename, revision_id1, user_id)
+    old_hash = repository.get_content_hash(filename, revision_id2, user_id)
+    if new_hash is None or old_hash is None:
+        abort(404, description="Revision not found")
+
+    def load_texts():
+        return (get_revision_content(revisions_db, filename, revision_id2, user_id)[0],
+                get_revision_content(revisions_db, filename, revision_id1, user_id)[0])
+
+    return diff_service.stream((old_hash, new_hash, context), load_texts, context)
@@ -0,0 +1,47 @@
+import random
+
+from lib.config_manager import get_config
+from lib.diff_service import diff_opcodes
+from lib.linter import Linter
+
+# Penalties per unit; the candidate with the lowest total wins
+DEFAULT_WEIGHTS = {
+    'lint_errors': 10.0,    # per lint problem
+    'length_ratio': 5.0,    # per 100% the length differs from the original
+    'diff_size': 1.0,       # per changed line, relative to the original's line count
+    'unchanged': 1000.0     # no revision (rejected for its length, or identical)
+}
+
+class Candidate:
+    def __init__(self, revision, stats):
+        self.revision = revision
+        self.stats = stats
+        self.diagnostics = []
+        self.diff_size = 0.0
+        self.unchanged = False
+        self.score = None
+
+def candidate_seeds(count):
+    """Distinct sampling seeds, so candidates for the same prompt differ."""
+    return random.sample(range(1, 2 ** 31), count)
+
+def score_candidates(original, candidates, language, logger):
+    """Lint every candidate and score it against the original code (lower is better)."""
+    weights = dict(DEFAULT_WEIGHTS, **get_config("candidate_weights", {}))
+    original_lines = original.splitlines()
+    for candidate in candidates:
+        # revise_code hands back the original when the output is too short or too long
+        candidate.unchanged = candidate.revision == original
+        candidate.diagnostics = Linter(candidate.revision, language, logger).lint()
+        changed = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in diff_opcodes(original_lines, candidate.revision.splitlines()) if tag != 'equal')
+        candidate.diff_size = changed / max(len(original_lines), 1)
+        length_ratio = len(candidate.revision) / max(len(original), 1)
+        candidate.score = (weights['lint_errors'] * len(candidate.diagnostics) +
+                           weights['length_ratio'] * abs(length_ratio - 1) +
+                           weights['diff_size'] * candidate.diff_size +
+                           (weights['unchanged'] if candidate.unchanged else 0))
+    return candidates
+
+def pick_best(candidates):
+    """The lowest scoring candidate; the earliest one wins ties."""
+    return min(candidates, key=lambda candidate: candidate.score)
@@ -0,0 +1,103 @@
+import ast
+import re
+import textwrap
+
+# Deepest nesting level still used as a split point
+MAX_BOUNDARY_DEPTH = 2
+
+def _python_boundaries(code, lines):
+    """Map line index -> nesting depth for lines that start a top-level statement or a class/function member."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return _indent_boundaries(lines)
+
+    boundaries = {}
+
+    def add(nodes, depth):
+        previous_end = None
+        for node in nodes:
+            start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', [])]) - 1
+            # Comments and blank lines in front of a statement stay with it
+            boundaries[start if previous_end is None else previous_end] = depth
+            previous_end = node.end_lineno
+            if depth < MAX_BOUNDARY_DEPTH - 1 and isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                add(node.body, depth + 1)
+
+    add(tree.body, 0)
+    return boundaries
+
+def _indent_boundaries(lines):
+    boundaries = {}
+    for index, line in enumerate(lines):
+        if line.strip() and (index == 0 or not lines[index - 1].strip()):
+            depth = (len(line) - len(line.lstrip())) // 4
+            if depth <= MAX_BOUNDARY_DEPTH:
+                boundaries[index] = depth
+    return boundaries
+
+_STRINGS_AND_COMMENTS = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`|//.*$')
+
+def _brace_boundaries(lines):
+    """Split points for brace languages: lines after a closed block or statement, by brace depth."""
+    boundaries = {}
+    depth = 0
+    for index, line in enumerate(lines):
+        previous = lines[index - 1].strip() if index > 0 else ''
+        starts_statement = line.strip() and not line.strip().startswith(('}', ')', ']', '.'))
+        if starts_statement and depth <= MAX_BOUNDARY_DEPTH and (index == 0 or previous == '' or previous.endswith(('}', ';'))):
+            boundaries[index] = depth
+        code = _STRINGS_AND_COMMENTS.sub('', line)
+        depth = max(depth + code.count('{') - code.count('}'), 0)
+    return boundaries
+
+def split_code(code, language, max_chars):
+    """Split code into (start, end) line-index ranges of at most about max_chars each.
+
+    Ranges end on syntax boundaries where possible: top-level functions and
+    classes (then their members) for Python, closed blocks for brace
+    languages. A single unit larger than max_chars is cut between lines.
+    """
+    lines = code.splitlines(keepends=True)
+    if language == "python":
+        boundaries = _python_boundaries(code, lines)
+    elif language in ("javascript", "csharp"):
+        boundaries = _brace_boundaries(lines)
+    else:
+        boundaries = _indent_boundaries(lines)
+
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end = start
+        size = 0
+        while end < len(lines) and (end == start or size + len(lines[end]) <= max_chars):
+            size += len(lines[end])
+            end += 1
+
+        if end < len(lines):
+            candidates = [index for index in boundaries if start < index <= end]
+            # Prefer the shallowest split point, but not one that leaves a tiny chunk
+            late = [index for index in candidates if index >= start + (end - start) // 2]
+            candidates = late or candidates
+            if candidates:
+                depth = min(boundaries[index] for index in candidates)
+                end = max(index for index in candidates if boundaries[index] == depth)
+
+        if chunks and not ''.join(lines[start:end]).strip():
+            # Nothing to revise on its own; keep blank lines with the code before them
+            chunks[-1] = (chunks[-1][0], end)
+        else:
+            chunks.append((start, end))
+        start = end
+    return chunks
+
+def chunk_parses(code, language):
+    """Whether a Python chunk parses on its own (dedented); None for languages that cannot be checked."""
+    if language != "python":
+        return None
+    try:
+        ast.parse(textwrap.dedent(code))
+        return True
+    except SyntaxError:
+        return False
@@ -1,62 +1,126 @@
+import ast
 import json
 import os
 import shutil
+import time
+from threading import RLock
 from lib.custom_logger import *
 
-def load_config():
-   config_file = "config.json"
-   user_config_file = "user_config.json"
+config_file = "config.json"
+user_config_file = "user_config.json"
+
+# How often (in seconds) the config files are stat'ed for changes
+config_check_interval = 1.0
 
+_config_cache = {'config': None, 'mtimes': None, 'checked_at': 0.0}
+_config_lock = RLock()
+
+def load_config():
    if not os.path.isfile(user_config_file):
        shutil.copy(config_file, user_config_file)
 
    with open(user_config_file, 'r') as user_file:
        user_config = json.load(user_file)
 
-   with open(config_file, 'r') as config_file:
-       config = json.load(config_file)
+   with open(config_file, 'r') as default_file:
+       config = json.load(default_file)
 
-       # Merge the user configuration with the main configuration
-       config = {**config, **user_config}
+   missing_keys = set(config.keys()) - set(user_config.keys())
 
-       missing_keys = set(config.keys()) - set(user_config.keys())
+   # Carry new default keys over into the user configuration
+   if missing_keys:
+       for key in missing_keys:
+           user_config[key] = config[key]
 
-       if missing_keys:
-           raise Exception(f"Missing keys in user_config.json: {missing_keys}")
+       with open(user_config_file, 'w') as user_file:
+           json.dump(user_config, user_file, indent=2)
 
-           for key in missing_keys:
-               user_config[key] = config[key]
-
-           with open(user_config_file, 'w') as user_file:
-               json.dump(user_config, user_file, indent=2)
-
-       return user_config
+   return user_config
 
 def is_numeric(value):
    return isinstance(value, (int, float)) and (isinstance(value, float) or str(value).replace('.', '', 1).isdigit())
 
+def _coerce(value):
+   # Check if the value is numeric and cast it to the appropriate type
+   if is_numeric(value):
+       return int(value) if float(value).is_integer() else float(value)
+   return value
+
+def _get_mtimes():
+   return tuple(os.path.getmtime(path) if os.path.isfile(path) else None for path in (config_file, user_config_file))
+
+def get_config_snapshot():
+   """Return the cached configuration, re-reading it only when a config file changed."""
+   with _config_lock:
+       now = time.monotonic()
+       if _config_cache['config'] is not None and now - _config_cache['checked_at'] < config_check_interval:
+           return _config_cache['config']
+
+       mtimes = _get_mtimes()
+       if _config_cache['config'] is None or mtimes != _config_cache['mtimes']:
+           config = load_config()
+           _config_cache['config'] = {key: _coerce(value) for key, value in config.items()}
+           # load_config may have written the user config, so stat again
+           _config_cache['mtimes'] = _get_mtimes()
+
+       _config_cache['checked_at'] = now
+       return _config_cache['config']
+
+def invalidate_config():
+   """Drop the cached configuration so the next lookup re-reads the files."""
+   with _config_lock:
+       _config_cache['config'] = None
+
 def get_config(key, default=None):
-   config = load_config()
+   config = get_config_snapshot()
 
    if key not in config:
-       config[key] = default
        update_config(key, default)
-       load_config()  # reload the config after updating it
-
-   # Check if the value is numeric and cast it to the appropriate type
-   if is_numeric(config[key]):
-       config[key] = int(config[key]) if float(config[key]).is_integer() else float(config[key])
+       config = get_config_snapshot()
 
    return config.get(key, default)
 
+def get_config_int(key, default=0):
+   value = get_config(key, default)
+   try:
+       return int(value)
+   except (TypeError, ValueError):
+       return default
+
+def get_config_float(key, default=0.0):
+   value = get_config(key, default)
+   try:
+       return float(value)
+   except (TypeError, ValueError):
+       return default
+
+def get_config_bool(key, default=False):
+   value = get_config(key, default)
+   if isinstance(value, str):
+       return value.strip().lower() in ('1', 'true', 'yes', 'on')
+   return bool(value)
+
+def get_config_str(key, default=""):
+   value = get_config(key, default)
+   return default if value is None else str(value)
+
+def get_config_list(key, default=None):
+   """Return a list setting, accepting either a JSON list or its string form (e.g. host_instances)."""
+   value = get_config(key, default if default is not None else [])
+   if isinstance(value, str):
+       try:
+           value = ast.literal_eval(value) if value.strip() else []
+       except (ValueError, SyntaxError):
+           value = [item.strip() for item in value.split(',') if item.strip()]
+   return list(value) if value is not None else []
+
 def update_config(key, value):
-   config = load_config()
+   with _config_lock:
+       config = load_config()
 
-   # Cast the value to the appropriate type if it is numeric
-   if is_numeric(value):
-       value = int(value) if float(value).is_integer() else float(value)
+       config[key] = _coerce(value)
 
-   config[key] = value
+       with open(user_config_file, 'w') as file:
+           json.dump(config, file, indent=2)
 
-   with open(user_config_file, 'w') as file:
-       json.dump(config, file, indent=2)
\ No newline at end of file
+       invalidate_config()
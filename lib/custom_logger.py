@@ -1,44 +1,86 @@
+import atexit
 import time
 import datetime
 import os
 import logging
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener
+
+def _log_file_path(log_folder):
+    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    return os.path.join(log_folder, f"log_{current_date}.txt")
+
+class DailyFileHandler(logging.FileHandler):
+    """File handler writing to log_<date>.txt, switching files when the date changes."""
+
+    def __init__(self, log_folder):
+        self.log_folder = log_folder
+        os.makedirs(log_folder, exist_ok=True)
+        super().__init__(_log_file_path(log_folder), delay=True)
+
+    def emit(self, record):
+        file_path = os.path.abspath(_log_file_path(self.log_folder))
+        if file_path != self.baseFilename:
+            os.makedirs(self.log_folder, exist_ok=True)
+            self.close()
+            self.baseFilename = file_path
+        super().emit(record)
 
 class CustomLogger:
+    """Process-wide logger writing to the console and a daily log file.
+
+    Records go through a queue to a background listener, so callers never
+    wait on disk. Handlers are built once per process; a forked child
+    builds its own the first time it logs.
+    """
     _instance = None
 
     def __init__(self, log_folder):
         if not CustomLogger._instance:
-            CustomLogger._instance = self            
-            self.log_folder = log_folder     
-            
+            CustomLogger._instance = self
+            self.log_folder = log_folder
+            self.file_path = _log_file_path(log_folder)
+
             self.logger = logging.getLogger("CodeRevisorUI")
             self.logger.setLevel(logging.INFO)
+            self._pid = None
+            self._listener = None
+            self._start()
+            atexit.register(self._stop)
 
-    def log(self, message):
-        self._instance.logger.handlers.clear()
-        
-        # Create the logs folder if it doesn't exist
-        os.makedirs(self._instance.log_folder, exist_ok=True)              
-        
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        self._instance.file_path = os.path.join(self._instance.log_folder, f"log_{current_date}.txt")
-
+    def _start(self):
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(formatter)
-        self._instance.logger.addHandler(console_handler)
 
-        file_handler = logging.FileHandler(self._instance.file_path)
+        file_handler = DailyFileHandler(self.log_folder)
         file_handler.setLevel(logging.INFO)
         file_handler.setFormatter(formatter)
-        self._instance.logger.addHandler(file_handler)       
-        
-        self._instance.logger.info('{} - {}'.format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), message))
+
+        log_queue = SimpleQueue()
+        self.logger.handlers.clear()
+        self.logger.addHandler(QueueHandler(log_queue))
+        self._listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+        self._listener.start()
+        self._pid = os.getpid()
+
+    def _stop(self):
+        # Flushes whatever is still queued before the process exits
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+
+    def log(self, message, *details, level=logging.INFO):
+        instance = self._instance
+        if instance._pid != os.getpid():
+            # Forked child: the listener thread did not survive the fork
+            instance._start()
+
+        if details:
+            message = ' '.join([str(message)] + [str(detail) for detail in details])
+        instance.logger.log(level, '{} - {}'.format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), message))
 
     def get_file_path(self):
-        
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        self._instance.file_path = os.path.join(self._instance.log_folder, f"log_{current_date}.txt")
-        
-        return self._instance.file_path
\ No newline at end of file
+        self._instance.file_path = _log_file_path(self._instance.log_folder)
+        return self._instance.file_path
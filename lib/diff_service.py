@@ -0,0 +1,200 @@
+import difflib
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from markupsafe import escape
+
+from lib.config_manager import get_config_int
+
+def _intern_lines(old_lines, new_lines):
+    """Map every distinct line to an int so the diff compares ints, not strings."""
+    ids = {}
+    return ([ids.setdefault(line, len(ids)) for line in old_lines],
+            [ids.setdefault(line, len(ids)) for line in new_lines])
+
+def _unique_anchors(a, alo, ahi, b, blo, bhi):
+    """Lines occurring exactly once on both sides, as the longest run in order on both."""
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        if entry is None:
+            counts[a[i]] = [1, i, 0, -1]
+        else:
+            entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[2] += 1
+            entry[3] = j
+    pairs = sorted((entry[1], entry[3]) for entry in counts.values() if entry[0] == 1 and entry[2] == 1)
+
+    # Patience sorting: longest increasing subsequence of j over pairs ordered by i
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(pairs)
+    for index, (i, j) in enumerate(pairs):
+        position = bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[position] = j
+            tail_indexes[position] = index
+        previous[index] = tail_indexes[position - 1] if position > 0 else None
+
+    anchors = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+def _matching_lines(a, b):
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if not anchors:
+            # No unique lines to anchor on; these gaps are small in practice
+            matcher = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks():
+                matches.extend((alo + i + k, blo + j + k) for k in range(size))
+            continue
+
+        for i, j in anchors:
+            matches.append((i, j))
+            regions.append((alo, i, blo, j))
+            alo, blo = i + 1, j + 1
+        regions.append((alo, ahi, blo, bhi))
+
+    matches.sort()
+    return matches
+
+def diff_opcodes(old_lines, new_lines):
+    """Patience diff of two line lists, returned as difflib-style opcodes."""
+    a, b = _intern_lines(old_lines, new_lines)
+    opcodes = []
+    i = j = 0
+    for match_i, match_j in _matching_lines(a, b) + [(len(a), len(b))]:
+        if i < match_i or j < match_j:
+            tag = 'replace' if i < match_i and j < match_j else ('delete' if i < match_i else 'insert')
+            opcodes.append((tag, i, match_i, j, match_j))
+        if match_i < len(a):
+            if opcodes and opcodes[-1][0] == 'equal' and opcodes[-1][2] == match_i:
+                opcodes[-1] = ('equal', opcodes[-1][1], match_i + 1, opcodes[-1][3], match_j + 1)
+            else:
+                opcodes.append(('equal', match_i, match_i + 1, match_j, match_j + 1))
+        i, j = match_i + 1, match_j + 1
+    return opcodes
+
+def _lines_html(lines, prefix, color=None):
+    if color:
+        return ''.join(f'<span style="color: {color};">{prefix}{escape(line)}</span>\n' for line in lines)
+    return ''.join(f'{prefix}{escape(line)}\n' for line in lines)
+
+def iter_diff_html(old_text, new_text, context=3, chunk_size=65536):
+    """Yield the HTML for a diff of two texts in chunks of about chunk_size characters.
+
+    Unchanged runs longer than the surrounding context are wrapped in a
+    <details> element so they stay collapsed until expanded.
+    """
+    if old_text == new_text:
+        yield "No differences found between the two revisions."
+        return
+
+    old_lines = old_text.splitlines()
+    new_lines = new_text.splitlines()
+    opcodes = diff_opcodes(old_lines, new_lines)
+
+    buffer = ['<pre class="diff-lines">']
+    size = 0
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == 'equal':
+            head = 0 if index == 0 else context
+            tail = 0 if index == len(opcodes) - 1 else context
+            if i2 - i1 > head + tail + 1:
+                hidden = i2 - i1 - head - tail
+                pieces = [
+                    _lines_html(old_lines[i1:i1 + head], ' '),
+                    f'</pre><details class="diff-collapsed"><summary>{hidden} unchanged lines</summary><pre class="diff-lines">',
+                    _lines_html(old_lines[i1 + head:i2 - tail], ' '),
+                    '</pre></details><pre class="diff-lines">',
+                    _lines_html(old_lines[i2 - tail:i2], ' ')
+                ]
+            else:
+                pieces = [_lines_html(old_lines[i1:i2], ' ')]
+        else:
+            pieces = [_lines_html(old_lines[i1:i2], '-', 'red'), _lines_html(new_lines[j1:j2], '+', 'green')]
+
+        buffer.extend(pieces)
+        size += sum(len(piece) for piece in pieces)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+
+    buffer.append('</pre>')
+    yield ''.join(buffer)
+
+class DiffService:
+    """Streams revision diffs and keeps recent ones, bounded by diff_cache_bytes.
+
+    Entries are keyed by the content hashes of both sides, so a revision
+    edited in place never serves a stale diff.
+    """
+
+    def __init__(self):
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            chunks = self._cache.get(key)
+            if chunks is not None:
+                self._cache.move_to_end(key)
+            return chunks
+
+    def _put(self, key, chunks):
+        capacity = get_config_int("diff_cache_bytes", 32 << 20)
+        size = sum(len(chunk) for chunk in chunks)
+        if size > capacity:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = chunks
+            self._cache_bytes += size
+            while self._cache_bytes > capacity:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= sum(len(chunk) for chunk in evicted)
+
+    def stream(self, key, load_texts, context=3):
+        """Yield HTML chunks for key, calling load_texts() -> (old, new) only on a cache miss."""
+        chunks = self._get(key)
+        if chunks is not None:
+            yield from chunks
+            return
+
+        chunks = []
+        old_text, new_text = load_texts()
+        for chunk in iter_diff_html(old_text, new_text, context):
+            chunks.append(chunk)
+            yield chunk
+        self._put(key, chunks)
+
+diff_service = DiffService()
@@ -0,0 +1,195 @@
+import gzip
+import json
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from lib.config_manager import get_config_int, get_config_float
+
+class HostRequestError(Exception):
+    def __init__(self, host, status_code, message=""):
+        super().__init__(f"Host {host} returned {status_code}: {message}")
+        self.host = host
+        self.status_code = status_code
+
+class HostClient:
+    """Keep-alive HTTP client for one entry of host_instances.
+
+    Connections are pooled per host and reused across jobs; the pool keeps
+    one connection per slot the host reports, plus one for health checks.
+    Request bodies are sent as JSON and gzip-compressed once they pass
+    host_compress_min_bytes.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.base_url = f'http://{host}'
+
+        # Connection failures are retried for every request, since nothing
+        # reached the host. Gateway errors are retried for GETs only: a POST
+        # that timed out behind a proxy may still be generating, and a busy
+        # host's 503 is for the dispatcher to fail over, not to wait out here.
+        retries = get_config_int("host_retries", 2)
+        self._retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            backoff_factor=get_config_float("host_retry_backoff", 0.5),
+            raise_on_status=False
+        )
+        self.session = requests.Session()
+        self.pool_size = None
+        self.resize_pool(get_config_int("host_concurrency", 1))
+
+    def resize_pool(self, slots):
+        """Keep as many connections as the host has slots; called when its /health reports a new count."""
+        pool_size = max(slots, 1) + 1
+        if pool_size == self.pool_size:
+            return
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=self._retry)
+        old_adapter = self.session.adapters.get('http://')
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool_size = pool_size
+        if old_adapter is not None:
+            # Requests still running on the old pool finish; their connections are closed afterwards
+            old_adapter.close()
+
+    def _timeout(self):
+        return (get_config_float("host_connect_timeout", 5), get_config_float("host_read_timeout", 1800))
+
+    def _encode(self, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if len(body) >= get_config_int("host_compress_min_bytes", 1024):
+            body = gzip.compress(body, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+
+    def post(self, path, payload):
+        body, headers = self._encode(payload)
+        return self.session.post(f'{self.base_url}{path}', data=body, headers=headers, timeout=self._timeout())
+
+    def get(self, path, **kwargs):
+        return self.session.get(f'{self.base_url}{path}', timeout=self._timeout(), **kwargs)
+
+    def post_revision(self, prompt, file_contents, seed=None):
+        payload = {'prompt': prompt, 'fileContents': file_contents}
+        if seed is not None:
+            payload['seed'] = seed
+        return self.post('/process_request', payload)
+
+    def revise(self, prompt, file_contents, on_token=None, seed=None):
+        """Run a revision on the host and return (revision, stats).
+
+        With on_token the host streams its output as server-sent events and
+        on_token is called with every piece of text as it arrives. A seed
+        makes the host sample with that seed instead of its own.
+        """
+        if on_token is None:
+            response = self.post_revision(prompt, file_contents, seed)
+            if response.status_code != 200:
+                raise HostRequestError(self.host, response.status_code, response.text[:200])
+            stats = json.loads(response.headers.get('X-Revision-Stats', '{}'))
+            stats['model_load_time'] = float(response.headers.get('X-Model-Load-Time', 0))
+            stats['inference_time'] = float(response.headers.get('X-Inference-Time', 0))
+            return response.content.decode(), stats
+
+        payload = {'prompt': prompt, 'fileContents': file_contents, 'stream': True}
+        if seed is not None:
+            payload['seed'] = seed
+        body, headers = self._encode(payload)
+        headers['Accept'] = 'text/event-stream'
+        with self.session.post(f'{self.base_url}/process_request', data=body, headers=headers, timeout=self._timeout(), stream=True) as response:
+            if response.status_code != 200:
+                raise HostRequestError(self.host, response.status_code, response.text[:200])
+
+            for event, data in iter_sse_events(response):
+                if event == 'token':
+                    on_token(data)
+                elif event == 'done':
+                    return data['revision'], data['stats']
+                elif event == 'error':
+                    raise HostRequestError(self.host, 500, data)
+
+        raise HostRequestError(self.host, 502, "stream ended without a result")
+
+    def health(self):
+        response = self.session.get(f'{self.base_url}/health', timeout=(get_config_float("host_connect_timeout", 5), get_config_float("host_health_timeout", 3)))
+        response.raise_for_status()
+        return response.json()
+
+    def tokenize(self, texts):
+        """Count the tokens of each text with the host's loaded model; returns (counts, n_ctx)."""
+        response = self.post('/tokenize', {'texts': texts})
+        if response.status_code != 200:
+            raise HostRequestError(self.host, response.status_code, response.text[:200])
+        data = response.json()
+        return data['counts'], data['n_ctx']
+
+    def close(self):
+        self.session.close()
+
+def iter_sse_events(response):
+    """Yield (event, data) pairs from a server-sent event stream of JSON data lines."""
+    event = 'message'
+    data_lines = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == '':
+            if data_lines:
+                yield event, json.loads('\n'.join(data_lines))
+            event = 'message'
+            data_lines = []
+        elif line.startswith(':'):
+            continue
+        elif line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data_lines.append(line[len('data:'):].lstrip())
+
+def format_sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+_host_clients = {}
+_host_clients_lock = Lock()
+
+def get_host_client(host):
+    """Return the shared client for a host, creating it on first use.
+
+    The "local" host is this process, served by LocalExecutor.
+    """
+    with _host_clients_lock:
+        client = _host_clients.get(host)
+        if client is None:
+            if host == "local":
+                # Imported here: it loads llama_cpp, which remote-only callers do not need
+                from lib.local_executor import LocalExecutor
+                client = LocalExecutor()
+            else:
+                client = HostClient(host)
+            _host_clients[host] = client
+        return client
+
+def decode_request_payload(flask_request):
+    """Read a /process_request style payload sent as gzip JSON, JSON or form data."""
+    if flask_request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        return json.loads(gzip.decompress(flask_request.get_data()).decode('utf-8'))
+    if flask_request.is_json:
+        return flask_request.get_json()
+    return flask_request.form
+
+def compress_response(flask_request, response):
+    """Gzip a text response when the client accepts it and it is large enough."""
+    accepts_gzip = 'gzip' in flask_request.headers.get('Accept-Encoding', '').lower()
+    if accepts_gzip and response.content_length and response.content_length >= get_config_int("host_compress_min_bytes", 1024):
+        response.set_data(gzip.compress(response.get_data(), compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,207 @@
+import logging
+import time
+from threading import Condition, Thread
+
+import requests
+
+from lib.config_manager import get_config_int, get_config_float, get_config_list
+from lib.host_client import get_host_client
+
+class HostState:
+    def __init__(self, host):
+        self.host = host
+        self.outstanding = 0
+        self.outstanding_work = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.health = None
+        self.checked_at = None
+        self.completed = 0
+
+class HostRegistry:
+    """Tracks the hosts in host_instances and decides which one runs the next request.
+
+    Every host has a number of slots (what its /health reports, else
+    host_concurrency). A request goes to the healthy host with a free slot
+    and the least outstanding work per unit of capacity, counting the work
+    in characters of code. Hosts that keep failing are ejected for a while,
+    longer each time, and come back once their health check passes.
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._hosts = {}
+        self._poller = None
+        self._logger = None
+        self._listeners = []
+
+    def _states(self):
+        hosts = get_config_list("host_instances")
+        for host in hosts:
+            if host not in self._hosts:
+                self._hosts[host] = HostState(host)
+        for host in list(self._hosts):
+            if host not in hosts and self._hosts[host].outstanding == 0:
+                del self._hosts[host]
+        return [self._hosts[host] for host in hosts]
+
+    def _capacity(self, state):
+        slots = (state.health or {}).get('slots')
+        return max(int(slots or get_config_int("host_concurrency", 1)), 1)
+
+    def total_slots(self):
+        with self._condition:
+            return sum(self._capacity(state) for state in self._states())
+
+    def _score(self, state, size):
+        health = state.health or {}
+        weight = max(float(health.get('weight') or 1.0), 0.01)
+        # Ties go to a host that already has the model loaded
+        return ((state.outstanding_work + size) / (self._capacity(state) * weight), not health.get('model_loaded'), state.outstanding)
+
+    def _pick(self, size, exclude):
+        now = time.time()
+        candidates = [state for state in self._states()
+                      if state.host not in exclude and state.ejected_until <= now and state.outstanding < self._capacity(state)]
+        if not candidates:
+            return None
+        state = min(candidates, key=lambda candidate: self._score(candidate, size))
+        state.outstanding += 1
+        state.outstanding_work += size
+        return state.host
+
+    def try_acquire(self, size=0, exclude=()):
+        """Reserve a slot on the best host right now, or return None."""
+        with self._condition:
+            return self._pick(size, exclude)
+
+    def acquire(self, size=0, exclude=(), timeout=None):
+        """Reserve a slot on the best host, waiting up to timeout seconds (forever with None) for one."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while True:
+                host = self._pick(size, exclude)
+                if host is not None:
+                    return host
+                if deadline is not None and time.time() >= deadline:
+                    return None
+                # Ejections run out without anyone notifying, so look again every second
+                self._condition.wait(timeout=1.0 if deadline is None else min(max(deadline - time.time(), 0), 1.0))
+
+    def wait_for_capacity(self, timeout):
+        """Wait until some host has a free slot; returns False on timeout."""
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                now = time.time()
+                if any(state.ejected_until <= now and state.outstanding < self._capacity(state) for state in self._states()):
+                    return True
+                if now >= deadline:
+                    return False
+                self._condition.wait(timeout=min(deadline - now, 1.0))
+
+    def release(self, host, size=0):
+        with self._condition:
+            state = self._hosts.get(host)
+            if state is not None:
+                state.outstanding = max(state.outstanding - 1, 0)
+                state.outstanding_work = max(state.outstanding_work - size, 0)
+                state.completed += 1
+            self._condition.notify_all()
+
+    def report_success(self, host):
+        with self._condition:
+            state = self._hosts.get(host)
+            if state is not None:
+                state.failures = 0
+
+    def report_failure(self, host, reason=""):
+        """Count a failure against a host, ejecting it once host_eject_failures are in a row."""
+        with self._condition:
+            state = self._hosts.get(host)
+            if state is None:
+                return
+            state.failures += 1
+            threshold = max(get_config_int("host_eject_failures", 3), 1)
+            if state.failures >= threshold:
+                seconds = min(get_config_float("host_eject_seconds", 30) * 2 ** (state.failures - threshold),
+                              get_config_float("host_eject_max_seconds", 600))
+                state.ejected_until = time.time() + seconds
+                self._log(f"Host {host} ejected for {seconds:.0f}s after {state.failures} failures: {reason}", logging.WARNING)
+            self._condition.notify_all()
+
+    def on_capacity_change(self, callback):
+        """Call callback() whenever a health check changes total_slots()."""
+        with self._condition:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def check_health(self):
+        """Poll /health on every host once."""
+        with self._condition:
+            hosts = [state.host for state in self._states()]
+            slots = sum(self._capacity(state) for state in self._states())
+
+        for host in hosts:
+            client = get_host_client(host)
+            try:
+                health = client.health()
+            except (requests.RequestException, ValueError) as e:
+                self.report_failure(host, f"health check failed: {str(e)}")
+                continue
+
+            with self._condition:
+                state = self._hosts.get(host)
+                if state is None:
+                    continue
+                if state.ejected_until > time.time():
+                    self._log(f"Host {host} is healthy again, readmitting it")
+                state.health = health
+                state.checked_at = time.time()
+                state.failures = 0
+                state.ejected_until = 0.0
+                capacity = self._capacity(state)
+                self._condition.notify_all()
+            client.resize_pool(capacity)
+
+        with self._condition:
+            changed = sum(self._capacity(state) for state in self._states()) != slots
+            listeners = list(self._listeners)
+        if changed:
+            for callback in listeners:
+                callback()
+
+    def _poll(self):
+        while True:
+            self.check_health()
+            time.sleep(max(get_config_float("host_health_interval", 10), 1))
+
+    def start(self, logger):
+        """Start the background health checks (once per process)."""
+        with self._condition:
+            self._logger = logger
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = Thread(target=self._poll, name="host-health", daemon=True)
+                self._poller.start()
+
+    def _log(self, message, level=logging.INFO):
+        if self._logger is not None:
+            self._logger.log(message, level=level)
+
+    def status(self):
+        now = time.time()
+        with self._condition:
+            return [{
+                'host': state.host,
+                'available': state.ejected_until <= now,
+                'ejected_for': max(state.ejected_until - now, 0),
+                'slots': self._capacity(state),
+                'outstanding': state.outstanding,
+                'outstanding_work': state.outstanding_work,
+                'failures': state.failures,
+                'completed': state.completed,
+                'checked_at': state.checked_at,
+                'health': state.health
+            } for state in self._states()]
+
+host_registry = HostRegistry()
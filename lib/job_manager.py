@@ -1,76 +1,153 @@
 import os
 import json
 import time
-import base64
-from multiprocessing import Process, Queue
+import socket
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from queue import SimpleQueue
+from threading import Condition, Thread
 from flask import abort
-from lib.config_manager import load_config, get_config
+from lib.config_manager import load_config, get_config, get_config_int, get_config_float, get_config_bool, get_config_list
 from lib.app_utils import *
 import ast
-from threading import Lock
 from lib.revise_code import *
 from lib.linter import Linter
+from lib.lint_backends import SYNTAX_ERROR_CODES, deduplicate
+from lib.prompt_builder import PromptBuilder
+from lib.chunker import chunk_parses
+from lib.candidates import Candidate, candidate_seeds, pick_best, score_candidates
+from lib.job_store import *
+from lib.host_client import get_host_client, HostRequestError
+from lib.host_registry import host_registry
+from lib.job_progress import JobProgressBoard
+from lib.telemetry import JobTimings, job_telemetry
 from lib.custom_logger import *
 
 
 def load_jobs():
-    jobs = []
-
-    try:
-        job_file = get_config("job_file", "")
-
-        with open(job_file, 'r') as json_file:
-            data = json.load(json_file)
-
-        for request_data in data:
-            jobs.append({
-                'job_id': request_data['job_id'],
-                'filename': request_data['filename'],
-                'status': request_data['status'],
-                'rounds': request_data['rounds'],
-                'prompt': request_data['prompt']
-            })
-    except FileNotFoundError:
-        # Handle if the file is not found (initial case)
-        pass
-
-    # Define a custom sorting order for statuses
-    status_order = {'NEW': 0, 'STARTED': 1, 'FINISHED': 2, 'ERROR': 3}
-
-    # Sort the list of dictionaries based on the custom sorting order and 'rounds'
-    sorted_jobs = sorted(jobs, key=lambda x: (status_order[x['status']], x['rounds']))
-
-    return sorted_jobs
-
-# Create a lock
-update_job_status_lock = Lock()
+    job_db = get_config("job_db", "jobs.db")
+    return list_jobs(job_db)
+
+def update_job_status(job_db, job_id, status, rounds=None, clear_file_contents=False, file_size=None):
+    set_job_status(job_db, job_id, status, rounds=rounds, clear_file_contents=clear_file_contents, file_size=file_size)
+
+# Identifies this process's claims in the job store, which other processes may share
+JOB_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+class BatchDispatcher:
+    """Runs queued jobs on a pool of worker threads, one per host slot.
+
+    There are as many workers as the hosts in host_instances have slots
+    together. A worker claims the next NEW job once some host has a free
+    slot, and then asks host_registry for the best host for that job.
+    Idle workers sleep on a condition that add_job signals, so new work is
+    picked up immediately instead of on the next polling pass.
+
+    Claimed jobs carry this process's JOB_OWNER and a heartbeat that a
+    background thread keeps fresh. Jobs whose heartbeat goes stale belonged
+    to a process that died, and are put back in the queue.
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._generation = 0
+        self._workers = {}
+        self._heartbeat = None
+        self._revisions_db = None
+        self._logger = None
+
+    def start(self, revisions_db, logger):
+        with self._condition:
+            if not self._workers:
+                # Nothing runs here yet, so this process's STARTED jobs were orphaned by a previous run
+                requeue_started_jobs(get_config("job_db", "jobs.db"), stale_after=get_config_float("job_stale_after", 120), owner=JOB_OWNER)
+            if self._heartbeat is None:
+                self._heartbeat = Thread(target=self._run_heartbeat, name="batch-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+            self._revisions_db = revisions_db
+            self._logger = logger
+            # Slots reported by /health arrive after the first poll; add workers for them then
+            host_registry.on_capacity_change(self._resize)
+            host_registry.start(logger)
+            self._resize()
+
+    def _resize(self):
+        """Start a worker for every host slot that has none (workers for removed slots stop on their own)."""
+        with self._condition:
+            if self._revisions_db is None:
+                return
+            for index in range(host_registry.total_slots()):
+                worker = self._workers.get(index)
+                if worker is None or not worker.is_alive():
+                    worker = Thread(target=self._run_worker, args=(index,), name=f"batch-{index}", daemon=True)
+                    self._workers[index] = worker
+                    worker.start()
+
+            self._generation += 1
+            self._condition.notify_all()
+
+    def notify(self):
+        """Wake idle workers because new work was queued."""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def _run_heartbeat(self):
+        job_db = get_config("job_db", "jobs.db")
+        while True:
+            time.sleep(get_config_float("job_heartbeat_interval", 30))
+            try:
+                touch_jobs(job_db, JOB_OWNER)
+                if requeue_started_jobs(job_db, stale_after=get_config_float("job_stale_after", 120)):
+                    self._logger.log("Requeued jobs whose process stopped sending heartbeats", level=logging.WARNING)
+                    self.notify()
+            except sqlite3.Error as e:
+                self._logger.log(f"Job heartbeat failed: {str(e)}", level=logging.ERROR)
+
+    def is_running(self):
+        with self._condition:
+            return any(worker.is_alive() for worker in self._workers.values())
+
+    def _run_worker(self, index):
+        job_db = get_config("job_db", "jobs.db")
+        poll_interval = get_config_float("dispatcher_poll_interval", 5)
+
+        while index < host_registry.total_slots():
+            with self._condition:
+                seen_generation = self._generation
+
+            if not host_registry.wait_for_capacity(poll_interval):
+                continue
 
-def update_job_status(job_file, job_id, status, rounds=None, clear_file_contents=False):
-    with update_job_status_lock:
-        existing_contents = []
-        if os.path.exists(job_file):
-            with open(job_file, 'r') as existing_file:
-                existing_contents = json.load(existing_file)
+            job_data = claim_next_job(job_db, JOB_OWNER)
+            if job_data is None:
+                with self._condition:
+                    # The timeout only matters for jobs queued by another process
+                    self._condition.wait_for(lambda: self._generation != seen_generation, timeout=poll_interval)
+                continue
 
-        for job in existing_contents:
-            if job.get('job_id') == job_id:
-                job['status'] = status
-                if rounds is not None:
-                    job['rounds'] = rounds
-                if clear_file_contents is True:
-                    job['file_contents'] = None
-                    job['prompt'] = None
-                break
+            # The payload is gone after the first round; the job row keeps the size of the latest revision
+            size = job_size(job_data)
+            host = host_registry.acquire(size, timeout=get_config_float("host_failover_wait", 30))
+            if host is None:
+                # Every host went away between the capacity check and the claim
+                self._logger.log(f"Job {job_data['job_id']}: no host available, returning it to the queue", level=logging.WARNING)
+                update_job_status(job_db, job_data['job_id'], "NEW")
+                continue
+            try:
+                process_job(self._revisions_db, job_data, host, self._logger)
+            finally:
+                host_registry.release(host, size)
 
-        with open(job_file, 'w') as json_file:
-            json.dump(existing_contents, json_file, indent=2)
+        self._logger.log(f"Batch worker {index} stopped: host_instances has fewer slots now")
 
-def start_batch_job(revisions_db, model_folder, model_url, model_filename, max_context, logger):
+batch_dispatcher = BatchDispatcher()
 
-    job_file = get_config("job_file", "")
+job_progress = JobProgressBoard()
 
-    batch_process = Process(target=process_batch, args=(job_file, revisions_db, model_folder, model_url, model_filename, max_context, logger))
-    batch_process.start()
+def start_batch_job(revisions_db, logger):
+    batch_dispatcher.start(revisions_db, logger)
 
 def add_job(max_file_size, filename, file_contents, model_folder, revisions_db, current_user, rounds, prompt):
     if not filename:
@@ -82,181 +159,274 @@ def add_job(max_file_size, filename, file_contents, model_folder, revisions_db,
 
     user_id = current_user.id
 
-    job_file = get_config("job_file", "")
-
-    save_request_to_json(job_file, filename, file_contents, user_id, rounds, prompt)
-
-def save_request_to_json(batch_requests_file, filename, file_contents, user_id, rounds, prompt):
-    # Load existing contents if the file exists
-    existing_contents = []
-    if os.path.exists(batch_requests_file):
-        with open(batch_requests_file, 'r') as existing_file:
-            existing_contents = json.load(existing_file)
+    job_db = get_config("job_db", "jobs.db")
 
-    encoded_contents = base64.b64encode(file_contents).decode('utf-8')
-
-    # Generate a unique ID using current ticks
-    job_id = int(time.time() * 1000)
-
-    request_data = {
-        'job_id': job_id,
-        'filename': filename,
-        'file_contents': encoded_contents,
-        'user_id': user_id,
-        'rounds': rounds,
-        'prompt': prompt,
-        'status': 'NEW'
-    }
-
-    existing_contents.append(request_data)
-
-    with open(batch_requests_file, 'w') as json_file:
-        json.dump(existing_contents, json_file, indent=2)
+    insert_job(job_db, filename, file_contents, user_id, rounds, prompt)
+    batch_dispatcher.notify()
 
 def clear_job(job_id):
-    batch_requests_file = get_config("job_file", "")
-
-    # Clear a specific job based on job_id
-    existing_contents = []
-    if os.path.exists(batch_requests_file):
-        with open(batch_requests_file, 'r') as existing_file:
-            existing_contents = json.load(existing_file)
-
-    # Find and remove the job with the specified job_id
-    existing_contents = [job for job in existing_contents if job.get('job_id') != job_id]
+    job_db = get_config("job_db", "jobs.db")
+    delete_job(job_db, job_id)
 
-    # Save the updated contents back to the file
-    with open(batch_requests_file, 'w') as json_file:
-        json.dump(existing_contents, json_file, indent=2)
+def process_batch(revisions_db, logger):
+    """Start the dispatcher and block until no NEW or STARTED jobs remain."""
+    job_db = get_config("job_db", "jobs.db")
 
-def process_batch(batch_requests_file, revisions_db, model_folder, model_url, model_filename, max_context, logger):
-    config = load_config()
-    batch_requests_file = get_config("job_file", "")
+    start_batch_job(revisions_db, logger)
 
-    client_instances = get_config("host_instances","")
-    client_instances = ast.literal_eval(client_instances)
+    while count_jobs(job_db, ('NEW', 'STARTED')) > 0:
+        time.sleep(0.5)
 
-    client_queue = Queue()
-
-    for client in client_instances:
-            client_queue.put(client)
-
-    while True:       
-
-        with open(batch_requests_file, 'r') as json_file:
-            data = json.load(json_file)
-
-        all_finished = all(request_data['status'] == "FINISHED" for request_data in data)
-
-        if all_finished:
-            break
+def job_size(job_data):
+    """The size of the file a claimed job's round will revise, used to pick and release its host."""
+    if job_data.get('file_size') is not None:
+        return job_data['file_size']
+    return len(job_data['file_contents'] or '')
 
-        processes = []
+def finish_round(job_db, job_id, rounds, file_size=None):
+    """Queue the job again if it runs until stopped (rounds == -1), else finish it."""
+    if rounds == -1:
+        update_job_status(job_db, job_id, "NEW", file_size=file_size)
+    else:
+        update_job_status(job_db, job_id, "FINISHED", file_size=file_size)
 
-        for request_data in data:
+def process_job(revisions_db, job_data, current_client, logger):
 
-            status = request_data['status']
-
-            if status == "STARTED":
-                continue
-
-            current_client = None
-            while True:
-                if client_queue.empty():
-                    time.sleep(10)
-                else:
-                    current_client = client_queue.get()
-                    break
-
-            client_url = f'http://{current_client}'
-
-            process = Process(target=process_job, args=(revisions_db, request_data, client_url, client_queue, current_client, logger))
-            processes.append(process)
-            process.start()
-
-        for process in processes:
-            process.join()
-
-def process_job(revisions_db, job_data, client_url, client_queue, current_client, logger):
-
-    batch_requests_file = get_config("job_file", "")
+    job_db = get_config("job_db", "jobs.db")
+    timings = JobTimings(current_client)
+    if job_data.get('queued_at') and job_data.get('claimed_at'):
+        timings.values['queue_wait'] = job_data['claimed_at'] - job_data['queued_at']
 
     try:
-        logger.log(f"Processing {job_data['filename']} with client {current_client}")
+        logger.log(f"Job {job_data['job_id']}: processing {job_data['filename']} with client {current_client}")
         filename = job_data['filename']
         if job_data['file_contents'] is None:
             file_contents = ''
         else:
-            file_contents = base64.b64decode(job_data['file_contents'])
+            file_contents = job_data['file_contents']
         if isinstance(file_contents, bytes):
             file_contents = file_contents.decode('utf-8')
         rounds = job_data['rounds']
         user_id = job_data['user_id']
         initial_prompt = job_data['prompt']
 
-        revision = get_latest_revision(filename, user_id, revisions_db)
+        with timings.stage('prompt_build_time'):
+            revision = get_latest_revision(filename, user_id, revisions_db)
         if revision:
             existing_revision = revision[0]
             file_contents = existing_revision
             initial_prompt = revision[1]
         else:
-            save_revision(revisions_db, filename, user_id, file_contents, initial_prompt)
+            with timings.stage('db_write_time'):
+                save_revision(revisions_db, filename, user_id, file_contents, initial_prompt)
 
         # Get default prompt from config or use a default value
         default_prompt = get_config('default_prompt', "")
         revision_prompt = get_config('revision_prompt', "") 
 
-        if "TODO" in file_contents.upper() or "PLACEHOLDER" in file_contents.upper() or len(file_contents) > get_config('wrap_up_cutoff',''):
+        if "TODO" in file_contents.upper() or "PLACEHOLDER" in file_contents.upper() or len(file_contents) > get_config_int('wrap_up_cutoff'):
             # Use the provided prompt if given, else use the one from config
             prompt = revision_prompt
         else:
             # Use the provided prompt if given, else use the one from config
             prompt = default_prompt
 
-        language = ""
-        if "python" in initial_prompt.lower():
-            language = "python"
-        elif "javascript" in initial_prompt.lower():
-            language = "javascript"
-        elif "c#" in initial_prompt.lower():
-            language = "csharp"
-        linter = Linter(file_contents, language, logger)
-        current_errors = linter.lint()
-
         build_error = ""
         if "[BUILDERROR]" in file_contents:
             build_error = file_contents.split("[BUILDERROR]")[1]
             file_contents = file_contents.split("[BUILDERROR]")[0]
-            
-        if initial_prompt != "" and build_error != "":
-            message = f"<s>[INST]Here is the original instruction:\n{initial_prompt}\nHere is the current code:\n```\n{file_contents}\n```\nHere are the current compiler errors:\n{current_errors}\nHere is the latest build error when I try to run the code:\n{build_error}\n\n{prompt}\n\n[/INST]\n"
-        elif initial_prompt != "" and build_error == "":
-            message = f"<s>[INST]Here is the original instruction:\n{initial_prompt}\nHere is the current code:\n```\n{file_contents}\n```\nHere are the current compiler errors:\n{current_errors}\n\n{prompt}\n\n[/INST]\n"
-        else:
-            message = f"<s>[INST]Here is the current code:\n```\n{file_contents}\n```\nHere are the current compiler errors:\n{current_errors}\n\n{prompt}\n\n[/INST]\n"
-       
-        update_job_status(batch_requests_file, job_data['job_id'], "STARTED", clear_file_contents=True)
-
-        url = f'{client_url}/process_request'
-        data = {
-            'prompt': message,
-            'fileName': filename,
-            'fileContents': file_contents
-        }
-        response = requests.post(url, data=data)
-        if response.status_code == 200:
-            revision = response.content.decode()
+
+        with timings.stage('lint_time'):
+            linter = Linter.for_file(filename, file_contents, logger, hint=initial_prompt)
+            diagnostics = linter.lint()
+
+        with timings.stage('prompt_build_time'):
+            plan = PromptBuilder(current_client, logger).build(file_contents, initial_prompt, prompt, diagnostics, build_error, linter.language)
+        logger.log(f"Job {job_data['job_id']} {plan.describe()}")
+
+        with timings.stage('db_write_time'):
+            update_job_status(job_db, job_data['job_id'], "STARTED", clear_file_contents=True)
+
+        job_progress.start(job_data['job_id'], current_client)
+        # Best-of-N for whole files; chunks are already spread over the hosts
+        candidates = 1 if plan.chunked else max(get_config_int("candidates_per_round", 1), 1)
+
+        on_token = None
+        if get_config_bool("stream_revisions", True) and not plan.chunked:
+            on_token = lambda text: job_progress.append(job_data['job_id'], text)
+
+        failover_hosts = []
+        try:
+            while True:
+                try:
+                    with timings.stage('request_time'):
+                        results = revise_parts(plan, current_client, on_token, candidates)
+                    host_registry.report_success(current_client)
+                    break
+                except (HostRequestError, requests.ConnectionError) as e:
+                    status_code = getattr(e, 'status_code', None)
+                    if status_code is not None and status_code < 500:
+                        raise
+                    # The host is down or broken rather than the request being bad: try another one
+                    host_registry.report_failure(current_client, str(e))
+                    next_client = None
+                    if len(failover_hosts) < get_config_int("host_failover_attempts", 2):
+                        next_client = host_registry.acquire(len(file_contents), exclude={current_client},
+                                                            timeout=get_config_float("host_failover_wait", 30))
+                    if next_client is None:
+                        raise
+                    logger.log(f"Job {job_data['job_id']} failed on {current_client} ({str(e)}), retrying on {next_client}", level=logging.WARNING)
+                    failover_hosts.append(next_client)
+                    current_client = next_client
+                    timings.values['host'] = current_client
+                    job_progress.start(job_data['job_id'], current_client)
+        except (HostRequestError, requests.ConnectionError) as e:
+            job_progress.finish(job_data['job_id'])
+            logger.log(f"Job {job_data['job_id']} failed. Status Code: {getattr(e, 'status_code', 'no response')}", level=logging.ERROR)
+            update_job_status(job_db, job_data['job_id'], "ERROR")
+            record_job_metrics(job_db, job_data['job_id'], timings.finish('error'), logger)
+            return
+        finally:
+            for host in failover_hosts:
+                host_registry.release(host, len(file_contents))
+
+        revisions = [result[0] for result in results]
+        revision = plan.assemble(revisions)
+        stats = results[0][1]
+        if len(results) > 1 and not plan.chunked:
+            with timings.stage('lint_time'):
+                revision, stats = select_candidate(job_data['job_id'], file_contents, results, linter, logger)
+        if plan.chunked:
+            stats = merge_revision_stats([result[1] for result in results])
+            with timings.stage('lint_time'):
+                revision = check_chunked_revision(job_data['job_id'], plan, revisions, linter, diagnostics, logger)
+
+        job_progress.finish(job_data['job_id'], stats)
+        timings.add_revision_stats(stats)
+        if stats.get('time_to_first_token') is not None:
+            logger.log(f"Job {job_data['job_id']} time to first token: {stats['time_to_first_token']:.2f}s, tokens/sec: {stats['tokens_per_second']:.2f}")
+        if 'prompt_tokens' in stats:
+            logger.log(f"Job {job_data['job_id']} prompt cache {'hit' if stats['prompt_cache_hit'] else 'miss'}: reused {stats['reused_prompt_tokens']}/{stats['prompt_tokens']} prompt tokens, saved ~{stats['saved_prompt_eval_time']:.2f}s")
+
+        with timings.stage('db_write_time'):
             save_revision(revisions_db, filename, user_id, revision, initial_prompt)
-            logger.log(f"Job {job_data['job_id']} completed.")
-            if rounds != -1:
-                update_job_status(batch_requests_file, job_data['job_id'], "FINISHED")
-            else:
-                update_job_status(batch_requests_file, job_data['job_id'], "NEW")
-        else:
-            logger.log(f"Job {job_data['job_id']} failed. Status Code: {response.status_code}")
-            update_job_status(batch_requests_file, job_data['job_id'], "ERROR")
+        logger.log(f"Job {job_data['job_id']} completed.")
+        with timings.stage('db_write_time'):
+            finish_round(job_db, job_data['job_id'], rounds, file_size=len(revision))
+        record_job_metrics(job_db, job_data['job_id'], timings.finish('completed'), logger)
     except Exception as e:
-        logger.log(str(e))
-        update_job_status(batch_requests_file, job_data['job_id'], "ERROR")
+        logger.log(str(e), level=logging.ERROR)
+        job_progress.finish(job_data['job_id'])
+        update_job_status(job_db, job_data['job_id'], "ERROR")
+        record_job_metrics(job_db, job_data['job_id'], timings.finish('error'), logger)
+
+def revise_parts(plan, current_client, on_token=None, candidates=1):
+    """Send the requests for a prompt plan to the hosts and return their (revision, stats) in order.
+
+    That is one request per chunk of a chunked plan, else `candidates`
+    requests for the whole file, each sampled with its own seed. A single
+    request goes to the job's own host. Several are shared out over the
+    job's host and every slot host_registry has free, each slot taking the
+    next request as soon as it is done with the last. Only the first
+    request streams to on_token.
+    """
+    if plan.chunked or candidates <= 1:
+        calls = [(code, message, None) for code, message in plan.parts]
+    else:
+        code, message = plan.parts[0]
+        calls = [(code, message, seed) for seed in candidate_seeds(candidates)]
+
+    if len(calls) == 1:
+        code, message, seed = calls[0]
+        return [get_host_client(current_client).revise(message, code, on_token=on_token, seed=seed)]
+
+    # The job's own slot plus whatever free slots host_registry has right now
+    request_size = sum(len(code) for code, _, _ in calls) // len(calls)
+    extra_hosts = []
+    while len(extra_hosts) < len(calls) - 1:
+        host = host_registry.try_acquire(request_size)
+        if host is None:
+            break
+        extra_hosts.append(host)
+    slots = SimpleQueue()
+    for host in [current_client] + extra_hosts:
+        slots.put(host)
+
+    def revise_request(index):
+        code, message, seed = calls[index]
+        host = slots.get()
+        try:
+            return get_host_client(host).revise(message, code, on_token=on_token if index == 0 else None, seed=seed)
+        finally:
+            slots.put(host)
 
-    client_queue.put(current_client)
\ No newline at end of file
+    try:
+        with ThreadPoolExecutor(max_workers=len(extra_hosts) + 1) as executor:
+            return list(executor.map(revise_request, range(len(calls))))
+    finally:
+        for host in extra_hosts:
+            host_registry.release(host, request_size)
+
+def select_candidate(job_id, file_contents, results, linter, logger):
+    """Score the candidate revisions of a round and return (revision, stats) of the best one."""
+    candidates = score_candidates(file_contents, [Candidate(revision, stats) for revision, stats in results], linter.language, logger)
+    best = pick_best(candidates)
+    summary = ', '.join(f"{candidate.score:.2f}{' (unchanged)' if candidate.unchanged else ''}" for candidate in candidates)
+    logger.log(f"Job {job_id}: picked candidate {candidates.index(best) + 1} of {len(candidates)} with {len(best.diagnostics)} lint problems; scores {summary}")
+    # Every candidate's tokens were generated, whichever one is kept
+    stats = dict(best.stats, candidates=len(candidates), tokens=sum(candidate.stats.get('tokens') or 0 for candidate in candidates))
+    return best.revision, stats
+
+def lint_problems(diagnostics):
+    """(syntax errors, all problems) of a lint result; a larger tuple is a worse file."""
+    diagnostics = deduplicate(diagnostics)
+    return sum(1 for diagnostic in diagnostics if diagnostic.code in SYNTAX_ERROR_CODES), len(diagnostics)
+
+def check_chunked_revision(job_id, plan, revisions, linter, diagnostics, logger):
+    """Re-lint a file reassembled from chunks, and never return one worse than the input.
+
+    When it has more problems than before, chunks that no longer parse on
+    their own (Python only) are put back to their original text and the
+    whole file is linted again. If it is still worse, the round keeps the
+    file as it was.
+    """
+    before = lint_problems(diagnostics)
+    revision = plan.assemble(revisions)
+    after = lint_problems(Linter(revision, linter.language, logger).lint())
+    if after <= before:
+        return revision
+
+    reverted = 0
+    for index, (code, _) in enumerate(plan.parts):
+        if chunk_parses(revisions[index], linter.language) is False and chunk_parses(code, linter.language):
+            revisions[index] = code
+            reverted += 1
+    if reverted:
+        revision = plan.assemble(revisions)
+        after_revert = lint_problems(Linter(revision, linter.language, logger).lint())
+        logger.log(f"Job {job_id}: reassembled revision has {after[1]} lint problems (was {before[1]}); kept the original of {reverted} of {len(plan.parts)} chunks, leaving {after_revert[1]}", level=logging.WARNING)
+        if after_revert <= before:
+            return revision
+        after = after_revert
+
+    logger.log(f"Job {job_id}: reassembled revision is worse than the input ({after[0]} syntax errors and {after[1]} lint problems, was {before[0]} and {before[1]}); keeping the previous revision", level=logging.WARNING)
+    return plan.assemble([code for code, _ in plan.parts])
+
+def merge_revision_stats(stats_list):
+    """Combine the stats of the chunk requests of one round into round totals."""
+    merged = dict(stats_list[0])
+    for name in ('duration', 'tokens', 'model_load_time', 'inference_time', 'prompt_tokens', 'reused_prompt_tokens', 'saved_prompt_eval_time'):
+        if any(name in stats for stats in stats_list):
+            merged[name] = sum(stats.get(name) or 0 for stats in stats_list)
+    generation_time = sum((stats.get('duration') or 0) - (stats.get('time_to_first_token') or 0) for stats in stats_list)
+    merged['tokens_per_second'] = merged.get('tokens', 0) / generation_time if generation_time > 0 else 0.0
+    merged['chunks'] = len(stats_list)
+    return merged
+
+def record_job_metrics(job_db, job_id, timings, logger):
+    """Persist one round's timings and add them to the /metrics counters."""
+    job_telemetry.record(timings)
+    try:
+        insert_job_metrics(job_db, job_id, timings)
+    except sqlite3.Error as e:
+        logger.log(f"Job {job_id} metrics were not saved: {str(e)}", level=logging.WARNING)
\ No newline at end of file
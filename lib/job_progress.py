@@ -0,0 +1,71 @@
+import time
+from threading import Condition
+
+class JobProgressBoard:
+    """In-memory view of the revisions currently being generated.
+
+    process_job appends streamed text as it arrives; the live view waits on
+    the board for changes instead of polling the job store.
+    """
+
+    def __init__(self, max_finished=50):
+        self._condition = Condition()
+        self._jobs = {}
+        self._max_finished = max_finished
+
+    def start(self, job_id, host):
+        with self._condition:
+            previous = self._jobs.get(job_id)
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'host': host,
+                'text': '',
+                'tokens': 0,
+                'started_at': time.time(),
+                'first_token_at': None,
+                'finished': False,
+                'stats': {},
+                # Keeps counting across rounds, so a waiting stream never mistakes a new round for no change
+                'version': previous['version'] + 1 if previous else 0
+            }
+            self._condition.notify_all()
+
+    def append(self, job_id, text):
+        with self._condition:
+            progress = self._jobs.get(job_id)
+            if progress is None:
+                return
+            if progress['first_token_at'] is None:
+                progress['first_token_at'] = time.time()
+            progress['text'] += text
+            progress['tokens'] += 1
+            progress['version'] += 1
+            self._condition.notify_all()
+
+    def finish(self, job_id, stats=None):
+        with self._condition:
+            progress = self._jobs.get(job_id)
+            if progress is None:
+                return
+            progress['finished'] = True
+            progress['stats'] = stats or {}
+            progress['version'] += 1
+            self._prune()
+            self._condition.notify_all()
+
+    def _prune(self):
+        finished = [job_id for job_id, progress in self._jobs.items() if progress['finished']]
+        for job_id in finished[:-self._max_finished]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._condition:
+            progress = self._jobs.get(job_id)
+            return dict(progress) if progress else None
+
+    def wait(self, job_id, version, timeout):
+        """Block until the job's progress moves past `version`, then return a snapshot."""
+        with self._condition:
+            self._condition.wait_for(lambda: job_id in self._jobs and self._jobs[job_id]['version'] != version, timeout=timeout)
+            progress = self._jobs.get(job_id)
+            return dict(progress) if progress else None
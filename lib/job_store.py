@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import base64
+import sqlite3
+
+def connect_job_db(job_db):
+    conn = sqlite3.connect(job_db, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def init_job_db(job_db, legacy_job_file=None):
+    """Create the job tables and import a legacy jobs.json on first use."""
+    conn = connect_job_db(job_db)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        user_id INT,
+        rounds INT,
+        prompt TEXT,
+        status TEXT NOT NULL DEFAULT 'NEW',
+        created_at REAL,
+        updated_at REAL,
+        file_size INT,
+        owner TEXT,
+        heartbeat_at REAL)''')
+    _add_missing_columns(conn, 'jobs', {'file_size': 'INT', 'owner': 'TEXT', 'heartbeat_at': 'REAL'})
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, job_id)")
+    # File contents live apart from the metadata so status changes never touch them
+    conn.execute('''CREATE TABLE IF NOT EXISTS job_payloads (
+        job_id INTEGER PRIMARY KEY REFERENCES jobs (job_id) ON DELETE CASCADE,
+        file_contents BLOB)''')
+    # One row per processed round, written once the round ends
+    conn.execute('''CREATE TABLE IF NOT EXISTS job_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER NOT NULL,
+        host TEXT,
+        outcome TEXT,
+        started_at REAL,
+        queue_wait REAL,
+        prompt_build_time REAL,
+        lint_time REAL,
+        model_load_time REAL,
+        prompt_eval_time REAL,
+        prompt_tokens INT,
+        reused_prompt_tokens INT,
+        prompt_eval_tokens_per_second REAL,
+        generation_time REAL,
+        generated_tokens INT,
+        generation_tokens_per_second REAL,
+        request_time REAL,
+        db_write_time REAL,
+        total_time REAL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_metrics_job ON job_metrics (job_id, id)")
+    conn.commit()
+
+    if legacy_job_file and os.path.isfile(legacy_job_file):
+        _import_legacy_jobs(conn, legacy_job_file)
+
+    conn.close()
+
+def _add_missing_columns(conn, table, columns):
+    """Add columns that a job database created by an older version lacks."""
+    existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+def _import_legacy_jobs(conn, legacy_job_file):
+    with open(legacy_job_file, 'r') as json_file:
+        data = json.load(json_file)
+
+    now = time.time()
+    with conn:
+        for job in data:
+            file_contents = base64.b64decode(job['file_contents']) if job.get('file_contents') is not None else None
+            conn.execute("INSERT OR IGNORE INTO jobs (job_id, filename, user_id, rounds, prompt, status, created_at, updated_at, file_size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (job['job_id'], job['filename'], job['user_id'], job['rounds'], job['prompt'], job['status'], now, now,
+                          len(file_contents) if file_contents is not None else None))
+            if file_contents is not None:
+                conn.execute("INSERT OR IGNORE INTO job_payloads (job_id, file_contents) VALUES (?, ?)",
+                             (job['job_id'], file_contents))
+
+    os.replace(legacy_job_file, legacy_job_file + ".migrated")
+
+def insert_job(job_db, filename, file_contents, user_id, rounds, prompt):
+    conn = connect_job_db(job_db)
+    now = time.time()
+    with conn:
+        cursor = conn.execute("INSERT INTO jobs (filename, user_id, rounds, prompt, status, created_at, updated_at, file_size) VALUES (?, ?, ?, ?, 'NEW', ?, ?, ?)",
+                              (filename, user_id, rounds, prompt, now, now, len(file_contents)))
+        job_id = cursor.lastrowid
+        conn.execute("INSERT INTO job_payloads (job_id, file_contents) VALUES (?, ?)", (job_id, file_contents))
+    conn.close()
+    return job_id
+
+def list_jobs(job_db):
+    """Return job metadata (never file contents) in dashboard order."""
+    conn = connect_job_db(job_db)
+    rows = conn.execute('''SELECT job_id, filename, status, rounds, prompt FROM jobs
+        ORDER BY CASE status WHEN 'NEW' THEN 0 WHEN 'STARTED' THEN 1 WHEN 'FINISHED' THEN 2 ELSE 3 END, rounds''').fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def count_jobs(job_db, statuses):
+    conn = connect_job_db(job_db)
+    placeholders = ", ".join("?" for _ in statuses)
+    count = conn.execute(f"SELECT COUNT(*) FROM jobs WHERE status IN ({placeholders})", tuple(statuses)).fetchone()[0]
+    conn.close()
+    return count
+
+def count_jobs_by_status(job_db):
+    conn = connect_job_db(job_db)
+    rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+    conn.close()
+    return {row[0]: row[1] for row in rows}
+
+def get_job(job_db, job_id):
+    """Return one job's metadata, or None."""
+    conn = connect_job_db(job_db)
+    row = conn.execute("SELECT job_id, filename, status, rounds, prompt, created_at, updated_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def claim_next_job(job_db, owner=None):
+    """Atomically move the oldest NEW job to STARTED and return it with its payload.
+
+    Returns None when there is nothing to claim. Safe to call from several
+    processes at once: the write lock is taken before the job is selected.
+    The job is marked as owned by owner until its round ends.
+    """
+    conn = connect_job_db(job_db)
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute('''SELECT j.job_id, j.filename, j.user_id, j.rounds, j.prompt, j.status, j.updated_at AS queued_at, j.file_size, p.file_contents
+            FROM jobs j LEFT JOIN job_payloads p ON p.job_id = j.job_id
+            WHERE j.status = 'NEW' ORDER BY j.job_id LIMIT 1''').fetchone()
+        claimed_at = time.time()
+        if row is not None:
+            conn.execute("UPDATE jobs SET status = 'STARTED', updated_at = ?, owner = ?, heartbeat_at = ? WHERE job_id = ?",
+                         (claimed_at, owner, claimed_at, row['job_id']))
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+
+    job = dict(row)
+    job['status'] = 'STARTED'
+    job['claimed_at'] = claimed_at
+    return job
+
+def set_job_status(job_db, job_id, status, rounds=None, clear_file_contents=False, file_size=None):
+    """Update a job's status; file_size records the size of the file its next round works on."""
+    conn = connect_job_db(job_db)
+    with conn:
+        if rounds is not None:
+            conn.execute("UPDATE jobs SET status = ?, rounds = ?, updated_at = ? WHERE job_id = ?", (status, rounds, time.time(), job_id))
+        else:
+            conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?", (status, time.time(), job_id))
+        if file_size is not None:
+            conn.execute("UPDATE jobs SET file_size = ? WHERE job_id = ?", (file_size, job_id))
+        if clear_file_contents is True:
+            conn.execute("UPDATE jobs SET prompt = NULL WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM job_payloads WHERE job_id = ?", (job_id,))
+    conn.close()
+
+def touch_jobs(job_db, owner):
+    """Refresh the heartbeat of the STARTED jobs owner is working on."""
+    conn = connect_job_db(job_db)
+    with conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE status = 'STARTED' AND owner = ?", (time.time(), owner))
+    conn.close()
+
+def requeue_started_jobs(job_db, stale_after=None, owner=None):
+    """Return orphaned STARTED jobs to NEW, e.g. after the dispatcher was restarted.
+
+    With stale_after, only jobs whose heartbeat is older than that many
+    seconds (or that never had one) are taken back, along with any held by
+    owner, so jobs another live process is working on are left alone.
+    Without it every STARTED job is requeued.
+    """
+    conn = connect_job_db(job_db)
+    now = time.time()
+    with conn:
+        if stale_after is None:
+            count = conn.execute("UPDATE jobs SET status = 'NEW', updated_at = ? WHERE status = 'STARTED'", (now,)).rowcount
+        else:
+            count = conn.execute("""UPDATE jobs SET status = 'NEW', updated_at = ?
+                WHERE status = 'STARTED' AND (heartbeat_at IS NULL OR heartbeat_at < ? OR owner = ?)""",
+                                 (now, now - stale_after, owner)).rowcount
+    conn.close()
+    return count
+
+JOB_METRIC_COLUMNS = ('host', 'outcome', 'started_at', 'queue_wait', 'prompt_build_time', 'lint_time', 'model_load_time',
+                      'prompt_eval_time', 'prompt_tokens', 'reused_prompt_tokens', 'prompt_eval_tokens_per_second',
+                      'generation_time', 'generated_tokens', 'generation_tokens_per_second', 'request_time',
+                      'db_write_time', 'total_time')
+
+def insert_job_metrics(job_db, job_id, metrics):
+    """Persist one round's timings; keys missing from metrics are stored as NULL."""
+    conn = connect_job_db(job_db)
+    with conn:
+        conn.execute(f"INSERT INTO job_metrics (job_id, {', '.join(JOB_METRIC_COLUMNS)}) VALUES (?, {', '.join('?' for _ in JOB_METRIC_COLUMNS)})",
+                     (job_id,) + tuple(metrics.get(column) for column in JOB_METRIC_COLUMNS))
+    conn.close()
+
+def list_job_metrics(job_db, job_id, limit=200):
+    """Return the newest rounds' timings for a job, oldest first."""
+    conn = connect_job_db(job_db)
+    rows = conn.execute("SELECT * FROM (SELECT * FROM job_metrics WHERE job_id = ? ORDER BY id DESC LIMIT ?) ORDER BY id", (job_id, limit)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def delete_job(job_db, job_id):
+    conn = connect_job_db(job_db)
+    with conn:
+        conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM job_metrics WHERE job_id = ?", (job_id,))
+    conn.close()
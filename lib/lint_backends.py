@@ -0,0 +1,300 @@
+import ast
+import atexit
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pyjsparser
+
+from lib.config_manager import get_config, get_config_int
+
+Diagnostic = namedtuple('Diagnostic', ['tool', 'line', 'column', 'code', 'message'])
+
+class LintToolError(Exception):
+    """A lint tool failed for reasons unrelated to the code (missing SDK, crash, restore failure)."""
+
+class LintBackend:
+    def __init__(self, name, languages, function, timeout, requires_module=None, requires_command=None):
+        self.name = name
+        self.languages = languages
+        self.function = function
+        self.timeout = timeout
+        self.requires_module = requires_module
+        self.requires_command = requires_command
+        self._available = None
+
+    def available(self):
+        if self._available is None:
+            self._available = ((self.requires_module is None or importlib.util.find_spec(self.requires_module) is not None) and
+                               (self.requires_command is None or shutil.which(self.requires_command) is not None))
+        return self._available
+
+    def get_timeout(self):
+        return float(get_config("lint_tool_timeouts", {}).get(self.name, self.timeout))
+
+_backends = OrderedDict()
+
+def lint_backend(name, languages, timeout=30, requires_module=None, requires_command=None):
+    """Register a function(code, timeout) -> [Diagnostic] as a lint tool for the given languages."""
+    def register(function):
+        _backends[name] = LintBackend(name, languages, function, timeout, requires_module, requires_command)
+        return function
+    return register
+
+def get_backends(language):
+    """The available tools for a language, optionally narrowed by the lint_tools config."""
+    selected = get_config("lint_tools", {}).get(language)
+    return [backend for backend in _backends.values()
+            if language in backend.languages and backend.available() and (selected is None or backend.name in selected)]
+
+EXTENSIONS = {
+    '.py': 'python', '.pyw': 'python',
+    '.js': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript', '.jsx': 'javascript',
+    '.cs': 'csharp'
+}
+
+SNIFFERS = (
+    ('csharp', re.compile(r'^\s*using\s+System[\w.]*\s*;|^\s*namespace\s+[\w.]+|\b(public|private|internal)\s+(static\s+)?(class|void|async)\b', re.MULTILINE)),
+    ('python', re.compile(r'^#!.*python|^\s*def\s+\w+\s*\(.*\)\s*(->\s*[^:]+)?:\s*$|^\s*(from\s+[\w.]+\s+)?import\s+[\w.]+(\s+as\s+\w+)?\s*$|^if\s+__name__\s*==', re.MULTILINE)),
+    ('javascript', re.compile(r'^#!.*node|\bfunction\s*\w*\s*\(|\b(const|let|var)\s+\w+\s*=|=>|\bconsole\.\w+\(|\brequire\(', re.MULTILINE)),
+)
+
+def detect_language(filename, code, hint=""):
+    """Pick the lint language from the file extension, then the content, then a hint such as the instructions."""
+    language = EXTENSIONS.get(os.path.splitext(filename or "")[1].lower())
+    if language:
+        return language
+
+    sample = code[:20000]
+    for language, pattern in SNIFFERS:
+        if pattern.search(sample):
+            return language
+
+    hint = (hint or "").lower()
+    for keyword, language in (("python", "python"), ("javascript", "javascript"), ("c#", "csharp")):
+        if keyword in hint:
+            return language
+    return ""
+
+_tool_executor = None
+_tool_executor_lock = threading.Lock()
+
+def _get_tool_executor():
+    global _tool_executor
+    with _tool_executor_lock:
+        if _tool_executor is None:
+            _tool_executor = ThreadPoolExecutor(max_workers=max(get_config_int("lint_tool_workers", 4), 1), thread_name_prefix="lint-tool")
+        return _tool_executor
+
+def run_backends(language, code, logger):
+    """Run every tool for the language concurrently.
+
+    Returns (diagnostics, complete); complete is False when a tool timed out
+    or failed, in which case the result should not be cached.
+    """
+    backends = get_backends(language)
+    executor = _get_tool_executor()
+    started = time.monotonic()
+    futures = [(backend, executor.submit(backend.function, code, backend.get_timeout())) for backend in backends]
+
+    diagnostics = []
+    complete = True
+    for backend, future in futures:
+        remaining = max(started + backend.get_timeout() - time.monotonic(), 0) + 1
+        try:
+            diagnostics.extend(future.result(timeout=remaining))
+        except (TimeoutError, subprocess.TimeoutExpired):
+            complete = False
+            logger.log(f"Lint tool {backend.name} timed out after {backend.get_timeout():.0f}s", level=logging.WARNING)
+        except Exception as e:
+            complete = False
+            logger.log(f"Lint tool {backend.name} failed: {str(e)}", level=logging.WARNING)
+    return deduplicate(diagnostics), complete
+
+# Codes the tools use for "the file does not parse"
+SYNTAX_ERROR_CODES = frozenset(['syntax-error', 'SyntaxError', 'E0001'])
+
+def deduplicate(diagnostics):
+    """Drop repeats of the same problem on the same line, whichever tool reported it, in line order.
+
+    Parsers stop at the first error and word it differently, so only the
+    syntax errors of the first tool that reported any are kept.
+    """
+    syntax_tool = next((diagnostic.tool for diagnostic in diagnostics if diagnostic.code in SYNTAX_ERROR_CODES), None)
+    seen = set()
+    unique = []
+    for diagnostic in sorted(diagnostics, key=lambda d: (d.line or 0, d.column or 0)):
+        if diagnostic.code in SYNTAX_ERROR_CODES:
+            if diagnostic.tool != syntax_tool:
+                continue
+            key = (diagnostic.line, 'syntax-error')
+        else:
+            key = (diagnostic.line, ' '.join(diagnostic.message.lower().split()))
+        if key not in seen:
+            seen.add(key)
+            unique.append(diagnostic)
+    return unique
+
+def format_diagnostics(diagnostics, max_items=None):
+    """One compact line per diagnostic, for use in prompts."""
+    if not diagnostics:
+        return "None"
+    max_items = max_items or get_config_int("lint_max_diagnostics", 20)
+    lines = []
+    for diagnostic in diagnostics[:max_items]:
+        location = f"line {diagnostic.line}" if diagnostic.line else "file"
+        if diagnostic.line and diagnostic.column:
+            location += f":{diagnostic.column}"
+        code = f" [{diagnostic.code}]" if diagnostic.code else ""
+        lines.append(f"{location}{code} {diagnostic.message}")
+    if len(diagnostics) > max_items:
+        lines.append(f"... and {len(diagnostics) - max_items} more")
+    return "\n".join(lines)
+
+def _run_tool(command, code, suffix, timeout, cwd=None):
+    """Write code to a scratch file, run command (with {path} filled in) and return its output."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "code" + suffix)
+        with open(path, "w", encoding="utf-8") as code_file:
+            code_file.write(code)
+        completed = subprocess.run([part.replace("{path}", path) for part in command], cwd=cwd or temp_dir,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
+        return completed
+
+@lint_backend("ast", ["python"], timeout=10)
+def lint_python_ast(code, timeout):
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return [Diagnostic("ast", e.lineno, e.offset, "syntax-error", e.msg)]
+    return []
+
+@lint_backend("pyflakes", ["python"], timeout=30, requires_module="pyflakes")
+def lint_python_pyflakes(code, timeout):
+    completed = _run_tool([sys.executable, "-m", "pyflakes", "{path}"], code, ".py", timeout)
+    diagnostics = []
+    for match in re.finditer(r"^[^\n]*?:(\d+):(?:(\d+):?)?\s*(.*)$", completed.stdout, re.MULTILINE):
+        diagnostics.append(Diagnostic("pyflakes", int(match.group(1)), int(match.group(2)) if match.group(2) else None, "pyflakes", match.group(3).strip()))
+    return diagnostics
+
+@lint_backend("pylint", ["python"], timeout=60, requires_module="pylint")
+def lint_python_pylint(code, timeout):
+    completed = _run_tool([sys.executable, "-m", "pylint", "--errors-only", "--output-format=json", "--score=n", "{path}"], code, ".py", timeout)
+    try:
+        messages = json.loads(completed.stdout or "[]")
+    except ValueError:
+        raise LintToolError(completed.stderr.strip() or "pylint produced no JSON output")
+    return [Diagnostic("pylint", message.get("line"), message.get("column"), message.get("message-id"), message.get("message", ""))
+            for message in messages]
+
+@lint_backend("pyjsparser", ["javascript"], timeout=20)
+def lint_javascript_pyjsparser(code, timeout):
+    try:
+        pyjsparser.parse(code)
+    except Exception as e:
+        message = str(e).split("\n")[0]
+        match = re.match(r"Line (\d+):\s*(.*)", message)
+        if match:
+            return [Diagnostic("pyjsparser", int(match.group(1)), None, "syntax-error", match.group(2))]
+        return [Diagnostic("pyjsparser", None, None, "syntax-error", message)]
+    return []
+
+@lint_backend("node", ["javascript"], timeout=20, requires_command="node")
+def lint_javascript_node(code, timeout):
+    completed = _run_tool(["node", "--check", "{path}"], code, ".js", timeout)
+    if completed.returncode == 0:
+        return []
+    line_match = re.search(r":(\d+)\s*$", completed.stderr.split("\n")[0])
+    error_match = re.search(r"^(\w*Error): (.*)$", completed.stderr, re.MULTILINE)
+    if error_match is None:
+        raise LintToolError(completed.stderr.strip())
+    return [Diagnostic("node", int(line_match.group(1)) if line_match else None, None, error_match.group(1), error_match.group(2))]
+
+CSHARP_PROJECT = (
+    "<Project Sdk=\"Microsoft.NET.Sdk\">\n"
+    "  <PropertyGroup>\n"
+    "  <OutputType>Exe</OutputType>\n"
+    "  <TargetFramework>net6.0</TargetFramework>\n"
+    "  </PropertyGroup>\n"
+    "</Project>\n"
+)
+
+_scratch = threading.local()
+_scratch_numbers = itertools.count()
+_scratch_dirs = []
+_scratch_lock = threading.Lock()
+
+def _remove_scratch_projects():
+    with _scratch_lock:
+        for project_dir in _scratch_dirs:
+            shutil.rmtree(project_dir, ignore_errors=True)
+        _scratch_dirs.clear()
+
+def _remove_orphaned_scratch_projects(root):
+    """Delete scratch projects left behind by processes that are gone (killed before their atexit ran)."""
+    for name in os.listdir(root):
+        match = re.match(r"csharp_(\d+)_\d+$", name)
+        if match is None or int(match.group(1)) == os.getpid():
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        except OSError:
+            pass
+
+def get_csharp_scratch_project():
+    """Return this thread's persistent C# project directory.
+
+    Reusing the project keeps obj/ and the restored packages, so every build
+    after the first is an incremental build. The directories are deleted
+    when the process exits.
+    """
+    project_dir = getattr(_scratch, 'csharp_dir', None)
+    if project_dir is None or not os.path.isdir(project_dir):
+        root = get_config("lint_scratch_folder", "") or os.path.join(tempfile.gettempdir(), "coderevisor_lint")
+        os.makedirs(root, exist_ok=True)
+        with _scratch_lock:
+            if not _scratch_dirs:
+                _remove_orphaned_scratch_projects(root)
+                atexit.register(_remove_scratch_projects)
+            project_dir = os.path.join(root, f"csharp_{os.getpid()}_{next(_scratch_numbers)}")
+            _scratch_dirs.append(project_dir)
+        os.makedirs(project_dir, exist_ok=True)
+        with open(os.path.join(project_dir, "temp.csproj"), "w") as proj_file:
+            proj_file.write(CSHARP_PROJECT)
+        _scratch.csharp_dir = project_dir
+        _scratch.csharp_restored = False
+    return project_dir
+
+CSHARP_DIAGNOSTIC = re.compile(r"\((\d+),(\d+)\): (error|warning) (CS\d+): (.*?)(?: \[[^\]]*\])?$", re.MULTILINE)
+
+@lint_backend("dotnet", ["csharp"], timeout=120, requires_command="dotnet")
+def lint_csharp_dotnet(code, timeout):
+    project_dir = get_csharp_scratch_project()
+    with open(os.path.join(project_dir, "temp.cs"), "w") as code_file:
+        code_file.write(code)
+
+    command = ["dotnet", "build", "temp.csproj", "-nologo"]
+    if _scratch.csharp_restored:
+        command.append("--no-restore")
+    completed = subprocess.run(command, cwd=project_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+
+    diagnostics = [Diagnostic("dotnet", int(match.group(1)), int(match.group(2)), match.group(4), match.group(5).strip())
+                   for match in CSHARP_DIAGNOSTIC.finditer(completed.stdout) if match.group(3) == "error"]
+    if completed.returncode != 0 and not diagnostics:
+        raise LintToolError(completed.stdout.strip()[-2000:])
+    # Restore succeeded when the build got as far as compiling
+    _scratch.csharp_restored = True
+    return diagnostics
@@ -1,100 +1,93 @@
-import pyjsparser
-import ast
-import io
-import sys
-import subprocess
-import tempfile
-import os
-import re
-from lib.config_manager import get_config
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from lib.config_manager import get_config_int
+from lib.lint_backends import detect_language, format_diagnostics, get_backends, run_backends
 from lib.custom_logger import *
 
+class LintService:
+    """Runs lints on a bounded thread pool and remembers their results.
+
+    Results are cached by (language, tools, SHA-256 of the code), so a file that
+    did not change between rounds or retries is not linted again, and two
+    requests for the same code while it is being linted share one run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(get_config_int("lint_workers", 2), 1), thread_name_prefix="lint")
+            return self._executor
+
+    def lint(self, linter):
+        tools = tuple(backend.name for backend in get_backends(linter.language))
+        key = (linter.language, tools, hashlib.sha256(linter.code.encode('utf-8')).hexdigest())
+        executor = self._get_executor()
+        with self._lock:
+            errors = self._cache.get(key)
+            if errors is not None:
+                self._cache.move_to_end(key)
+                return list(errors)
+            future = self._pending.get(key)
+            if future is None:
+                future = executor.submit(self._run, key, linter)
+                self._pending[key] = future
+        return list(future.result())
+
+    def _run(self, key, linter):
+        try:
+            errors = linter.lint_uncached()
+            if linter.cacheable:
+                with self._lock:
+                    self._cache[key] = list(errors)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > get_config_int("lint_cache_size", 256):
+                        self._cache.popitem(last=False)
+            return errors
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+lint_service = LintService()
+
 class Linter:
+    """Lints code with every tool registered for its language (see lib.lint_backends).
+
+    lint() returns a list of Diagnostic tuples; format() renders them as the
+    compact list that goes into prompts.
+    """
+
     def __init__(self, code, language, logger):
         self.code = code
         self.language = language
         self.errors = []
         self.logger = logger
+        # Cleared when the result reflects a tooling failure rather than the code
+        self.cacheable = True
 
-    def lint(self):
-        if self.language == "python":
-            return self._lint_python()
-        elif self.language == "javascript":
-            return self._lint_javascript()
-        elif self.language == "csharp":
-            return self._lint_csharp()
-        else:
-            return "Unsupported language"
-
-    def _lint_python(self):
-        class LintOutput(io.StringIO):
-            def __init__(self):
-                super().__init__()
-
-        old_stdout = sys.stdout
-        lint_output = LintOutput()
-        sys.stdout = lint_output
-        try:
-            ast.parse(self.code)
-        except SyntaxError as e:
-            self.errors.append(f"Error at line {e.lineno}, offset {e.offset}: {e.msg}")
-        sys.stdout = old_stdout
-        self.logger.log(self.errors)
-        return self.errors
+    @classmethod
+    def for_file(cls, filename, code, logger, hint=""):
+        return cls(code, detect_language(filename, code, hint), logger)
 
-    def _lint_javascript(self):
-        try:
-            ast = pyjsparser.parse(self.code)
-            return []
-        except Exception as e:
-            error_message = str(e)
-            file_line_error = error_message.split("\n")[0].split(":")[1:]
-            self.errors.append(error_message)
-            self.logger.log(self.errors)
+    def lint(self):
+        if not get_backends(self.language):
+            self.errors = []
             return self.errors
+        self.errors = lint_service.lint(self)
+        return self.errors
 
-    def _lint_csharp(self):
-        try:
-            # Create a temporary directory
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Define the path to the temporary C# file
-                temp_file_path = os.path.join(temp_dir, "temp.cs")
-                # Define the path to the temporary project file
-                temp_project_file = os.path.join(temp_dir, "temp.csproj")
-
-                # Write code to the temporary file
-                with open(temp_file_path, "w") as file:
-                    file.write(self.code)
-
-                # Write minimal .csproj file
-                with open(temp_project_file, "w") as proj_file:
-                    proj_file.write("<Project Sdk=\"Microsoft.NET.Sdk\">\n")
-                    proj_file.write("  <PropertyGroup>\n")
-                    proj_file.write("  <OutputType>Exe</OutputType>\n")
-                    proj_file.write("  <TargetFramework>net6.0</TargetFramework>\n")
-                    proj_file.write("  </PropertyGroup>\n")
-                    proj_file.write("</Project>\n")
-
-                # Execute dotnet build within the temporary directory
-                compiler_output = ""
-                try:
-                    compiler_output = subprocess.check_output(["dotnet", "build", temp_project_file], cwd=temp_dir, stderr=subprocess.STDOUT, text=True)
-                except subprocess.CalledProcessError as e:
-                    # If the build fails, the compiler_output will be an instance of subprocess.CalledProcessError
-                    # In that case, we'll extract the error message from the error attribute
-                    compiler_output = e.output
+    def lint_uncached(self):
+        errors, self.cacheable = run_backends(self.language, self.code, self.logger)
+        if errors:
+            self.logger.log(f"Lint ({self.language}): {len(errors)} problem(s)\n{format_diagnostics(errors)}")
+        return errors
 
-                if compiler_output:
-                    match = re.search(r"(\([0-9]*,[0-9]*\): error CS[0-9]+\s*:.*?)\s*\[.*?\]", compiler_output)
-                    if match:
-                        error_message = match.group(1)    
-                    else:
-                        error_message = compiler_output
-                    self.errors.append(error_message)
-                self.logger.log(self.errors)
-                return self.errors
-        except Exception as e:
-            error_message = str(e)
-            self.errors.append(("", error_message))
-            self.logger.log(self.errors)
-            return self.errors
\ No newline at end of file
+    def format(self):
+        return format_diagnostics(self.errors)
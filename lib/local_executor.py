@@ -0,0 +1,74 @@
+import time
+
+from lib.config_manager import get_config, get_config_int, get_config_float
+from lib.custom_logger import CustomLogger
+from lib.host_client import HostRequestError
+from lib.model_registry import ModelLoadError, model_registry
+from lib import revise_code
+
+# The host_instances entry that runs revisions in this process
+LOCAL_HOST = "local"
+
+def _model_args():
+    return (get_config('model_url', ""), get_config('model_folder', ""), get_config('model', ""), get_config('n_ctx', ""))
+
+def health_status():
+    """What /health reports for this process's model; shared by the route and the local executor."""
+    model_filename = get_config('model', "")
+    return {
+        'status': 'ok',
+        'model': model_filename,
+        'model_loaded': model_registry.loaded(model_filename) is not None,
+        'busy': any(entry['busy'] for entry in model_registry.status()),
+        'slots': get_config_int("host_slots", 0) or None,
+        'weight': get_config_float("host_weight", 1.0),
+        'n_gpu_layers': get_config_int("n_gpu_layers", 36)
+    }
+
+class LocalExecutor:
+    """Runs revisions in this process with the shared warm model.
+
+    Has the same interface as HostClient, so a "local" entry in
+    host_instances is used like any other host, without the HTTP round
+    trip or serializing the prompt and the result.
+    """
+
+    def __init__(self):
+        self.host = LOCAL_HOST
+        self.logger = CustomLogger(get_config("log_folder", ""))
+
+    def revise(self, prompt, file_contents, on_token=None, seed=None):
+        try:
+            with model_registry.use(*_model_args()) as (llm, load_time):
+                start_time = time.time()
+                stream = revise_code.RevisionStream(file_contents, llm, prompt, self.logger, seed)
+                for text in stream:
+                    if on_token is not None:
+                        on_token(text)
+                inference_time = time.time() - start_time
+        except ModelLoadError as e:
+            raise HostRequestError(self.host, 503, str(e))
+        except (RuntimeError, MemoryError) as e:
+            # llama.cpp failed to evaluate or ran out of memory: another host may manage
+            raise HostRequestError(self.host, 500, str(e))
+        except ValueError as e:
+            # llama.cpp rejects prompts that do not fit the context; no host would accept it
+            raise HostRequestError(self.host, 400, str(e))
+
+        self.logger.log(f"Model load time: {load_time:.2f}s, inference time: {inference_time:.2f}s")
+        return stream.revision, dict(stream.stats, model_load_time=load_time, inference_time=inference_time)
+
+    def tokenize(self, texts):
+        llm = model_registry.loaded(get_config('model', ""))
+        if llm is None:
+            raise HostRequestError(self.host, 409, "Model not loaded")
+        return [len(llm.tokenize(text.encode('utf-8'), add_bos=False, special=True)) for text in texts], llm.n_ctx()
+
+    def health(self):
+        return health_status()
+
+    def resize_pool(self, slots):
+        pass
+
+    def close(self):
+        pass
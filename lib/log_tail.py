@@ -0,0 +1,87 @@
+import logging
+import os
+import re
+import time
+
+ENTRY_START = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d+ - [^-]+ - (\w+) - ', re.MULTILINE)
+
+def _filter_entries(text, min_level=None, job_id=None):
+    """Keep the log entries at or above min_level that mention job_id.
+
+    Lines that do not start with a timestamp (tracebacks, linter output)
+    belong to the entry before them.
+    """
+    starts = [match.start() for match in ENTRY_START.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+
+    threshold = logging.getLevelName(min_level.upper()) if min_level else None
+    job_pattern = re.compile(rf'\bjob {int(job_id)}\b', re.IGNORECASE) if job_id is not None else None
+
+    kept = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        entry = text[start:end]
+        if isinstance(threshold, int):
+            match = ENTRY_START.match(entry)
+            level = logging.getLevelName(match.group(1)) if match else logging.INFO
+            if not isinstance(level, int) or level < threshold:
+                continue
+        if job_pattern is not None and not job_pattern.search(entry):
+            continue
+        kept.append(entry)
+    return ''.join(kept)
+
+def read_log_tail(file_path, offset=None, max_bytes=65536, min_level=None, job_id=None):
+    """Read the complete lines written to file_path since offset.
+
+    With no offset the last max_bytes of the file are returned. At most
+    max_bytes are read per call; 'offset' in the result is where the next
+    call should continue, and 'reset' is set when the file shrank (a new
+    day's log) so the client should discard what it has shown.
+    """
+    result = {'text': '', 'offset': 0, 'reset': False, 'truncated': False}
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return result
+
+    if offset is None or offset < 0:
+        offset = max(size - max_bytes, 0)
+        skip_partial_line = offset > 0
+    elif offset > size:
+        offset = 0
+        skip_partial_line = False
+        result['reset'] = True
+    else:
+        skip_partial_line = False
+
+    with open(file_path, 'rb') as log_file:
+        log_file.seek(offset)
+        data = log_file.read(max_bytes)
+
+    if skip_partial_line and b'\n' in data:
+        newline = data.index(b'\n') + 1
+        offset += newline
+        data = data[newline:]
+
+    # Only hand out whole lines, unless a single line is longer than the cap
+    if not data.endswith(b'\n') and b'\n' in data:
+        data = data[:data.rindex(b'\n') + 1]
+
+    result['offset'] = offset + len(data)
+    result['truncated'] = result['offset'] < size
+    text = data.decode('utf-8', errors='replace')
+    result['text'] = _filter_entries(text, min_level, job_id) if min_level or job_id is not None else text
+    return result
+
+def wait_for_log_growth(file_path, offset, timeout, interval=0.25):
+    """Block until file_path grows past offset (or changes), for at most timeout seconds."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if os.path.getsize(file_path) != offset:
+                return True
+        except OSError:
+            pass
+        time.sleep(interval)
+    return False
@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import os
+import re
+import time
+from threading import Lock
+
+import requests
+
+from lib.config_manager import get_config, get_config_int, get_config_float
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+class DownloadError(Exception):
+    """A model download that failed for good (retries used up, or the checksum did not match)."""
+
+def _expected_sha256(response, checksum):
+    """The configured checksum, else the SHA-256 that Hugging Face sends for LFS files.
+
+    Hugging Face puts X-Linked-ETag on the /resolve/ redirect rather than on
+    the CDN response it leads to, so the redirects are searched too.
+    """
+    if checksum:
+        return checksum.strip().lower()
+    for hop in list(response.history) + [response]:
+        linked = hop.headers.get('X-Linked-ETag', '').strip('"').lower()
+        if _SHA256.match(linked):
+            return linked
+    return ""
+
+def _total_size(response, offset):
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and not content_range.endswith('/*'):
+        return int(content_range.rsplit('/', 1)[1])
+    length = response.headers.get('Content-Length')
+    return offset + int(length) if length is not None else None
+
+class ModelDownloader:
+    """Downloads model files to disk in chunks, resuming after dropped connections.
+
+    Data goes to <path>.part and is hashed on the way in. A retry or a
+    later download of the same file continues from the end of the .part
+    file with an HTTP Range request (and starts over if the server ignores
+    it). Once the file is complete and its SHA-256 matches, it is renamed
+    to <path>, so a model file on disk is never partial. Progress per file
+    is kept for /models/downloads.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._locks = {}
+        self._progress = {}
+
+    def _path_lock(self, path):
+        with self._lock:
+            return self._locks.setdefault(path, Lock())
+
+    def _update(self, path, **fields):
+        with self._lock:
+            self._progress.setdefault(path, {}).update(fields)
+
+    def download(self, url, path, checksum="", logger=None):
+        """Download url to path unless it is already there; returns path."""
+        with self._path_lock(path):
+            if os.path.isfile(path):
+                return path
+
+            part_path = path + ".part"
+            attempts = max(get_config_int("download_retries", 5), 0) + 1
+            self._update(path, model=os.path.basename(path), url=url, state='downloading', bytes=0, total=None,
+                         resumed_from=0, speed=0.0, error=None, started_at=time.time(), finished_at=None)
+            for attempt in range(1, attempts + 1):
+                try:
+                    self._fetch(url, path, part_path, checksum, logger)
+                    self._update(path, state='done', finished_at=time.time())
+                    return path
+                except DownloadError as e:
+                    self._update(path, state='failed', error=str(e), finished_at=time.time())
+                    raise
+                except (requests.RequestException, OSError) as e:
+                    if attempt == attempts:
+                        self._update(path, state='failed', error=str(e), finished_at=time.time())
+                        raise DownloadError(f"Download of {url} failed after {attempts} attempts: {str(e)}")
+                    delay = min(get_config_float("download_retry_wait", 2) * 2 ** (attempt - 1), 60)
+                    self._log(logger, f"Download of {os.path.basename(path)} interrupted ({str(e)}), resuming in {delay:.0f}s", logging.WARNING)
+                    self._update(path, state='retrying', error=str(e))
+                    time.sleep(delay)
+
+    def _fetch(self, url, path, part_path, checksum, logger):
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        timeout = get_config_float("download_timeout", 30)
+
+        with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 416 and offset:
+                # The .part file already holds everything (or more than the server has); check it from scratch
+                self._log(logger, f"Server has nothing past byte {offset} of {os.path.basename(path)}, verifying the partial file")
+                response = requests.head(url, allow_redirects=True, timeout=timeout)
+                total = int(response.headers.get('Content-Length') or offset)
+            else:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    self._log(logger, f"Server ignored the range request for {os.path.basename(path)}, starting over", logging.WARNING)
+                    offset = 0
+                total = _total_size(response, offset)
+
+            expected = _expected_sha256(response, checksum)
+            if not expected:
+                self._log(logger, f"No checksum for {os.path.basename(path)}; set model_sha256 to verify the download", logging.WARNING)
+            digest = hashlib.sha256()
+            if offset:
+                with open(part_path, 'rb') as part_file:
+                    for block in iter(lambda: part_file.read(1 << 20), b''):
+                        digest.update(block)
+                self._log(logger, f"Resuming download of {os.path.basename(path)} at byte {offset}")
+            else:
+                self._log(logger, f"Downloading {url} to {path}")
+            self._update(path, state='downloading', bytes=offset, total=total, resumed_from=offset)
+
+            received = offset
+            if response.status_code != 416:
+                started = time.time()
+                with open(part_path, 'ab' if offset else 'wb') as part_file:
+                    for block in response.iter_content(chunk_size=max(get_config_int("download_chunk_bytes", 1 << 20), 1024)):
+                        part_file.write(block)
+                        digest.update(block)
+                        received += len(block)
+                        self._update(path, bytes=received, speed=(received - offset) / max(time.time() - started, 1e-6))
+                    part_file.flush()
+                    os.fsync(part_file.fileno())
+
+        if total is not None and received < total:
+            raise requests.ConnectionError(f"connection closed at byte {received} of {total}")
+
+        self._update(path, state='verifying')
+        if expected and digest.hexdigest() != expected:
+            os.remove(part_path)
+            raise DownloadError(f"Checksum mismatch for {os.path.basename(path)}: expected {expected}, got {digest.hexdigest()}")
+        if total is not None and received > total:
+            os.remove(part_path)
+            raise DownloadError(f"Download of {os.path.basename(path)} is {received} bytes, more than the {total} the server reported")
+
+        os.replace(part_path, path)
+        self._log(logger, f"Downloaded {os.path.basename(path)} ({received} bytes{', checksum verified' if expected else ''})")
+
+    def _log(self, logger, message, level=logging.INFO):
+        if logger is not None:
+            logger.log(message, level=level)
+
+    def status(self):
+        with self._lock:
+            downloads = [dict(progress) for progress in self._progress.values()]
+        for progress in downloads:
+            progress['percent'] = 100.0 * progress['bytes'] / progress['total'] if progress.get('total') else None
+        return downloads
+
+model_downloader = ModelDownloader()
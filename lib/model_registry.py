@@ -0,0 +1,130 @@
+import gc
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from lib.app_utils import load_model, get_llama_params
+from lib.config_manager import get_config, get_config_int
+from lib.custom_logger import CustomLogger
+from lib.prompt_cache import PromptCache
+
+class ModelLoadError(RuntimeError):
+    """The model file could not be downloaded or loaded into llama.cpp."""
+
+class ModelRegistry:
+    """Keeps each configured model loaded between requests.
+
+    Every model file gets its own lock, so concurrent requests for the same
+    model are served one at a time while the weights stay resident.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._models = {}
+        self._registry_lock = Lock()
+
+    def _get_entry(self, model_filename):
+        with self._registry_lock:
+            entry = self._models.get(model_filename)
+            if entry is None:
+                entry = {
+                    'llm': None,
+                    'lock': Lock(),
+                    'params': None,
+                    'load_time': 0.0,
+                    'loaded_at': None,
+                    'requests': 0
+                }
+                self._models[model_filename] = entry
+            return entry
+
+    def _release(self, model_filename, entry):
+        if entry['llm'] is not None:
+            self.logger.log(f"Unloading model {model_filename}")
+            entry['llm'] = None
+            entry['params'] = None
+            entry['loaded_at'] = None
+            gc.collect()
+
+    @contextmanager
+    def use(self, model_url, model_folder, model_filename, max_context):
+        """Yield (llm, load_time) with exclusive access to a warm model.
+
+        load_time is 0 when the model was already loaded. A model whose
+        llama.cpp parameters no longer match the config is reloaded first.
+        """
+        entry = self._get_entry(model_filename)
+        with entry['lock']:
+            load_time = 0.0
+            params = get_llama_params(max_context)
+
+            if entry['llm'] is not None and entry['params'] != params:
+                self.logger.log(f"Configuration changed for {model_filename}, reloading")
+                self._release(model_filename, entry)
+
+            if entry['llm'] is None:
+                start_time = time.time()
+                llm = load_model(model_url, model_folder, model_filename, max_context, self.logger)
+                if llm is None:
+                    raise ModelLoadError(f"Model {model_filename} could not be loaded")
+                load_time = time.time() - start_time
+
+                cache_bytes = get_config_int("prompt_cache_bytes", 2 << 30)
+                if cache_bytes > 0:
+                    llm.set_cache(PromptCache(cache_bytes))
+
+                entry['llm'] = llm
+                entry['params'] = params
+                entry['load_time'] = load_time
+                entry['loaded_at'] = time.time()
+                self.logger.log(f"Loaded model {model_filename} in {load_time:.2f}s")
+
+            entry['requests'] += 1
+            yield entry['llm'], load_time
+
+    def loaded(self, model_filename):
+        """Return the model if it is already loaded, without loading it or waiting for its lock.
+
+        Only for calls that are safe next to a running generation, such as
+        tokenizing.
+        """
+        with self._registry_lock:
+            entry = self._models.get(model_filename)
+            return entry['llm'] if entry is not None else None
+
+    def unload(self, model_filename=None):
+        """Unload one model, or every model when no filename is given.
+
+        Waits for any in-flight request on the model to finish first.
+        """
+        with self._registry_lock:
+            names = [model_filename] if model_filename else list(self._models.keys())
+            entries = [(name, self._models[name]) for name in names if name in self._models]
+
+        for name, entry in entries:
+            with entry['lock']:
+                self._release(name, entry)
+
+    def retain(self, model_filename):
+        """Unload every model except the given one."""
+        with self._registry_lock:
+            others = [name for name in self._models.keys() if name != model_filename]
+
+        for name in others:
+            self.unload(name)
+
+    def status(self):
+        with self._registry_lock:
+            entries = list(self._models.items())
+
+        return [{
+            'model': name,
+            'loaded': entry['llm'] is not None,
+            'prompt_cache': entry['llm'].cache.stats() if entry['llm'] is not None and isinstance(entry['llm'].cache, PromptCache) else None,
+            'busy': entry['lock'].locked(),
+            'load_time': entry['load_time'],
+            'loaded_at': entry['loaded_at'],
+            'requests': entry['requests']
+        } for name, entry in entries]
+
+model_registry = ModelRegistry(CustomLogger(get_config("log_folder", "")))
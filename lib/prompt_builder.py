@@ -0,0 +1,194 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+from lib.chunker import split_code
+from lib.config_manager import get_config, get_config_int, get_config_float, get_config_bool
+from lib.host_client import HostRequestError, get_host_client
+from lib.lint_backends import deduplicate, format_diagnostics
+
+import requests
+
+SECTIONS = ('template', 'instruction', 'code', 'errors', 'build_error', 'prompt')
+
+def estimate_tokens(text):
+    """Rough token count for when no tokenizer is reachable; errs on the high side for code."""
+    return len(text.encode('utf-8')) // 3 + 1
+
+class TokenCounter:
+    """Counts tokens with a host's loaded model, caching counts by content hash.
+
+    Texts the host cannot count (model not loaded, host unreachable) are
+    estimated instead, and estimates are never cached.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._cache = OrderedDict()
+        self._n_ctx = {}
+
+    def count(self, host, texts):
+        """Return (counts, exact) for the texts; exact is False when any count is an estimate."""
+        model = get_config("model", "")
+        keys = [(model, hashlib.sha256(text.encode('utf-8')).hexdigest()) for text in texts]
+        counts = [None] * len(texts)
+        with self._lock:
+            for index, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    counts[index] = self._cache[key]
+
+        missing = [index for index, count in enumerate(counts) if count is None]
+        if not missing:
+            return counts, True
+
+        try:
+            host_counts, n_ctx = get_host_client(host).tokenize([texts[index] for index in missing])
+        except (HostRequestError, requests.RequestException, ValueError, KeyError):
+            for index in missing:
+                counts[index] = estimate_tokens(texts[index])
+            return counts, False
+
+        with self._lock:
+            self._n_ctx[host] = n_ctx
+            for index, count in zip(missing, host_counts):
+                counts[index] = count
+                self._cache[keys[index]] = count
+            while len(self._cache) > get_config_int("token_cache_size", 4096):
+                self._cache.popitem(last=False)
+        return counts, True
+
+    def n_ctx(self, host):
+        """The host's context size as last reported, else the configured n_ctx."""
+        with self._lock:
+            return self._n_ctx.get(host) or get_config_int("n_ctx", 32768)
+
+token_counter = TokenCounter()
+
+def render_prompt(code, instruction, errors, build_error, prompt, lines=None):
+    """The revision prompt; lines=(first, last, total) marks code that is one chunk of the file."""
+    if lines is None:
+        code_header = "Here is the current code:"
+    else:
+        code_header = f"Here are lines {lines[0]}-{lines[1]} of the {lines[2]}-line file. Revise only these lines and return them in full:"
+
+    if instruction != "" and build_error != "":
+        return f"<s>[INST]Here is the original instruction:\n{instruction}\n{code_header}\n```\n{code}\n```\nHere are the current compiler errors:\n{errors}\nHere is the latest build error when I try to run the code:\n{build_error}\n\n{prompt}\n\n[/INST]\n"
+    elif instruction != "":
+        return f"<s>[INST]Here is the original instruction:\n{instruction}\n{code_header}\n```\n{code}\n```\nHere are the current compiler errors:\n{errors}\n\n{prompt}\n\n[/INST]\n"
+    else:
+        return f"<s>[INST]{code_header}\n```\n{code}\n```\nHere are the current compiler errors:\n{errors}\n\n{prompt}\n\n[/INST]\n"
+
+class PromptPlan:
+    """What PromptBuilder decided: one (code, prompt) part per request, plus the token accounting."""
+
+    def __init__(self, parts, section_tokens, n_ctx, exact, endings=None):
+        self.parts = parts
+        self.section_tokens = section_tokens
+        self.n_ctx = n_ctx
+        self.exact = exact
+        # Trailing newlines cut off each chunk, put back by assemble()
+        self.endings = endings
+        self.chunked = endings is not None
+
+    def assemble(self, revisions):
+        """Join the revisions of the parts, in order, into the revised file."""
+        if not self.chunked:
+            return revisions[0]
+        return ''.join(revision.rstrip('\n') + ending for revision, ending in zip(revisions, self.endings))
+
+    @property
+    def prompt_tokens(self):
+        return sum(self.section_tokens.values())
+
+    def describe(self):
+        sections = ', '.join(f"{name} {self.section_tokens.get(name, 0)}" for name in SECTIONS)
+        mode = f"{len(self.parts)} chunks" if self.chunked else "whole file"
+        return (f"prompt tokens{'' if self.exact else ' (estimated)'}: {sections}; "
+                f"total {self.prompt_tokens} of {self.n_ctx}, {mode}")
+
+class PromptBuilder:
+    """Packs instruction, code, lint errors and build error into the host's context window.
+
+    The prompt must leave room for the revised code: as many tokens as the
+    generation may use, max_output_ratio times the code. When it would not,
+    the error list is cut down first, then the build error is cut to its
+    last lines. If the code alone is still too large, or is longer than
+    wrap_up_cutoff characters, the file is split along syntax boundaries
+    (see lib.chunker) into chunks that are revised one request each.
+    """
+
+    def __init__(self, host, logger):
+        self.host = host
+        self.logger = logger
+
+    def _count(self, texts):
+        counts, exact = token_counter.count(self.host, texts)
+        self._exact = self._exact and exact
+        return counts
+
+    def build(self, code, instruction, prompt, diagnostics, build_error="", language=""):
+        self._exact = True
+        diagnostics = deduplicate(diagnostics)
+        template, instruction_tokens, code_tokens, prompt_tokens = self._count(
+            [render_prompt("", "", "", "", ""), instruction, code, prompt])
+        n_ctx = token_counter.n_ctx(self.host)
+        sections = {'template': template, 'instruction': instruction_tokens, 'code': code_tokens, 'prompt': prompt_tokens}
+
+        # Room the revised code needs once it is generated
+        reserve = int(code_tokens * get_config_float("max_output_ratio", 1.7)) + get_config_int("prompt_token_margin", 256)
+        errors, build_error = self._fit_errors(diagnostics, build_error, sum(sections.values()) + reserve, n_ctx, sections)
+        fits = sum(sections.values()) + reserve <= n_ctx
+        large = get_config_bool("chunked_revision", True) and len(code) > get_config_int("wrap_up_cutoff", 35000)
+        if fits and not large:
+            parts = [(code, render_prompt(code, instruction, errors, build_error, prompt))]
+            return PromptPlan(parts, sections, n_ctx, self._exact)
+
+        parts, endings = self._chunk(code, instruction, prompt, diagnostics, build_error, n_ctx, sections, language)
+        if fits:
+            self.logger.log(f"Code is {len(code)} characters, over wrap_up_cutoff; revising it in {len(parts)} chunks")
+        else:
+            self.logger.log(f"Code needs about {sections['code']} tokens, more than fits in {n_ctx}; revising it in {len(parts)} chunks", level=logging.WARNING)
+        return PromptPlan(parts, sections, n_ctx, self._exact, endings)
+
+    def _fit_errors(self, diagnostics, build_error, used, n_ctx, sections):
+        """Return (errors, build_error) texts trimmed to fit next to `used` tokens, recording their counts."""
+        max_items = get_config_int("lint_max_diagnostics", 20)
+        build_lines = build_error.splitlines()
+        while True:
+            errors = format_diagnostics(diagnostics, max_items)
+            errors_tokens, build_tokens = self._count([errors, build_error])
+            if used + errors_tokens + build_tokens <= n_ctx:
+                break
+            if max_items > 1 and len(diagnostics) > 1:
+                max_items = max(min(max_items, len(diagnostics)) // 2, 1)
+            elif len(build_lines) > 1:
+                # The end of a build log is where the failure is reported
+                build_lines = build_lines[len(build_lines) // 2:]
+                build_error = '\n'.join(build_lines)
+            else:
+                break
+        sections['errors'] = errors_tokens
+        sections['build_error'] = build_tokens
+        return errors, build_error
+
+    def _chunk(self, code, instruction, prompt, diagnostics, build_error, n_ctx, sections, language):
+        """Split code into chunks that each fit with the rest of the prompt; returns (parts, endings)."""
+        fixed = sections['template'] + sections['instruction'] + sections['prompt'] + sections['errors'] + sections['build_error'] + 64
+        ratio = get_config_float("max_output_ratio", 1.7)
+        chunk_tokens = max(int((n_ctx - fixed - get_config_int("prompt_token_margin", 256)) / (1 + ratio)), 1)
+        tokens_per_char = sections['code'] / max(len(code), 1)
+        max_chars = max(min(int(chunk_tokens / max(tokens_per_char, 1e-6)), get_config_int("chunk_max_chars", 16000)), 1)
+
+        lines = code.splitlines(keepends=True)
+        parts = []
+        endings = []
+        for start, end in split_code(code, language, max_chars):
+            original = ''.join(lines[start:end])
+            chunk = original.rstrip('\n')
+            endings.append(original[len(chunk):])
+            chunk_diagnostics = [diagnostic for diagnostic in diagnostics if diagnostic.line and start < diagnostic.line <= end]
+            errors = format_diagnostics(chunk_diagnostics)
+            parts.append((chunk, render_prompt(chunk, instruction, errors, build_error, prompt, (start + 1, end, len(lines)))))
+        return parts, endings
@@ -0,0 +1,85 @@
+from llama_cpp import Llama, LlamaRAMCache
+
+class PromptCache(LlamaRAMCache):
+    """LRU llama.cpp state cache, bounded in bytes, that keeps hit statistics.
+
+    Llama looks the prompt up by its longest cached token prefix, so later
+    rounds of the same job only evaluate the part of the prompt that changed.
+    Every prompt starts with the same template text, so a state that shares
+    no more than min_prefix_tokens with the prompt is a miss, not a hit.
+    """
+
+    def __init__(self, capacity_bytes):
+        super().__init__(capacity_bytes=capacity_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.last_prefix_tokens = 0
+        self.min_prefix_tokens = 0
+
+    def __getitem__(self, key):
+        try:
+            state = super().__getitem__(key)
+            prefix_tokens = Llama.longest_token_prefix(state.input_ids.tolist(), key)
+            if prefix_tokens <= self.min_prefix_tokens:
+                raise KeyError(key)
+        except KeyError:
+            self.misses += 1
+            self.last_prefix_tokens = 0
+            raise
+        self.hits += 1
+        self.last_prefix_tokens = prefix_tokens
+        return state
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'entries': len(self.cache_state),
+            'size_bytes': self.cache_size,
+            'capacity_bytes': self.capacity_bytes
+        }
+
+class PrefixReuse:
+    """Measures how much of one prompt was served from already evaluated state."""
+
+    def __init__(self, llama_model, prompt):
+        self.llama_model = llama_model
+        self.cache = getattr(llama_model, 'cache', None)
+        self.prompt_tokens = llama_model.tokenize(prompt.encode('utf-8'), special=True)
+        # Llama reuses whatever prefix its current context already holds, cache or not
+        self.context_prefix_tokens = Llama.longest_token_prefix(llama_model._input_ids.tolist(), self.prompt_tokens)
+        self.hits_before = 0
+        if isinstance(self.cache, PromptCache):
+            self.hits_before = self.cache.hits
+            # The prompt's first line is template text (e.g. "<s>[INST]Here is the current code:") shared by every prompt
+            template = prompt[:prompt.find('\n') + 1]
+            self.cache.min_prefix_tokens = len(llama_model.tokenize(template.encode('utf-8'), special=True)) if template else 0
+
+    def finish(self, time_to_first_token, stopped_early):
+        cache_hit = False
+        cache_prefix_tokens = 0
+        if isinstance(self.cache, PromptCache):
+            cache_hit = self.cache.hits > self.hits_before
+            cache_prefix_tokens = self.cache.last_prefix_tokens if cache_hit else 0
+            if stopped_early:
+                # Llama only saves state when a stream runs to the end
+                self.cache[self.llama_model._input_ids.tolist()] = self.llama_model.save_state()
+
+        reused_tokens = min(max(cache_prefix_tokens, self.context_prefix_tokens), len(self.prompt_tokens))
+        evaluated_tokens = len(self.prompt_tokens) - reused_tokens
+        saved_time = 0.0
+        if time_to_first_token and evaluated_tokens > 0:
+            # Estimated from this prompt's own per-token evaluation rate
+            saved_time = reused_tokens * time_to_first_token / evaluated_tokens
+
+        return {
+            'prompt_tokens': len(self.prompt_tokens),
+            'reused_prompt_tokens': reused_tokens,
+            'prompt_cache_hit': cache_hit,
+            'saved_prompt_eval_time': saved_time
+        }
@@ -1,45 +1,167 @@
 import re
-from lib.config_manager import get_config
+from lib.config_manager import get_config, get_config_int, get_config_float, get_config_bool
 from lib.linter import Linter
 from lib.custom_logger import *
+from lib.prompt_cache import PromptCache, PrefixReuse
 import time
 
-def run(original_code, llama_model, prompt, logger):
+def get_length_limits(original_code):
+    """Return (min_length, max_length) in characters for a revision; max_length is None when uncapped."""
+    min_length = get_config_float("min_output_ratio", 0.5) * len(original_code)
+    max_length = None
+    if len(original_code) > get_config_int("max_ratio_min_length", 10000):
+        max_length = get_config_float("max_output_ratio", 1.7) * len(original_code)
+    return min_length, max_length
 
-    start_time = time.time() # Get the start time
+def get_max_tokens(original_code, llama_model, prompt=None):
+    """Size the generation budget from the input instead of always using the global max_tokens.
 
-    response = llama_model.create_completion(
-        prompt,
-        temperature=get_config("temperature",""),
-        top_p=get_config("top_p",""),
-        top_k=get_config("top_k",""),
-        repeat_penalty=get_config("repeat_penalty",""),
-        typical_p=get_config("typical_p",""),
-        max_tokens=get_config("max_tokens","")
-        )
+    With a prompt, the budget is also capped to the context the prompt leaves free.
+    """
+    max_tokens = get_config_int("max_tokens")
+    try:
+        original_tokens = len(llama_model.tokenize(original_code.encode('utf-8'), add_bos=False))
+    except Exception:
+        # Rough fallback for models without a tokenizer
+        original_tokens = len(original_code) // 3
+    budget = int(original_tokens * get_config_float("max_output_ratio", 1.7)) + get_config_int("max_tokens_slack", 1024)
+    if prompt is not None:
+        try:
+            budget = min(budget, llama_model.n_ctx() - len(llama_model.tokenize(prompt.encode('utf-8'), special=True)))
+        except Exception:
+            pass
+    return max(min(max_tokens, budget), 1)
+
+class RevisionStream:
+    """Streams a completion token by token.
+
+    Iterating yields the generated text pieces as they arrive. Generation
+    stops early once the closing fence of the code block is produced (when
+    extract_from_markdown is on) or once the output passes the maximum
+    allowed length. Once the stream is exhausted, `revision` holds the
+    checked revision and `stats` the timings.
+    """
+
+    def __init__(self, original_code, llama_model, prompt, logger, seed=None):
+        self.original_code = original_code
+        self.llama_model = llama_model
+        self.prompt = prompt
+        self.seed = seed
+        self.logger = logger
+        self.revision = None
+        self.stats = {}
+
+    def __iter__(self):
+
+        start_time = time.time() # Get the start time
+        first_token_time = None
+        token_count = 0
+        text = ''
+        stop_reason = 'completed'
+
+        extract_from_markdown = get_config_bool('extract_from_markdown')
+        _, max_length = get_length_limits(self.original_code)
+        max_tokens = get_max_tokens(self.original_code, self.llama_model, self.prompt)
+
+        # Positions used to follow the code fence without rescanning the whole text
+        fence_pos = None
+        code_start = None
+
+        prefix_reuse = None
+        if isinstance(getattr(self.llama_model, 'cache', None), PromptCache):
+            prefix_reuse = PrefixReuse(self.llama_model, self.prompt)
+
+        completion = self.llama_model.create_completion(
+            self.prompt,
+            temperature=get_config_float("temperature"),
+            top_p=get_config_float("top_p"),
+            top_k=get_config_int("top_k"),
+            repeat_penalty=get_config_float("repeat_penalty"),
+            typical_p=get_config_float("typical_p"),
+            max_tokens=max_tokens,
+            stream=True,
+            **({'seed': self.seed} if self.seed is not None else {})
+            )
+
+        try:
+            for chunk in completion:
+                piece = chunk['choices'][0]['text']
+                if first_token_time is None:
+                    first_token_time = time.time()
+                token_count += 1
+                scan_from = max(len(text) - 4, 0)
+                text += piece
+                yield piece
+
+                if extract_from_markdown:
+                    if fence_pos is None:
+                        found = text.find('```', scan_from)
+                        if found != -1:
+                            fence_pos = found
+                    if fence_pos is not None and code_start is None:
+                        newline = text.find('\n', fence_pos)
+                        if newline != -1:
+                            code_start = newline + 1
+                    if code_start is not None:
+                        if text.find('\n```', max(scan_from, code_start - 1)) != -1:
+                            stop_reason = 'closing_fence'
+                            break
+                    code_length = len(text) - code_start if code_start is not None else 0
+                else:
+                    code_length = len(text)
+
+                if max_length is not None and code_length > max_length:
+                    stop_reason = 'too_long'
+                    break
+        finally:
+            if hasattr(completion, 'close'):
+                completion.close()
+
+        end_time = time.time() # Get the end time
+        duration = end_time - start_time # Calculate the duration
+        generation_time = end_time - first_token_time if first_token_time else 0.0
+
+        self.stats = {
+            'duration': duration,
+            'time_to_first_token': (first_token_time - start_time) if first_token_time else None,
+            'tokens': token_count,
+            'tokens_per_second': token_count / generation_time if generation_time > 0 else 0.0,
+            'max_tokens': max_tokens,
+            'stop_reason': stop_reason
+        }
+
+        if prefix_reuse is not None:
+            self.stats.update(prefix_reuse.finish(self.stats['time_to_first_token'], stop_reason != 'completed'))
+            self.logger.log(f"Prompt cache {'hit' if self.stats['prompt_cache_hit'] else 'miss'}: reused {self.stats['reused_prompt_tokens']}/{self.stats['prompt_tokens']} prompt tokens, saved ~{self.stats['saved_prompt_eval_time']:.2f}s of prompt evaluation")
+
+        self.logger.log(f"Total duration in seconds: {duration:.2f}, time to first token: {self.stats['time_to_first_token']}, tokens/sec: {self.stats['tokens_per_second']:.2f}, stopped: {stop_reason} after {token_count}/{max_tokens} tokens")
+
+        if stop_reason == 'too_long':
+            self.logger.log(f"Generated code was too long", level=logging.WARNING)
+            self.revision = self.original_code
+        else:
+            self.revision = finalize_revision(self.original_code, text, self.logger)
+
+def finalize_revision(original_code, revised_code, logger):
+    """Extract the code from a completion and fall back to the original if its length is off."""
 
-    revised_code = response['choices'][0]['text']
-    
     # Check if extracting from Markdown is enabled in config
-    extract_from_markdown = get_config('extract_from_markdown', '')
+    extract_from_markdown = get_config_bool('extract_from_markdown')
     
     if extract_from_markdown:
         code_blocks = re.findall(r'```(?:\w+)?\n(.*?)\n```', revised_code, re.DOTALL)
         revised_code = '\n'.join(code_blocks) if code_blocks else revised_code
     
-    end_time = time.time() # Get the end time
-    duration = end_time - start_time # Calculate the duration
-
-    print(f"Total duration in seconds: {duration}")
-    
     logger.log(f"Original code length (not tokens): {len(original_code)}")
     logger.log(f"New code length (not tokens): {len(revised_code)}")
 
-    if len(revised_code) < .5 * len(original_code):
-        logger.log(f"Generated code was too short")
+    min_length, max_length = get_length_limits(original_code)
+
+    if len(revised_code) < min_length:
+        logger.log(f"Generated code was too short", level=logging.WARNING)
         return original_code
-    elif len(revised_code) > 1.7 * len(original_code) and len(original_code) > 10000:
-        logger.log(f"Generated code was too long")
+    elif max_length is not None and len(revised_code) > max_length:
+        logger.log(f"Generated code was too long", level=logging.WARNING)
         return original_code
     else:
         return revised_code
@@ -0,0 +1,40 @@
+import difflib
+import hashlib
+import json
+import zlib
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def compress_full(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+def decompress_full(data):
+    return zlib.decompress(data).decode('utf-8')
+
+def compress_delta(base_text, text):
+    """Encode text as line operations against base_text.
+
+    The delta is a JSON list where [start, end] copies base lines and a
+    string inserts new text, compressed with zlib.
+    """
+    base_lines = base_text.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    operations = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([i1, i2])
+        elif j2 > j1:
+            operations.append(''.join(lines[j1:j2]))
+    return zlib.compress(json.dumps(operations, separators=(',', ':')).encode('utf-8'), 6)
+
+def apply_delta(base_text, data):
+    base_lines = base_text.splitlines(keepends=True)
+    pieces = []
+    for operation in json.loads(zlib.decompress(data).decode('utf-8')):
+        if isinstance(operation, str):
+            pieces.append(operation)
+        else:
+            pieces.extend(base_lines[operation[0]:operation[1]])
+    return ''.join(pieces)
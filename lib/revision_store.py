@@ -0,0 +1,356 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from lib.config_manager import get_config_bool, get_config_int
+from lib.revision_blobs import content_hash, compress_full, decompress_full, compress_delta, apply_delta
+
+class RevisionRepository:
+    """Data access for the revisions table.
+
+    Connections are kept per thread (and per process, so forked workers
+    never share a handle) instead of being opened for every query. The
+    schema is migrated on construction using PRAGMA user_version.
+
+    Revision text lives in revision_blobs, compressed and keyed by its
+    SHA-256, so identical revisions are stored once. A revision is stored
+    as a delta against the file's previous revision when that is smaller,
+    with a full snapshot at least every snapshot_interval revisions.
+    """
+
+    def __init__(self, revisions_db, delta_enabled=True, snapshot_interval=10, content_cache_size=32):
+        self.revisions_db = revisions_db
+        self.delta_enabled = delta_enabled
+        self.snapshot_interval = max(int(snapshot_interval), 1)
+        self._local = threading.local()
+        self._content_cache = OrderedDict()
+        self._content_cache_size = content_cache_size
+        self._content_cache_lock = threading.Lock()
+        self.migrate()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.revisions_db, timeout=30)
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _migrations(self):
+        return [
+            # 1: indexes for per-file lookups and WAL journaling
+            [
+                "CREATE INDEX IF NOT EXISTS idx_revisions_user_file_id ON revisions (user_id, file_name, id)",
+                "CREATE INDEX IF NOT EXISTS idx_revisions_user_id ON revisions (user_id, id)",
+            ],
+            # 2: content-addressed, compressed revision bodies
+            [
+                '''CREATE TABLE IF NOT EXISTS revision_blobs (hash TEXT PRIMARY KEY, encoding TEXT NOT NULL, base_hash TEXT, depth INT NOT NULL DEFAULT 0, size INT NOT NULL, data BLOB NOT NULL)''',
+                "ALTER TABLE revisions ADD COLUMN content_hash TEXT",
+                "ALTER TABLE revisions ADD COLUMN size INT",
+                self._move_revisions_to_blobs,
+            ],
+            # 3: creation time for the revision listings
+            [
+                "ALTER TABLE revisions ADD COLUMN created_at REAL",
+            ],
+            # 4: reference lookups for pruning one blob chain
+            [
+                "CREATE INDEX IF NOT EXISTS idx_revisions_content_hash ON revisions (content_hash)",
+                "CREATE INDEX IF NOT EXISTS idx_revision_blobs_base_hash ON revision_blobs (base_hash)",
+            ],
+        ]
+
+    def _move_revisions_to_blobs(self, conn):
+        previous_hashes = {}
+        rows = conn.execute("SELECT id, user_id, file_name FROM revisions WHERE revision IS NOT NULL ORDER BY id").fetchall()
+        for revision_id, user_id, filename in rows:
+            text = conn.execute("SELECT revision FROM revisions WHERE id=?", (revision_id,)).fetchone()[0]
+            digest = self._store_content(conn, text, previous_hashes.get((user_id, filename)))
+            previous_hashes[(user_id, filename)] = digest
+            conn.execute("UPDATE revisions SET content_hash=?, size=?, revision=NULL WHERE id=?", (digest, len(text), revision_id))
+
+    def migrate(self):
+        conn = self.connection()
+        # Create table for revisions if it doesn't exist, with columns: id, file_name, revision, user_id
+        conn.execute('''CREATE TABLE IF NOT EXISTS revisions (id INTEGER PRIMARY KEY AUTOINCREMENT, file_name TEXT, revision TEXT, user_id INT, initial_instruction TEXT)''')
+        conn.execute("PRAGMA journal_mode = WAL")
+
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(self._migrations(), start=1):
+            if number <= version:
+                continue
+            # An explicit transaction, because sqlite3 would otherwise commit each
+            # ALTER TABLE on its own; SQLite rolls DDL back with everything else
+            conn.execute("BEGIN")
+            try:
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _cache_get(self, digest):
+        with self._content_cache_lock:
+            text = self._content_cache.get(digest)
+            if text is not None:
+                self._content_cache.move_to_end(digest)
+            return text
+
+    def _cache_put(self, digest, text):
+        with self._content_cache_lock:
+            self._content_cache[digest] = text
+            self._content_cache.move_to_end(digest)
+            while len(self._content_cache) > self._content_cache_size:
+                self._content_cache.popitem(last=False)
+
+    def _store_content(self, conn, text, base_hash=None):
+        """Store text in revision_blobs (once per distinct content) and return its hash."""
+        digest = content_hash(text)
+        if conn.execute("SELECT 1 FROM revision_blobs WHERE hash=?", (digest,)).fetchone():
+            return digest
+
+        encoding, data, depth, base = 'zlib', compress_full(text), 0, None
+        if self.delta_enabled and base_hash and base_hash != digest:
+            row = conn.execute("SELECT depth FROM revision_blobs WHERE hash=?", (base_hash,)).fetchone()
+            if row is not None and row[0] + 1 < self.snapshot_interval:
+                delta = compress_delta(self.load_content(base_hash, conn), text)
+                if len(delta) < len(data):
+                    encoding, data, depth, base = 'delta', delta, row[0] + 1, base_hash
+
+        # A concurrent save of the same text may have inserted it since the check above; either copy will do
+        conn.execute("INSERT OR IGNORE INTO revision_blobs (hash, encoding, base_hash, depth, size, data) VALUES (?, ?, ?, ?, ?, ?)",
+                     (digest, encoding, base, depth, len(text), data))
+        self._cache_put(digest, text)
+        return digest
+
+    def load_content(self, digest, conn=None):
+        """Rebuild a revision body from its snapshot and any deltas on top of it."""
+        conn = conn or self.connection()
+        chain = []
+        current = digest
+        while True:
+            text = self._cache_get(current)
+            if text is not None:
+                break
+            row = conn.execute("SELECT encoding, base_hash, data FROM revision_blobs WHERE hash=?", (current,)).fetchone()
+            if row is None:
+                raise KeyError(f"Revision content {current} is missing")
+            encoding, base_hash, data = row
+            if encoding == 'zlib':
+                text = decompress_full(data)
+                self._cache_put(current, text)
+                break
+            chain.append((current, data))
+            current = base_hash
+
+        for current, data in reversed(chain):
+            text = apply_delta(text, data)
+            self._cache_put(current, text)
+        return text
+
+    def _text(self, revision, digest):
+        # Rows written before the blob migration still carry their text inline
+        return revision if digest is None else self.load_content(digest)
+
+    def _latest_hash(self, conn, filename, user_id):
+        row = conn.execute("SELECT content_hash FROM revisions WHERE user_id=? AND file_name=? ORDER BY id DESC LIMIT 1",
+                           (int(user_id), filename)).fetchone()
+        return row[0] if row else None
+
+    def _prune_chain(self, conn, digest):
+        """Delete digest's blob and then its delta bases, stopping at the first one still needed.
+
+        A blob is needed while a revision points at it or another blob is a
+        delta on top of it; both checks are index lookups.
+        """
+        while digest:
+            if conn.execute("SELECT 1 FROM revisions WHERE content_hash=? LIMIT 1", (digest,)).fetchone():
+                return
+            if conn.execute("SELECT 1 FROM revision_blobs WHERE base_hash=? LIMIT 1", (digest,)).fetchone():
+                return
+            row = conn.execute("SELECT base_hash FROM revision_blobs WHERE hash=?", (digest,)).fetchone()
+            conn.execute("DELETE FROM revision_blobs WHERE hash=?", (digest,))
+            digest = row[0] if row else None
+
+    def latest(self, filename, user_id):
+        row = self.connection().execute(
+            "SELECT revision, content_hash, initial_instruction FROM revisions WHERE user_id=? AND file_name=? ORDER BY id DESC LIMIT 1",
+            (int(user_id), filename)).fetchone()
+        if row is None:
+            return None
+        return self._text(row[0], row[1]), row[2]
+
+    def save(self, filename, user_id, revision, initial_instruction):
+        conn = self.connection()
+        with conn:
+            digest = self._store_content(conn, revision, self._latest_hash(conn, filename, user_id))
+            cursor = conn.execute("INSERT INTO revisions (file_name, content_hash, size, user_id, initial_instruction, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                  (filename, digest, len(revision), int(user_id), initial_instruction, time.time()))
+        return cursor.lastrowid
+
+    def latest_per_file(self, user_id, max_rows):
+        # Walks the distinct file names on the covering index, then picks each
+        # file's newest rows through the same index, so only max_rows bodies
+        # per file are ever read from the table.
+        rows = self.connection().execute("""
+            SELECT r.id, r.revision, r.content_hash, r.file_name, r.initial_instruction
+            FROM (SELECT DISTINCT file_name FROM revisions WHERE user_id=?) files
+            JOIN revisions r ON r.id IN (
+                SELECT id FROM revisions
+                WHERE user_id=? AND file_name=files.file_name
+                ORDER BY id DESC LIMIT ?
+            )
+            ORDER BY r.file_name, r.id DESC
+            """, (int(user_id), int(user_id), max_rows)).fetchall()
+        return [(row[0], self._text(row[1], row[2]), row[3], row[4]) for row in rows]
+
+    def latest_summaries_per_file(self, user_id, max_rows, snippet_length=200, file_limit=-1, after_file=None):
+        """Like latest_per_file, but returns metadata dicts without revision bodies.
+
+        file_limit and after_file page through the files in name order.
+        """
+        rows = self.connection().execute(f"""
+            SELECT {self._summary_columns('r')}
+            FROM (SELECT DISTINCT file_name FROM revisions WHERE user_id=? AND file_name > ?
+                  ORDER BY file_name LIMIT ?) files
+            JOIN revisions r ON r.id IN (
+                SELECT id FROM revisions
+                WHERE user_id=? AND file_name=files.file_name
+                ORDER BY id DESC LIMIT ?
+            )
+            ORDER BY r.file_name, r.id DESC
+            """, (snippet_length, int(user_id), after_file or '', int(file_limit), int(user_id), max_rows)).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def instructions(self, revision_ids, user_id):
+        """Full initial instructions for the given revisions, by id."""
+        revision_ids = [int(revision_id) for revision_id in revision_ids]
+        if not revision_ids:
+            return {}
+        rows = self.connection().execute(
+            f"SELECT id, initial_instruction FROM revisions WHERE user_id=? AND id IN ({', '.join('?' for _ in revision_ids)})",
+            [int(user_id)] + revision_ids).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def page(self, user_id, limit, before_id=None, filename=None, snippet_length=200):
+        """Return (summaries, next_cursor) for revisions older than before_id, newest first.
+
+        next_cursor is the id to pass as before_id for the following page, or
+        None when this page is the last one.
+        """
+        conditions = ["user_id=?"]
+        params = [snippet_length, int(user_id)]
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(int(before_id))
+        if filename:
+            conditions.append("file_name=?")
+            params.append(filename)
+        params.append(int(limit) + 1)
+
+        rows = self.connection().execute(
+            f"SELECT {self._summary_columns()} FROM revisions WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT ?",
+            params).fetchall()
+        summaries = [self._summary(row) for row in rows[:limit]]
+        next_cursor = summaries[-1]['id'] if len(rows) > limit else None
+        return summaries, next_cursor
+
+    @staticmethod
+    def _summary_columns(alias=None):
+        prefix = f"{alias}." if alias else ""
+        return (f"{prefix}id, {prefix}file_name, COALESCE({prefix}size, LENGTH({prefix}revision)), {prefix}created_at, "
+                f"substr({prefix}initial_instruction, 1, ?), LENGTH({prefix}initial_instruction)")
+
+    @staticmethod
+    def _summary(row):
+        return {
+            'id': row[0],
+            'filename': row[1],
+            'size': row[2],
+            'created_at': row[3],
+            'instruction_snippet': row[4],
+            'instruction_truncated': (row[5] or 0) > len(row[4] or '')
+        }
+
+    def prior_id(self, user_id, filename, revision_id):
+        row = self.connection().execute(
+            "SELECT id FROM revisions WHERE user_id=? AND file_name=? AND id < ? ORDER BY id DESC LIMIT 1",
+            (int(user_id), filename, revision_id)).fetchone()
+        return row[0] if row else None
+
+    def get(self, filename, revision_id, user_id):
+        row = self.connection().execute(
+            "SELECT revision, content_hash, initial_instruction FROM revisions WHERE id=? AND file_name=? AND user_id=?",
+            (revision_id, filename, int(user_id))).fetchone()
+        if row is None:
+            return None
+        return self._text(row[0], row[1]), row[2]
+
+    def get_content_hash(self, filename, revision_id, user_id):
+        """Return the content hash of a revision, or None when it does not exist."""
+        row = self.connection().execute(
+            "SELECT revision, content_hash FROM revisions WHERE id=? AND file_name=? AND user_id=?",
+            (revision_id, filename, int(user_id))).fetchone()
+        if row is None:
+            return None
+        return row[1] or content_hash(row[0])
+
+    def get_by_id(self, revision_id, user_id):
+        """Return (filename, text, initial_instruction) for a revision, or None."""
+        row = self.connection().execute(
+            "SELECT file_name, revision, content_hash, initial_instruction FROM revisions WHERE id=? AND user_id=?",
+            (revision_id, int(user_id))).fetchone()
+        if row is None:
+            return None
+        return row[0], self._text(row[1], row[2]), row[3]
+
+    def update(self, filename, revision_id, user_id, new_content, new_instruction):
+        conn = self.connection()
+        with conn:
+            row = conn.execute("SELECT content_hash FROM revisions WHERE id=? AND file_name=? AND user_id=?",
+                               (revision_id, filename, int(user_id))).fetchone()
+            if row is None:
+                return
+            digest = self._store_content(conn, new_content, row[0])
+            conn.execute("UPDATE revisions SET revision=NULL, content_hash=?, size=?, initial_instruction=? WHERE id=? AND file_name=? AND user_id=?",
+                         (digest, len(new_content), new_instruction, revision_id, filename, int(user_id)))
+            if row[0] != digest:
+                self._prune_chain(conn, row[0])
+
+    def delete(self, filename, revision_id, user_id):
+        conn = self.connection()
+        with conn:
+            row = conn.execute("SELECT content_hash FROM revisions WHERE id=? AND file_name=? AND user_id=?",
+                               (revision_id, filename, int(user_id))).fetchone()
+            conn.execute("DELETE FROM revisions WHERE id=? AND file_name=? AND user_id=?", (revision_id, filename, int(user_id)))
+            if row is not None:
+                self._prune_chain(conn, row[0])
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+def get_revision_repository(revisions_db):
+    """Return the shared repository for a database path."""
+    with _repositories_lock:
+        repository = _repositories.get(revisions_db)
+        if repository is None:
+            repository = RevisionRepository(revisions_db,
+                                            delta_enabled=get_config_bool("revision_delta_enabled", True),
+                                            snapshot_interval=get_config_int("revision_snapshot_interval", 10))
+            _repositories[revisions_db] = repository
+        return repository
@@ -0,0 +1,121 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# Seconds; wide enough for both sub-second lint runs and half-hour generations
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STAGES = ('queue_wait', 'prompt_build_time', 'lint_time', 'model_load_time', 'prompt_eval_time',
+          'generation_time', 'request_time', 'db_write_time', 'total_time')
+
+class JobTimings:
+    """Collects the timings of one job round as a flat dict of job_metrics columns."""
+
+    def __init__(self, host):
+        self.values = {'host': host, 'started_at': time.time()}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the with block to the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.values[name] = self.values.get(name, 0.0) + time.perf_counter() - start
+
+    def add_revision_stats(self, stats):
+        """Derive the model-side columns from the stats a host returns with a revision."""
+        time_to_first_token = stats.get('time_to_first_token')
+        self.values['model_load_time'] = stats.get('model_load_time')
+        self.values['prompt_eval_time'] = time_to_first_token
+        self.values['generated_tokens'] = stats.get('tokens')
+        self.values['generation_tokens_per_second'] = stats.get('tokens_per_second')
+        if stats.get('duration') is not None and time_to_first_token is not None:
+            self.values['generation_time'] = stats['duration'] - time_to_first_token
+
+        if 'prompt_tokens' in stats:
+            self.values['prompt_tokens'] = stats['prompt_tokens']
+            self.values['reused_prompt_tokens'] = stats.get('reused_prompt_tokens', 0)
+            evaluated_tokens = stats['prompt_tokens'] - self.values['reused_prompt_tokens']
+            if time_to_first_token:
+                self.values['prompt_eval_tokens_per_second'] = evaluated_tokens / time_to_first_token
+
+    def finish(self, outcome):
+        self.values['outcome'] = outcome
+        self.values['total_time'] = time.perf_counter() - self._start
+        return self.values
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels.keys(), escaped)) + '}'
+
+class JobTelemetry:
+    """Process-wide job metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stages = {}
+        self._rounds = {}
+        self._tokens = {}
+
+    def record(self, timings):
+        host = timings.get('host') or 'unknown'
+        with self._lock:
+            key = (host, timings.get('outcome') or 'unknown')
+            self._rounds[key] = self._rounds.get(key, 0) + 1
+            for stage in STAGES:
+                if timings.get(stage) is not None:
+                    histogram = self._stages.setdefault((stage, host), Histogram(STAGE_BUCKETS))
+                    histogram.observe(timings[stage])
+            if timings.get('prompt_tokens') is not None:
+                evaluated_tokens = timings['prompt_tokens'] - (timings.get('reused_prompt_tokens') or 0)
+                self._tokens[('prompt_evaluated', host)] = self._tokens.get(('prompt_evaluated', host), 0) + evaluated_tokens
+            if timings.get('generated_tokens') is not None:
+                self._tokens[('generated', host)] = self._tokens.get(('generated', host), 0) + timings['generated_tokens']
+
+    def render(self, job_counts=None):
+        lines = []
+        with self._lock:
+            lines.append("# HELP coderevisor_job_stage_seconds Time spent per job round in each stage.")
+            lines.append("# TYPE coderevisor_job_stage_seconds histogram")
+            for (stage, host), histogram in sorted(self._stages.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"coderevisor_job_stage_seconds_bucket{_labels(stage=stage, host=host, le=bound)} {count}")
+                lines.append(f"coderevisor_job_stage_seconds_bucket{_labels(stage=stage, host=host, le='+Inf')} {histogram.count}")
+                lines.append(f"coderevisor_job_stage_seconds_sum{_labels(stage=stage, host=host)} {histogram.sum}")
+                lines.append(f"coderevisor_job_stage_seconds_count{_labels(stage=stage, host=host)} {histogram.count}")
+
+            lines.append("# HELP coderevisor_job_rounds_total Job rounds processed, by host and outcome.")
+            lines.append("# TYPE coderevisor_job_rounds_total counter")
+            for (host, outcome), count in sorted(self._rounds.items()):
+                lines.append(f"coderevisor_job_rounds_total{_labels(host=host, outcome=outcome)} {count}")
+
+            lines.append("# HELP coderevisor_tokens_total Prompt tokens evaluated and tokens generated.")
+            lines.append("# TYPE coderevisor_tokens_total counter")
+            for (kind, host), count in sorted(self._tokens.items()):
+                lines.append(f"coderevisor_tokens_total{_labels(kind=kind, host=host)} {count}")
+
+        if job_counts is not None:
+            lines.append("# HELP coderevisor_jobs Jobs in the queue, by status.")
+            lines.append("# TYPE coderevisor_jobs gauge")
+            for status, count in sorted(job_counts.items()):
+                lines.append(f"coderevisor_jobs{_labels(status=status)} {count}")
+
+        return '\n'.join(lines) + '\n'
+
+job_telemetry = JobTelemetry()
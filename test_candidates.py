@@ -0,0 +1,40 @@
+from lib.candidates import Candidate, candidate_seeds, pick_best, score_candidates
+from lib.config_manager import get_config
+from lib.custom_logger import CustomLogger
+
+logger = CustomLogger(get_config("log_folder", ""))
+
+ORIGINAL = "def add(a, b):\n    return a - b\n\nprint(add(1, 2))\n"
+
+def test_best_candidate_is_the_clean_revision():
+    candidates = score_candidates(ORIGINAL, [
+        Candidate(ORIGINAL, {'seed': 1}),
+        Candidate("def add(a, b)\n    return a + b\n\nprint(add(1, 2))\n", {'seed': 2}),
+        Candidate("def add(a, b):\n    return a + b\n\nprint(add(1, 2))\n", {'seed': 3}),
+    ], "python", logger)
+
+    unchanged, broken, fixed = candidates
+    assert unchanged.unchanged and not fixed.unchanged
+    assert len(broken.diagnostics) == 1 and fixed.diagnostics == []
+    assert fixed.score < broken.score < unchanged.score
+    assert pick_best(candidates) is fixed
+
+def test_smaller_change_wins_between_clean_revisions():
+    small = Candidate(ORIGINAL.replace("a - b", "a + b"), {})
+    rewrite = Candidate("def add(a, b):\n    total = a\n    total += b\n    return total\n\n\nprint(add(1, 2))\n", {})
+    score_candidates(ORIGINAL, [small, rewrite], "python", logger)
+
+    assert small.diff_size < rewrite.diff_size
+    assert pick_best([rewrite, small]) is small
+
+def test_ties_go_to_the_earliest():
+    first = Candidate(ORIGINAL.replace("a - b", "a + b"), {})
+    second = Candidate(ORIGINAL.replace("a - b", "a + b"), {})
+    score_candidates(ORIGINAL, [first, second], "python", logger)
+
+    assert pick_best([first, second]) is first
+
+def test_seeds_are_distinct():
+    seeds = candidate_seeds(8)
+    assert len(set(seeds)) == 8
+    assert all(0 < seed < 2 ** 31 for seed in seeds)
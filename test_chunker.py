@@ -0,0 +1,89 @@
+import textwrap
+
+import pytest
+
+from lib.chunker import chunk_parses, split_code
+from lib.config_manager import get_config
+from lib.custom_logger import CustomLogger
+from lib.linter import Linter
+from lib.prompt_builder import PromptPlan
+
+logger = CustomLogger(get_config("log_folder", ""))
+
+def chunk_texts(code, language, max_chars):
+    lines = code.splitlines(keepends=True)
+    chunks = split_code(code, language, max_chars)
+    # Chunks cover the file in order, without gaps or overlaps
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(lines)
+    assert all(previous[1] == current[0] for previous, current in zip(chunks, chunks[1:]))
+    return [''.join(lines[start:end]) for start, end in chunks]
+
+def test_python_splits_between_functions():
+    code = "import os\n\n" + "".join(f"def function_{index}():\n    return {index}\n\n\n" for index in range(6))
+    chunks = chunk_texts(code, "python", 80)
+
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        # Blank lines and comments in front of a function go with it
+        assert chunk.lstrip("\n").startswith("def function_")
+    assert all(chunk_parses(chunk, "python") for chunk in chunks)
+
+def test_python_splits_large_class_between_methods():
+    methods = "".join(f"    def method_{index}(self):\n        return {index}\n\n" for index in range(8))
+    code = f"class Big:\n    '''Docstring.'''\n\n{methods}"
+    chunks = chunk_texts(code, "python", 120)
+
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        assert chunk.lstrip("\n").startswith("    def method_")
+        assert chunk_parses(chunk, "python")
+
+def test_brace_language_splits_after_closed_blocks():
+    code = "".join(textwrap.dedent(f"""\
+        function f{index}() {{
+            return {index};
+        }}
+
+        """) for index in range(6))
+    chunks = chunk_texts(code, "javascript", 70)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith("function f")
+        assert chunk.count("{") == chunk.count("}")
+
+def test_oversized_unit_is_cut_between_lines():
+    code = "def huge():\n" + "".join(f"    value_{index} = {index}\n" for index in range(40))
+    chunks = chunk_texts(code, "python", 100)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 for chunk in chunks)
+
+def test_blank_lines_stay_with_previous_chunk():
+    code = "x = 1\n" + "\n" * 30 + "y = 2\n"
+    chunks = chunk_texts(code, "text", 10)
+
+    assert all(chunk.strip() for chunk in chunks)
+
+def test_chunk_parses():
+    assert chunk_parses("    def method(self):\n        return 1\n", "python") is True
+    assert chunk_parses("def broken(:\n", "python") is False
+    assert chunk_parses("function f() {", "javascript") is None
+
+def check_reassembly(parts, revisions):
+    job_manager = pytest.importorskip("lib.job_manager")
+    code = "\n\n".join(parts) + "\n"
+    plan = PromptPlan([(part, "") for part in parts], {}, 4096, True, ["\n\n"] * (len(parts) - 1) + ["\n"])
+    linter = Linter(code, "python", logger)
+    return code, job_manager.check_chunked_revision(1, plan, list(revisions), linter, linter.lint(), logger)
+
+def test_chunk_that_no_longer_parses_is_reverted():
+    code, revision = check_reassembly(["def f():\n    return 1", "def g():\n    return 2"],
+                                      ["def f(:\n    return 1", "def g():\n    return 3"])
+    assert revision == "def f():\n    return 1\n\ndef g():\n    return 3\n"
+
+def test_reassembly_worse_than_input_keeps_the_file():
+    # Each chunk parses on its own, but the joined file does not
+    code, revision = check_reassembly(["def f():\n    return 1", "def g():\n    return 2"],
+                                      ["def f():\n    return 1", "        return 3"])
+    assert revision == code
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from lib import config_manager
+
+@pytest.fixture
+def config_files(tmp_path, monkeypatch):
+    default_path = tmp_path / "config.json"
+    user_path = tmp_path / "user_config.json"
+    default_path.write_text(json.dumps({'port': "5031", 'n_ctx': 4096, 'ratio': 1.5}))
+    monkeypatch.setattr(config_manager, 'config_file', str(default_path))
+    monkeypatch.setattr(config_manager, 'user_config_file', str(user_path))
+    config_manager.invalidate_config()
+    yield default_path, user_path
+    config_manager.invalidate_config()
+
+def write_json(path, data):
+    path.write_text(json.dumps(data))
+    # Make the change visible even on filesystems with coarse timestamps
+    modified = os.path.getmtime(path) + 5
+    os.utime(path, (modified, modified))
+
+def test_values_are_coerced_and_user_config_created(config_files):
+    default_path, user_path = config_files
+    assert config_manager.get_config("port") == "5031"
+    assert config_manager.get_config_int("port") == 5031
+    assert config_manager.get_config("ratio") == 1.5
+    assert config_manager.get_config("n_ctx") == 4096
+    assert user_path.exists()
+
+def test_snapshot_is_cached_until_the_check_interval(config_files, monkeypatch):
+    default_path, user_path = config_files
+    monkeypatch.setattr(config_manager, 'config_check_interval', 3600)
+    first = config_manager.get_config_snapshot()
+    write_json(user_path, {'port': "6000", 'n_ctx': 4096, 'ratio': 1.5})
+
+    assert config_manager.get_config_snapshot() is first
+    assert config_manager.get_config("port") == "5031"
+
+def test_file_change_is_picked_up(config_files, monkeypatch):
+    default_path, user_path = config_files
+    monkeypatch.setattr(config_manager, 'config_check_interval', 0)
+    assert config_manager.get_config("port") == "5031"
+
+    write_json(user_path, {'port': "6000", 'n_ctx': 4096, 'ratio': 1.5})
+    assert config_manager.get_config("port") == "6000"
+
+    # New keys in the defaults are carried over into the user config
+    write_json(default_path, {'port': "5031", 'n_ctx': 4096, 'ratio': 1.5, 'added': True})
+    assert config_manager.get_config("added") is True
+    assert json.loads(user_path.read_text())['port'] == "6000"
+
+def test_missing_key_is_stored_with_its_default(config_files):
+    default_path, user_path = config_files
+    assert config_manager.get_config_int("host_slots", 4) == 4
+    assert json.loads(user_path.read_text())['host_slots'] == 4
+
+@pytest.mark.parametrize("value, expected", [
+    ("['a:1', 'b:2']", ['a:1', 'b:2']),
+    ("a:1, b:2", ['a:1', 'b:2']),
+    ("", []),
+    (['a:1'], ['a:1']),
+])
+def test_list_forms(config_files, value, expected):
+    config_manager.update_config('host_instances', value)
+    assert config_manager.get_config_list('host_instances') == expected
@@ -0,0 +1,62 @@
+import random
+
+from lib.diff_service import DiffService, diff_opcodes, iter_diff_html
+
+def apply_opcodes(old_lines, new_lines, opcodes):
+    """Rebuild new_lines from old_lines, checking that 'equal' runs really are equal."""
+    result = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            assert old_lines[i1:i2] == new_lines[j1:j2]
+            result.extend(old_lines[i1:i2])
+        else:
+            result.extend(new_lines[j1:j2])
+    return result
+
+def test_opcodes_rebuild_the_new_text():
+    generator = random.Random(12)
+    for _ in range(200):
+        old_lines = [generator.choice("abcdefg") for _ in range(generator.randint(0, 30))]
+        new_lines = list(old_lines)
+        for _ in range(generator.randint(0, 6)):
+            position = generator.randint(0, len(new_lines))
+            if new_lines and generator.random() < 0.5:
+                del new_lines[min(position, len(new_lines) - 1)]
+            else:
+                new_lines.insert(position, generator.choice("abcdefgxyz"))
+
+        opcodes = diff_opcodes(old_lines, new_lines)
+        assert apply_opcodes(old_lines, new_lines, opcodes) == new_lines
+        # Opcodes cover both sides without gaps
+        assert [opcode[1] for opcode in opcodes[1:]] == [opcode[2] for opcode in opcodes[:-1]]
+        assert [opcode[3] for opcode in opcodes[1:]] == [opcode[4] for opcode in opcodes[:-1]]
+
+def test_patience_anchors_on_unique_lines():
+    old_lines = ["def a():", "    return 1", "", "def b():", "    return 2"]
+    new_lines = ["def a():", "    return 1", "", "def c():", "    return 3", "", "def b():", "    return 2"]
+
+    # The new function is one insertion; the blank line and body of b() are not matched into it
+    assert diff_opcodes(old_lines, new_lines) == [('equal', 0, 3, 0, 3), ('insert', 3, 3, 3, 6), ('equal', 3, 5, 6, 8)]
+
+def test_html_escapes_and_collapses_unchanged_runs():
+    old_text = "\n".join(["<start>"] + [f"line {number}" for number in range(20)] + ["end"])
+    new_text = old_text.replace("end", "finish & done")
+
+    html = ''.join(iter_diff_html(old_text, new_text, context=2))
+    assert "&lt;start&gt;" in html
+    assert '-end' in html and '+finish &amp; done' in html
+    assert "<summary>19 unchanged lines</summary>" in html
+    assert list(iter_diff_html("same", "same")) == ["No differences found between the two revisions."]
+
+def test_service_caches_by_key():
+    service = DiffService()
+    loads = []
+
+    def load_texts():
+        loads.append(1)
+        return "a\nb\n", "a\nc\n"
+
+    first = ''.join(service.stream(('old', 'new', 3), load_texts))
+    second = ''.join(service.stream(('old', 'new', 3), load_texts))
+    assert first == second
+    assert len(loads) == 1
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+import requests
+
+from lib import host_registry as registry_module
+from lib.host_client import HostClient
+from lib.host_registry import HostRegistry
+
+CONFIG = {
+    'host_instances': ['a:1', 'b:1'],
+    'host_concurrency': 1,
+    'host_eject_failures': 2,
+    'host_eject_seconds': 30,
+    'host_eject_max_seconds': 600,
+}
+
+class FakeClient:
+    def __init__(self, health, pool_sizes):
+        self._health = health
+        self._pool_sizes = pool_sizes
+
+    def health(self):
+        if isinstance(self._health, Exception):
+            raise self._health
+        return self._health
+
+    def resize_pool(self, slots):
+        self._pool_sizes.append(slots)
+
+@pytest.fixture
+def health():
+    """What each host's /health returns (or raises)."""
+    return {}
+
+@pytest.fixture
+def pool_sizes():
+    """The slot counts the registry sized host connection pools for."""
+    return []
+
+@pytest.fixture
+def registry(monkeypatch, health, pool_sizes):
+    config = dict(CONFIG)
+    monkeypatch.setattr(registry_module, 'get_config_list', lambda key: config[key])
+    monkeypatch.setattr(registry_module, 'get_config_int', lambda key, default=0: config.get(key, default))
+    monkeypatch.setattr(registry_module, 'get_config_float', lambda key, default=0.0: config.get(key, default))
+    monkeypatch.setattr(registry_module, 'get_host_client', lambda host: FakeClient(health.get(host, {'status': 'ok'}), pool_sizes))
+    return HostRegistry()
+
+def test_least_loaded_host_with_free_slot(registry):
+    assert registry.try_acquire(100) == 'a:1'
+    assert registry.try_acquire(10) == 'b:1'
+    assert registry.try_acquire(10) is None
+
+    registry.release('a:1', 100)
+    assert registry.try_acquire(10, exclude={'a:1'}) is None
+    assert registry.try_acquire(10) == 'a:1'
+
+def test_slots_reported_by_health(registry, health, pool_sizes):
+    health['a:1'] = {'slots': 3, 'weight': 1.0, 'model_loaded': True}
+    health['b:1'] = {'slots': 1, 'weight': 1.0, 'model_loaded': False}
+    changes = []
+    registry.on_capacity_change(lambda: changes.append(registry.total_slots()))
+    registry.check_health()
+
+    assert changes == [4]
+    assert pool_sizes == [3, 1]
+    # Equal load per slot goes to the host that has the model loaded
+    assert [registry.try_acquire(10) for _ in range(5)] == ['a:1', 'a:1', 'a:1', 'b:1', None]
+
+def test_ejection_and_readmission(registry):
+    assert registry.try_acquire(10) == 'a:1'
+    registry.release('a:1', 10)
+    registry.report_failure('a:1', "boom")
+    assert registry.status()[0]['available']
+
+    registry.report_failure('a:1', "boom")
+    status = {state['host']: state for state in registry.status()}
+    assert not status['a:1']['available']
+    assert 29 < status['a:1']['ejected_for'] <= 30
+    assert registry.try_acquire(10) == 'b:1'
+    assert registry.try_acquire(10) is None
+
+    # Each further failure doubles the ejection
+    registry.report_failure('a:1', "boom")
+    assert 59 < registry.status()[0]['ejected_for'] <= 60
+
+    registry.check_health()
+    assert registry.status()[0]['available']
+    assert registry.status()[0]['failures'] == 0
+    assert registry.try_acquire(10) == 'a:1'
+
+def test_failed_health_check_counts_as_failure(registry, health):
+    health['b:1'] = requests.ConnectionError("refused")
+    registry.check_health()
+    registry.check_health()
+
+    status = {state['host']: state for state in registry.status()}
+    assert status['a:1']['available']
+    assert not status['b:1']['available']
+
+def test_acquire_times_out(registry):
+    registry.try_acquire(10)
+    registry.try_acquire(10)
+
+    started = time.time()
+    assert registry.acquire(10, timeout=0.2) is None
+    assert time.time() - started < 1.0
+    assert registry.wait_for_capacity(0.1) is False
+
+def test_host_client_pool_follows_slots():
+    client = HostClient('a:1')
+    initial_adapter = client.session.get_adapter('http://a:1')
+
+    client.resize_pool(4)
+    adapter = client.session.get_adapter('http://a:1')
+    assert adapter is not initial_adapter
+    assert adapter._pool_maxsize == 5
+
+    client.resize_pool(4)
+    assert client.session.get_adapter('http://a:1') is adapter
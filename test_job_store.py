@@ -0,0 +1,121 @@
+import base64
+import json
+import sqlite3
+import time
+from threading import Thread
+
+from lib.job_store import (claim_next_job, count_jobs, get_job, init_job_db, insert_job, list_jobs,
+                           requeue_started_jobs, set_job_status, touch_jobs)
+
+def make_db(tmp_path):
+    job_db = str(tmp_path / "jobs.db")
+    init_job_db(job_db)
+    return job_db
+
+def test_claim_takes_oldest_new_job(tmp_path):
+    job_db = make_db(tmp_path)
+    first = insert_job(job_db, "a.py", b"print(1)", 1, 2, "fix")
+    second = insert_job(job_db, "b.py", b"print(2)", 1, 1, "fix")
+
+    job = claim_next_job(job_db)
+    assert job['job_id'] == first
+    assert job['status'] == 'STARTED'
+    assert job['file_contents'] == b"print(1)"
+    assert job['claimed_at'] >= job['queued_at']
+    assert get_job(job_db, first)['status'] == 'STARTED'
+
+    assert claim_next_job(job_db)['job_id'] == second
+    assert claim_next_job(job_db) is None
+
+def test_concurrent_claims_never_share_a_job(tmp_path):
+    job_db = make_db(tmp_path)
+    for index in range(40):
+        insert_job(job_db, f"{index}.py", b"x", 1, 1, "")
+    claimed = []
+
+    def worker():
+        while True:
+            job = claim_next_job(job_db)
+            if job is None:
+                return
+            claimed.append(job['job_id'])
+
+    threads = [Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == list(range(1, 41))
+    assert count_jobs(job_db, ('STARTED',)) == 40
+
+def test_requeue_started_jobs(tmp_path):
+    job_db = make_db(tmp_path)
+    started = insert_job(job_db, "a.py", b"x", 1, 1, "")
+    finished = insert_job(job_db, "b.py", b"y", 1, 1, "")
+    claim_next_job(job_db)
+    set_job_status(job_db, finished, "FINISHED", rounds=0)
+
+    assert requeue_started_jobs(job_db) == 1
+    assert get_job(job_db, started)['status'] == 'NEW'
+    assert get_job(job_db, finished)['status'] == 'FINISHED'
+    # The payload survives the claim, so the job can run again
+    assert claim_next_job(job_db)['file_contents'] == b"x"
+
+def test_clearing_contents_keeps_metadata(tmp_path):
+    job_db = make_db(tmp_path)
+    job_id = insert_job(job_db, "a.py", b"x", 1, 3, "fix")
+    set_job_status(job_db, job_id, "STARTED", clear_file_contents=True)
+
+    assert list_jobs(job_db) == [{'job_id': job_id, 'filename': "a.py", 'status': 'STARTED', 'rounds': 3, 'prompt': None}]
+
+def test_imports_legacy_job_file(tmp_path):
+    legacy = tmp_path / "jobs.json"
+    legacy.write_text(json.dumps([{'job_id': 7, 'filename': "a.py", 'user_id': 1, 'rounds': 1, 'prompt': "fix",
+                                   'status': 'NEW', 'file_contents': base64.b64encode(b"print(1)").decode()}]))
+    job_db = str(tmp_path / "jobs.db")
+    init_job_db(job_db, str(legacy))
+
+    assert not legacy.exists()
+    assert (tmp_path / "jobs.json.migrated").exists()
+    assert claim_next_job(job_db)['file_contents'] == b"print(1)"
+
+def test_job_size_follows_the_latest_revision(tmp_path):
+    job_db = make_db(tmp_path)
+    job_id = insert_job(job_db, "a.py", b"print(1)", 1, 3, "fix")
+    assert claim_next_job(job_db)['file_size'] == 8
+
+    # Later rounds have no payload, so the size comes from the job row
+    set_job_status(job_db, job_id, "STARTED", clear_file_contents=True)
+    set_job_status(job_db, job_id, "NEW", rounds=2, file_size=500)
+    job = claim_next_job(job_db)
+    assert job['file_contents'] is None
+    assert job['file_size'] == 500
+
+def test_adds_file_size_to_an_old_job_table(tmp_path):
+    job_db = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(job_db)
+    conn.execute("CREATE TABLE jobs (job_id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL, user_id INT, rounds INT, prompt TEXT, status TEXT NOT NULL DEFAULT 'NEW', created_at REAL, updated_at REAL)")
+    conn.execute("INSERT INTO jobs (filename, status) VALUES ('a.py', 'NEW')")
+    conn.commit()
+    conn.close()
+
+    init_job_db(job_db)
+
+    assert claim_next_job(job_db)['file_size'] is None
+
+def test_requeue_leaves_live_jobs_of_other_processes(tmp_path):
+    job_db = make_db(tmp_path)
+    live = insert_job(job_db, "a.py", b"x", 1, 1, "")
+    stale = insert_job(job_db, "b.py", b"y", 1, 1, "")
+    mine = insert_job(job_db, "c.py", b"z", 1, 1, "")
+    claim_next_job(job_db, "other:1")
+    claim_next_job(job_db, "dead:2")
+    claim_next_job(job_db, "me:3")
+
+    time.sleep(0.05)
+    touch_jobs(job_db, "other:1")
+    assert requeue_started_jobs(job_db, stale_after=0.02, owner="me:3") == 2
+    assert get_job(job_db, live)['status'] == 'STARTED'
+    assert get_job(job_db, stale)['status'] == 'NEW'
+    assert get_job(job_db, mine)['status'] == 'NEW'
@@ -1,49 +1,96 @@
+import textwrap
+
+import pytest
+
+from lib import lint_backends
 from lib.linter import Linter
+from lib.lint_backends import Diagnostic, deduplicate, format_diagnostics, get_backends
 from lib.custom_logger import *
 from lib.config_manager import *
 
 logger = CustomLogger(get_config("log_folder",""))
 
-def test_linter():
-    python_code = """
+# The tools each test runs, so results do not depend on what else is installed
+PINNED_TOOLS = {'python': ['ast'], 'javascript': ['pyjsparser'], 'csharp': ['dotnet']}
+
+@pytest.fixture(autouse=True)
+def pinned_tools(monkeypatch):
+    get_config = lint_backends.get_config
+    monkeypatch.setattr(lint_backends, 'get_config',
+                        lambda key, default=None: PINNED_TOOLS if key == "lint_tools" else get_config(key, default))
+
+def lint(code, language):
+    return Linter(textwrap.dedent(code), language, logger).lint()
+
+def requires_backends(language):
+    available = any(backend.available() for backend in lint_backends._backends.values() if backend.name in PINNED_TOOLS[language])
+    return pytest.mark.skipif(not available, reason=f"no {language} lint tool installed")
+
+def test_python_clean():
+    diagnostics = lint("""
+    def hello():
+        print("Hello, world!")
+    """, "python")
+
+    assert diagnostics == []
+    assert format_diagnostics(diagnostics) == "None"
+
+def test_python_syntax_error():
+    diagnostics = lint("""
     def hello()
         print("Hello, world!")
-    """
+    """, "python")
 
-    javascript_code = """
+    assert [(diagnostic.tool, diagnostic.line, diagnostic.code) for diagnostic in diagnostics] == [('ast', 2, 'syntax-error')]
+    assert format_diagnostics(diagnostics).startswith("line 2:12 [syntax-error]")
+
+def test_javascript():
+    assert lint("""
+    function greet() {
+        console.log("Greetings!");
+    }
+    """, "javascript") == []
+
+    diagnostics = lint("""
     function greet() {
         console.log("Greetings!"
     }
-    """
+    """, "javascript")
+    assert [(diagnostic.tool, diagnostic.code) for diagnostic in diagnostics] == [('pyjsparser', 'syntax-error')]
 
-    csharp_code = """
+@requires_backends("csharp")
+def test_csharp():
+    program = """
     using System;
 
     class Program
     {
         static void Main(string[] args)
         {
-            test = 15;
-            string message = "Hello, world!";
-            Console.WriteLine(message);
+            %s
+            Console.WriteLine("Hello, world!");
         }
     }
     """
+    assert lint(program % "", "csharp") == []
 
-    python_linter = Linter(python_code, "python")
-    python_linted_code = python_linter.lint()
-    logger.log("Python Linted Code:")
-    logger.log(python_linted_code)
+    diagnostics = lint(program % "test = 15;", "csharp")
+    assert [(diagnostic.line, diagnostic.code) for diagnostic in diagnostics] == [(8, 'CS0103')]
+    assert "The name 'test' does not exist" in format_diagnostics(diagnostics)
 
-    javascript_linter = Linter(javascript_code, "javascript")
-    javascript_linted_code = javascript_linter.lint()
-    logger.log("\nJavaScript Linted Code:")
-    logger.log(javascript_linted_code)
+def test_format_caps_diagnostics():
+    diagnostics = lint("\n".join(f"x{index} = (" for index in range(3)), "python")
+    lines = format_diagnostics(diagnostics * 5, max_items=2).splitlines()
+    assert len(lines) == 3
+    assert lines[-1] == f"... and {len(diagnostics) * 5 - 2} more"
 
-    csharp_linter = Linter(csharp_code, "csharp")
-    csharp_linted_code = csharp_linter.lint()
-    logger.log("\nC# Linted Code:")
-    logger.log(csharp_linted_code)
+def test_one_syntax_error_per_file():
+    diagnostics = deduplicate([
+        Diagnostic('ast', 2, 12, 'syntax-error', "expected ':'"),
+        Diagnostic('pylint', 2, 11, 'E0001', "Parsing failed: 'expected ':' (code, line 2)'"),
+        Diagnostic('pyflakes', 3, 1, 'pyflakes', "undefined name 'x'"),
+        Diagnostic('pylint', 3, 0, 'E0602', "Undefined variable 'x'"),
+        Diagnostic('node', 5, None, 'SyntaxError', "Unexpected token"),
+    ])
 
-if __name__ == "__main__":
-    test_linter()
\ No newline at end of file
+    assert [(diagnostic.tool, diagnostic.line) for diagnostic in diagnostics] == [('ast', 2), ('pylint', 3), ('pyflakes', 3)]
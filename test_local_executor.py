@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("llama_cpp")
+
+from lib import local_executor
+from lib.host_client import HostRequestError
+from lib.model_registry import ModelLoadError
+
+def failing_model(error):
+    @contextmanager
+    def use(*args):
+        raise error
+        yield
+    return use
+
+@pytest.mark.parametrize("error, status_code", [
+    (ModelLoadError("Model x.gguf could not be loaded"), 503),
+    (RuntimeError("llama_decode returned -3"), 500),
+    (ValueError("Requested tokens (9000) exceed context window of 8192"), 400),
+])
+def test_backend_failures_become_host_errors(monkeypatch, error, status_code):
+    monkeypatch.setattr(local_executor.model_registry, 'use', failing_model(error))
+
+    with pytest.raises(HostRequestError) as excinfo:
+        local_executor.LocalExecutor().revise("fix", "x = 1")
+    assert excinfo.value.status_code == status_code
+
+def test_other_errors_are_not_host_errors(monkeypatch):
+    monkeypatch.setattr(local_executor.model_registry, 'use', failing_model(KeyError('stats')))
+
+    with pytest.raises(KeyError):
+        local_executor.LocalExecutor().revise("fix", "x = 1")
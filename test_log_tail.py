@@ -0,0 +1,64 @@
+from lib.log_tail import read_log_tail
+
+def entry(level, message, second=0):
+    return f"2026-01-01 10:00:{second:02d},000 - CodeRevisorUI - {level} - {message}\n"
+
+def test_follows_the_file_by_offset(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_text(entry("INFO", "first"))
+
+    result = read_log_tail(str(path))
+    assert result['text'] == entry("INFO", "first")
+    assert result['offset'] == path.stat().st_size
+
+    with open(path, 'a') as log_file:
+        log_file.write(entry("INFO", "second") + "partial line without newline")
+    result = read_log_tail(str(path), result['offset'])
+    # The unfinished line is left for the next call
+    assert result['text'] == entry("INFO", "second")
+
+    with open(path, 'a') as log_file:
+        log_file.write("\n")
+    assert read_log_tail(str(path), result['offset'])['text'] == "partial line without newline\n"
+
+def test_tail_starts_on_a_whole_line(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_text("".join(entry("INFO", f"message {index}") for index in range(100)))
+
+    result = read_log_tail(str(path), None, max_bytes=200)
+    assert result['text'].startswith("2026-01-01")
+    assert result['text'].endswith("message 99\n")
+    assert len(result['text']) <= 200
+
+def test_capped_reads_continue_where_they_stopped(tmp_path):
+    path = tmp_path / "log.txt"
+    content = "".join(entry("INFO", f"message {index}") for index in range(50))
+    path.write_text(content)
+
+    text, offset = "", 0
+    while True:
+        result = read_log_tail(str(path), offset, max_bytes=300)
+        text += result['text']
+        offset = result['offset']
+        if not result['truncated']:
+            break
+    assert text == content
+
+def test_shrunk_file_resets(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_text(entry("INFO", "new day"))
+
+    result = read_log_tail(str(path), 10000)
+    assert result['reset']
+    assert result['text'] == entry("INFO", "new day")
+
+def test_filters_by_level_and_job(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_text(entry("INFO", "Job 1 started") + entry("ERROR", "Job 1 failed") + "Traceback line\n" +
+                    entry("ERROR", "Job 12 failed") + entry("WARNING", "job 1 retrying"))
+
+    assert read_log_tail(str(path), 0, min_level="error", job_id=1)['text'] == entry("ERROR", "Job 1 failed") + "Traceback line\n"
+    assert read_log_tail(str(path), 0, min_level="warning")['text'].count("\n") == 4
+
+def test_missing_file(tmp_path):
+    assert read_log_tail(str(tmp_path / "missing.txt")) == {'text': '', 'offset': 0, 'reset': False, 'truncated': False}
@@ -0,0 +1,140 @@
+import hashlib
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+from lib import model_downloader as downloader_module
+from lib.model_downloader import DownloadError, ModelDownloader
+
+PAYLOAD = os.urandom(300000)
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+class ModelHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD with Range support; drop_at cuts the first full response short."""
+    drop_at = None
+    ranges = []
+    linked_etag = SHA256
+
+    def do_GET(self):
+        if self.path.startswith('/resolve/'):
+            # Like Hugging Face: the checksum is only on the redirect to the CDN
+            self.send_response(302)
+            self.send_header('Location', '/cdn/model.gguf')
+            self.send_header('X-Linked-ETag', f'"{ModelHandler.linked_etag}"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        ModelHandler.ranges.append(range_header)
+        if range_header:
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(PAYLOAD)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(PAYLOAD) - start))
+        self.end_headers()
+
+        body = PAYLOAD[start:]
+        if ModelHandler.drop_at is not None:
+            body, ModelHandler.drop_at = body[:ModelHandler.drop_at], None
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    ModelHandler.drop_at = None
+    ModelHandler.ranges = []
+    ModelHandler.linked_etag = SHA256
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ModelHandler)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/model.gguf"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(downloader_module.time, 'sleep', lambda seconds: None)
+
+def test_download_verifies_and_renames(server, tmp_path):
+    path = str(tmp_path / "model.gguf")
+    downloader = ModelDownloader()
+    downloader.download(server, path, SHA256)
+
+    with open(path, 'rb') as model_file:
+        assert model_file.read() == PAYLOAD
+    assert not os.path.exists(path + ".part")
+    assert downloader.status()[0]['state'] == 'done'
+    assert downloader.status()[0]['percent'] == 100.0
+
+def test_download_resumes_partial_file(server, tmp_path):
+    path = str(tmp_path / "model.gguf")
+    with open(path + ".part", 'wb') as part_file:
+        part_file.write(PAYLOAD[:120000])
+
+    ModelDownloader().download(server, path, SHA256)
+
+    assert ModelHandler.ranges == ["bytes=120000-"]
+    with open(path, 'rb') as model_file:
+        assert model_file.read() == PAYLOAD
+
+def test_dropped_connection_is_resumed(server, tmp_path, monkeypatch):
+    path = str(tmp_path / "model.gguf")
+    ModelHandler.drop_at = 50000
+    # Small reads, so the bytes before the drop reach the .part file
+    get_config_int = downloader_module.get_config_int
+    monkeypatch.setattr(downloader_module, 'get_config_int',
+                        lambda key, default=0: 10000 if key == "download_chunk_bytes" else get_config_int(key, default))
+
+    ModelDownloader().download(server, path, SHA256)
+
+    assert ModelHandler.ranges == [None, "bytes=50000-"]
+    with open(path, 'rb') as model_file:
+        assert model_file.read() == PAYLOAD
+
+def test_complete_partial_file_is_verified(server, tmp_path):
+    path = str(tmp_path / "model.gguf")
+    with open(path + ".part", 'wb') as part_file:
+        part_file.write(PAYLOAD)
+
+    ModelDownloader().download(server, path, SHA256)
+
+    assert os.path.isfile(path)
+    assert not os.path.exists(path + ".part")
+
+def test_checksum_mismatch_leaves_no_model(server, tmp_path):
+    path = str(tmp_path / "model.gguf")
+    downloader = ModelDownloader()
+
+    with pytest.raises(DownloadError):
+        downloader.download(server, path, "0" * 64)
+
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".part")
+    assert downloader.status()[0]['state'] == 'failed'
+
+def test_checksum_from_redirect_header(server, tmp_path):
+    resolve_url = server.replace('/model.gguf', '/resolve/model.gguf')
+    ModelDownloader().download(resolve_url, str(tmp_path / "model.gguf"))
+    assert os.path.isfile(tmp_path / "model.gguf")
+
+    ModelHandler.linked_etag = "0" * 64
+    with pytest.raises(DownloadError):
+        ModelDownloader().download(resolve_url, str(tmp_path / "other.gguf"))
+    assert not os.path.exists(tmp_path / "other.gguf")
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("llama_cpp")
+
+from lib.prompt_cache import PromptCache
+
+class TokenList(list):
+    def tolist(self):
+        return list(self)
+
+class State:
+    def __init__(self, tokens):
+        self.input_ids = TokenList(tokens)
+        self.llama_state_size = len(tokens)
+
+def tokens(text):
+    return [ord(char) for char in text]
+
+def test_template_prefix_alone_is_not_a_hit():
+    cache = PromptCache(1 << 20)
+    cache.min_prefix_tokens = len("<s>[INST]Here is the current code:\n")
+    cache[tokens("<s>[INST]Here is the current code:\nx = 1\n")] = State(tokens("<s>[INST]Here is the current code:\nx = 1\n"))
+
+    with pytest.raises(KeyError):
+        cache[tokens("<s>[INST]Here is the current code:\ny = 2\n")]
+    assert (cache.hits, cache.misses, cache.last_prefix_tokens) == (0, 1, 0)
+
+    cache[tokens("<s>[INST]Here is the current code:\nx = 1\nz = 3\n")]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.last_prefix_tokens == len("<s>[INST]Here is the current code:\nx = 1\n")
@@ -0,0 +1,152 @@
+import sqlite3
+from threading import Barrier, Thread
+
+import pytest
+
+from lib.revision_store import RevisionRepository
+
+def test_concurrent_saves_of_same_text(tmp_path):
+    repository = RevisionRepository(str(tmp_path / "revisions.db"))
+    text = "print('same file')\n" * 50
+    errors = []
+
+    for trial in range(200):
+        barrier = Barrier(4)
+
+        def save(index):
+            try:
+                barrier.wait()
+                repository.save(f"file{trial}.py", index, text + str(trial), "")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=save, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    assert repository.connection().execute("SELECT COUNT(*) FROM revision_blobs").fetchone()[0] == 200
+
+def _versions(count):
+    lines = [f"line {number}\n" for number in range(200)]
+    versions = []
+    for index in range(count):
+        lines[index * 3] = f"changed in revision {index}\n"
+        versions.append(''.join(lines))
+    return versions
+
+def _blob(repository, revision_id):
+    return repository.connection().execute(
+        "SELECT b.encoding, b.depth FROM revisions r JOIN revision_blobs b ON b.hash = r.content_hash WHERE r.id=?",
+        (revision_id,)).fetchone()
+
+def test_deltas_round_trip_with_snapshot_interval(tmp_path):
+    path = str(tmp_path / "revisions.db")
+    repository = RevisionRepository(path, snapshot_interval=3)
+    versions = _versions(7)
+    ids = [repository.save("app.py", 1, text, "") for text in versions]
+
+    assert [_blob(repository, revision_id) for revision_id in ids] == [
+        ('zlib', 0), ('delta', 1), ('delta', 2), ('zlib', 0), ('delta', 1), ('delta', 2), ('zlib', 0)]
+
+    # A fresh repository has nothing cached, so every chain is rebuilt from the database
+    reopened = RevisionRepository(path, snapshot_interval=3)
+    for revision_id, text in zip(ids, versions):
+        assert reopened.get("app.py", revision_id, 1) == (text, "")
+    assert reopened.latest("app.py", 1) == (versions[-1], "")
+
+def test_migrates_inline_revisions(tmp_path):
+    path = str(tmp_path / "revisions.db")
+    versions = _versions(4)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE revisions (id INTEGER PRIMARY KEY AUTOINCREMENT, file_name TEXT, revision TEXT, user_id INT, initial_instruction TEXT)")
+    conn.executemany("INSERT INTO revisions (file_name, revision, user_id, initial_instruction) VALUES (?, ?, ?, ?)",
+                     [("app.py", text, 1, "fix it") for text in versions] + [("other.py", "x = 1\n", 1, "")])
+    conn.commit()
+    conn.close()
+
+    repository = RevisionRepository(path)
+    conn = repository.connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 4
+    assert conn.execute("SELECT COUNT(*) FROM revisions WHERE revision IS NOT NULL OR content_hash IS NULL").fetchone()[0] == 0
+    assert [_blob(repository, revision_id)[0] for revision_id in (1, 2, 3, 4)] == ['zlib', 'delta', 'delta', 'delta']
+    for revision_id, text in enumerate(versions, start=1):
+        assert repository.get("app.py", revision_id, 1) == (text, "fix it")
+    assert repository.latest("other.py", 1) == ("x = 1\n", "")
+
+def test_prune_after_delete_keeps_delta_bases(tmp_path):
+    repository = RevisionRepository(str(tmp_path / "revisions.db"))
+    versions = _versions(3)
+    ids = [repository.save("app.py", 1, text, "") for text in versions]
+    conn = repository.connection()
+
+    # The first revision is the base of the others' deltas, so its blob stays
+    repository.delete("app.py", ids[0], 1)
+    assert conn.execute("SELECT COUNT(*) FROM revision_blobs").fetchone()[0] == 3
+    assert RevisionRepository(repository.revisions_db).get("app.py", ids[2], 1) == (versions[2], "")
+
+    repository.delete("app.py", ids[2], 1)
+    assert conn.execute("SELECT COUNT(*) FROM revision_blobs").fetchone()[0] == 2
+
+    repository.delete("app.py", ids[1], 1)
+    assert conn.execute("SELECT COUNT(*) FROM revision_blobs").fetchone()[0] == 0
+
+def test_instructions_are_returned_in_full(tmp_path):
+    repository = RevisionRepository(str(tmp_path / "revisions.db"))
+    instruction = "Revise this code. " * 50
+    first = repository.save("app.py", 1, "x = 1\n", instruction)
+    other_user = repository.save("app.py", 2, "x = 2\n", "theirs")
+
+    summary = repository.latest_summaries_per_file(1, 1)[0]
+    assert summary['instruction_truncated']
+    assert repository.instructions([first, other_user], 1) == {first: instruction}
+    assert repository.instructions([], 1) == {}
+
+def test_update_prunes_replaced_content(tmp_path):
+    repository = RevisionRepository(str(tmp_path / "revisions.db"))
+    first = repository.save("app.py", 1, "x = 1\n", "")
+    repository.save("other.py", 1, "x = 1\n", "")
+    repository.update("app.py", first, 1, "x = 2\n", "")
+    conn = repository.connection()
+
+    # other.py still points at the old text, so it stays until that row changes too
+    assert conn.execute("SELECT COUNT(*) FROM revision_blobs").fetchone()[0] == 2
+    repository.update("other.py", first + 1, 1, "x = 3\n", "")
+    assert conn.execute("SELECT COUNT(*) FROM revision_blobs").fetchone()[0] == 2
+    assert repository.get("app.py", first, 1) == ("x = 2\n", "")
+
+def test_summaries_page_through_files(tmp_path):
+    repository = RevisionRepository(str(tmp_path / "revisions.db"))
+    for filename in ("c.py", "a.py", "b.py", "a.py"):
+        repository.save(filename, 1, f"# {filename}\n", "")
+
+    first_page = repository.latest_summaries_per_file(1, 5, file_limit=2)
+    assert [(summary['filename'], summary['id']) for summary in first_page] == [("a.py", 4), ("a.py", 2), ("b.py", 3)]
+    second_page = repository.latest_summaries_per_file(1, 5, file_limit=2, after_file="b.py")
+    assert [summary['filename'] for summary in second_page] == ["c.py"]
+
+def test_failed_migration_rolls_back(tmp_path, monkeypatch):
+    path = str(tmp_path / "revisions.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE revisions (id INTEGER PRIMARY KEY AUTOINCREMENT, file_name TEXT, revision TEXT, user_id INT, initial_instruction TEXT)")
+    conn.execute("INSERT INTO revisions (file_name, revision, user_id, initial_instruction) VALUES ('app.py', 'x = 1\n', 1, '')")
+    conn.commit()
+    conn.close()
+
+    def fail(self, conn):
+        raise RuntimeError("migration failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(RevisionRepository, '_move_revisions_to_blobs', fail)
+        with pytest.raises(RuntimeError):
+            RevisionRepository(path)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert 'content_hash' not in [row[1] for row in conn.execute("PRAGMA table_info(revisions)")]
+    conn.close()
+
+    # The next start runs the whole migration again
+    assert RevisionRepository(path).latest("app.py", 1) == ("x = 1\n", "")